@@ -1,8 +1,9 @@
 // ./src/api/api.js
 
 // Firebase
-import { functions } from '../common/firebaseConfig';
+import { db, functions } from '../common/firebaseConfig';
 import { httpsCallable } from "firebase/functions";
+import { doc, onSnapshot } from "firebase/firestore";
 
 // Map function names to their endpoints
 const endpoints = {
@@ -14,10 +15,49 @@ const endpoints = {
   evidence: "evidence",
   deleteFileVectors: "delete-file-vectors",
   docassist: "docassist",
+  batch: "batch",
 }
 
+// Calls onUpdate with the job document on every change. Returns the unsubscribe function.
+export const watchJob = (jobId, onUpdate) => {
+  return onSnapshot(doc(db, "jobs", jobId), (snapshot) => {
+    if (snapshot.exists()) {
+      onUpdate(snapshot.data());
+    }
+  });
+};
+
+// Resolves with the job document once the job succeeded or failed, or with a
+// failed job once timeout milliseconds passed without either
+const waitForJob = (jobId, timeout, onProgress) => {
+  return new Promise((resolve) => {
+    let unsubscribe = null;
+    const finish = (job) => {
+      clearTimeout(timer);
+      if (unsubscribe) {
+        unsubscribe();
+      }
+      resolve(job);
+    };
+    const timer = setTimeout(() => finish({
+      status: "failed",
+      error: `Job ${jobId} did not finish within ${Math.round(timeout / 1000)} seconds`,
+    }), Math.max(timeout, 0));
+    unsubscribe = watchJob(jobId, (job) => {
+      if (onProgress && job.progress) {
+        onProgress(job.progress);
+      }
+      if (job.status === "succeeded" || job.status === "failed") {
+        finish(job);
+      }
+    });
+  });
+};
+
 // Default timeout 5 minutes * 60 seconds/minute * 1000 milliseconds/second
-const gateway = async (orRequestType, orRequestPayload, timeout = 5 * 60 * 1000) => {
+// Long running requests are answered with a jobId and awaited on the job document,
+// the timeout covers both
+const gateway = async (orRequestType, orRequestPayload, timeout = 5 * 60 * 1000, onProgress = null) => {
   console.log(`Fetching cloud endpoint: ${endpoints.gateway}, orRequestType=${orRequestType}`);
 
   const options = {
@@ -25,11 +65,26 @@ const gateway = async (orRequestType, orRequestPayload, timeout = 5 * 60 * 1000)
   };
 
   const gatewayFunction = httpsCallable(functions, endpoints.gateway, options);
+  const start = Date.now();
   try {
-    return await gatewayFunction({
+    const response = await gatewayFunction({
       "or_request_type": orRequestType,
       "or_request_payload": orRequestPayload,
     });
+    const jobId = response.data?.jobId;
+    if (!jobId) {
+      return response;
+    }
+    const job = await waitForJob(jobId, timeout - (Date.now() - start), onProgress);
+    if (job.status === "failed") {
+      console.error(`ERROR: job ${jobId} failed: ${job.error}`);
+      return {
+        data: null,
+        code: 500,
+        message: job.error,
+      };
+    }
+    return { data: { message: job.result, jobId } };
   } catch (error) {
     console.error(`ERROR: gatewayFunction: code=${error.code}, message=${error.message}`);
     return {
@@ -40,6 +95,47 @@ const gateway = async (orRequestType, orRequestPayload, timeout = 5 * 60 * 1000)
   }
 };
 
+// Sends several requests in one call. requests is a list of [orRequestType, orRequestPayload].
+// Resolves with one { status, message } result per request, in order.
+export const batch = async (requests, timeout = 5 * 60 * 1000) => {
+  const start = Date.now();
+  const response = await gateway(endpoints.batch, {
+    requests: requests.map(([orRequestType, orRequestPayload]) => ({
+      "or_request_type": orRequestType,
+      "or_request_payload": orRequestPayload,
+    })),
+  }, timeout);
+
+  console.log(`INFO: batch: response=${JSON.stringify(response)}`);
+
+  if (!response.data) {
+    throw new Error('Failed to send batch request');
+  }
+
+  return Promise.all(response.data.results.map(async (result) => {
+    if (!result.jobId) {
+      return result;
+    }
+    const job = await waitForJob(result.jobId, timeout - (Date.now() - start));
+    return job.status === "succeeded"
+      ? { status: 200, message: job.result, jobId: result.jobId }
+      : { status: 500, message: job.error, jobId: result.jobId };
+  }));
+};
+
+export const processScholarLinkAndNetwork = async (attorneyId, applicantId, scholarLink) => {
+  const payload = { attorneyId, applicantId, scholarLink };
+  const results = await batch([
+    [endpoints.processScholarLink, payload],
+    [endpoints.processScholarNetwork, payload],
+  ]);
+  const failed = results.find((result) => result.status >= 300);
+  if (failed) {
+    throw new Error(`Failed to process Google Scholar link: ${failed.message}`);
+  }
+  return results;
+};
+
 export const processScholarLink = async (attorneyId, applicantId, scholarLink) => {
   const response = await gateway(endpoints.processScholarLink, {
     attorneyId,
@@ -20,8 +20,7 @@ import {
 import { CheckCircleIcon, WarningIcon } from '@chakra-ui/icons';
 
 // Orison AI
-import { processScholarLink } from '../../../../api/api';
-import { processScholarNetwork } from '../../../../api/api';
+import { processScholarLinkAndNetwork } from '../../../../api/api';
 import ScholarDataModal from './ScholarDataModal';
 import { useApplicantContext } from '../../../../context/ApplicantContext';
 
@@ -54,7 +53,12 @@ const ScholarLinkForm = ({ }) => {
         setScholarDataStatus('not_found');
       } else {
         const data = querySnapshot.docs[0].data();
-        const networkData = networkSnapshot.docs[0].data();
+        const { nodes, ...networkData } = networkSnapshot.docs[0].data();
+        if (nodes) {
+          // Networks are stored as scholars keyed by scholar_id, most cited first
+          networkData.network = Object.values(nodes)
+            .sort((a, b) => (a.depth - b.depth) || ((b.citations || 0) - (a.citations || 0)));
+        }
         const mergedData = { ...data, ...networkData };
         setScholarData(mergedData);
         setScholarDataStatus('found');
@@ -92,10 +96,7 @@ const ScholarLinkForm = ({ }) => {
           isClosable: true,
         });
         setScholarDataStatus('loading');
-        await Promise.all([
-          processScholarLink(user.uid, selectedApplicant.id, scholarLink),
-          processScholarNetwork(user.uid, selectedApplicant.id, scholarLink)
-        ]);
+        await processScholarLinkAndNetwork(user.uid, selectedApplicant.id, scholarLink);
 
         toast({
           title: 'Google Scholar Data Found',
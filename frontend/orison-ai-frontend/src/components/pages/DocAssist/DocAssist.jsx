@@ -8,6 +8,9 @@ import ReactMarkdown from 'react-markdown';
 import Select, { components } from 'react-select'; // Import react-select and components
 import { useApplicantContext } from '../../../context/ApplicantContext';
 
+// Number of most recent chat turns shown
+const CHAT_TURNS_LIMIT = 200;
+
 const customStyles = {
     control: (provided, state) => ({
         ...provided,
@@ -111,19 +114,31 @@ const DocAssist = ({ }) => {
         fetchVectorizedFiles();
     }, [fetchVectorizedFiles]);
 
-    // Fetch chat memory (sorted by timestamp)
     // Fetch chat memory (sorted by timestamp)
     const fetchMemory = useCallback(async () => {
         if (user && selectedApplicant) {
-            const memoryRef = collection(db, "chat_memory", user.uid, selectedApplicant.id);
-            const q = query(memoryRef, orderBy("date_created", "desc"), limit(1)); // Get the latest document
-            const querySnapshot = await getDocs(q);
+            // Each turn is its own document of chat_turns
+            const turnsRef = collection(db, "chat_turns", user.uid, selectedApplicant.id);
+            const turnsQuery = query(turnsRef, orderBy("date_created", "desc"), limit(CHAT_TURNS_LIMIT));
+            const turnsSnapshot = await getDocs(turnsQuery);
+            let history = turnsSnapshot.docs.map(turnDoc => {
+                const data = turnDoc.data();
+                return {
+                    user_message: data.user_message,
+                    assistant_response: data.assistant_response,
+                    timestamp: data.date_created,
+                };
+            });
 
-            if (!querySnapshot.empty) {
-                const latestDoc = querySnapshot.docs[0];
-                const data = latestDoc.data();
-                let history = data.history || [];
+            // Conversations from before chat turns are kept in the latest chat_memory document
+            const memoryRef = collection(db, "chat_memory", user.uid, selectedApplicant.id);
+            const memoryQuery = query(memoryRef, orderBy("date_created", "desc"), limit(1));
+            const memorySnapshot = await getDocs(memoryQuery);
+            if (!memorySnapshot.empty) {
+                history = history.concat(memorySnapshot.docs[0].data().history || []);
+            }
 
+            if (history.length > 0) {
                 // Sort the history by timestamp in ascending order
                 history = history.sort((a, b) => a.timestamp.toMillis() - b.timestamp.toMillis());
 
@@ -140,8 +155,6 @@ const DocAssist = ({ }) => {
         }
     }, [user, selectedApplicant]);
 
-
-
     useEffect(() => {
         fetchMemory(); // Load memory on component mount
     }, [fetchMemory]);
@@ -165,17 +178,19 @@ const DocAssist = ({ }) => {
             return;
         }
 
-        // Temporarily display the user's question
-        const tempQuestion = { text: inputMessage, sender: 'user' };
-        setMessages((prevMessages) => [...prevMessages, tempQuestion]);
+        // Display the user's question right away
+        const question = { text: inputMessage, sender: 'user', timestamp: new Date() };
+        setMessages((prevMessages) => [...prevMessages, question]);
         setInputMessage('');
         setIsStreaming(true);
 
         try {
-            await docassist(user.uid, selectedApplicant.id, inputMessage);
+            const response = await docassist(user.uid, selectedApplicant.id, inputMessage);
 
-            // Fetch the full updated chat history, which includes the latest question and answer
-            await fetchMemory();
+            // The turn is stored in the background and may not be in Firestore yet,
+            // so the answer is appended here instead of reloading the history
+            const answer = { text: response.message, sender: 'bot', timestamp: new Date() };
+            setMessages((prevMessages) => [...prevMessages, answer]);
         } catch (error) {
             console.error('Error:', error);
             toast({
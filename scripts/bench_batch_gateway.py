@@ -0,0 +1,147 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Measures the end-to-end latency of a dashboard load sent as separate gateway
+calls, the way the frontend sends them with Promise.all, and as one batch.
+Every call pays the CORS preflight unless --no-preflight is given.
+
+Run the gateway locally (FUNCTION_MODE=gateway_function python main.py) or
+pass the deployed function URL. Without --token the identity token is
+fetched with ORISON_PASSWORD, see print_firebase_identity_token.py.
+"""
+
+import os
+import sys
+import json
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+from utils import percentile
+
+
+def call(session, url: str, token: str, data: dict, preflight: bool) -> dict:
+    if preflight:
+        session.options(
+            url,
+            headers={
+                "Access-Control-Request-Method": "POST",
+                "Access-Control-Request-Headers": "authorization,content-type",
+            },
+        )
+    response = session.post(
+        url,
+        headers={"Authorization": f"Bearer {token}"},
+        json={"data": data},
+    )
+    response.raise_for_status()
+    return response.json()["data"]
+
+
+def separate(url, token, items, preflight) -> list:
+    with ThreadPoolExecutor(len(items)) as executor:
+        return list(
+            executor.map(
+                lambda item: call(requests.Session(), url, token, item, preflight),
+                items,
+            )
+        )
+
+
+def batched(url, token, items, preflight) -> list:
+    data = {"or_request_type": "batch", "or_request_payload": {"requests": items}}
+    return call(requests.Session(), url, token, data, preflight)["results"]
+
+
+def measure(load, url, token, items, preflight, iterations) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        results = load(url, token, items, preflight)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "mean_ms": sum(latencies) / len(latencies),
+        "last_results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-u", "--url", default="http://0.0.0.0:8080")
+    parser.add_argument("--token")
+    parser.add_argument("--attorney", required=True)
+    parser.add_argument("--applicant", required=True)
+    parser.add_argument(
+        "--scholar-link",
+        default="https://scholar.google.com/citations?user=pXQ4_EUAAAAJ",
+    )
+    parser.add_argument(
+        "--request",
+        nargs=2,
+        action="append",
+        metavar=("REQUEST_TYPE", "PAYLOAD"),
+        help="Replaces the default dashboard load, can be repeated",
+    )
+    parser.add_argument("--no-preflight", action="store_true")
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.token:
+        token = args.token
+    else:
+        from print_firebase_identity_token import get_firebase_identity_token
+
+        token = get_firebase_identity_token()
+
+    ids = {"attorneyId": args.attorney, "applicantId": args.applicant}
+    if args.request:
+        items = [
+            {"or_request_type": request_type, "or_request_payload": json.loads(p)}
+            for request_type, p in args.request
+        ]
+    else:
+        # Requests the applicant pages send when the scholar link is set
+        items = [
+            {
+                "or_request_type": "process-scholar-link",
+                "or_request_payload": ids | {"scholarLink": args.scholar_link},
+            },
+            {
+                "or_request_type": "process-scholar-network",
+                "or_request_payload": ids | {"scholarLink": args.scholar_link},
+            },
+            {"or_request_type": "summarize", "or_request_payload": ids},
+        ]
+
+    preflight = not args.no_preflight
+    results = {
+        "separate": measure(
+            separate, args.url, token, items, preflight, args.iterations
+        ),
+        "batch": measure(batched, args.url, token, items, preflight, args.iterations),
+    }
+    print(json.dumps(results, indent=2))
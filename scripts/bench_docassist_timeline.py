@@ -0,0 +1,86 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Compares the DocAssist request timeline for every FIRESTORE_ASYNC_MODE.
+Setup FIREBASE_CREDENTIALS and BUCKET env vars (or secret manager access) before use.
+
+The blocking mode is the previous behaviour, where Firestore calls stalled
+the event loop. Each request runs on the long-lived gateway loop, the same
+way the gateway function serves it.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from argparse import ArgumentParser
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+from utils import percentile, run_in_background_loop
+from or_store import firebase
+from docassist import DocAssist
+from request_context import RequestContext
+
+logging.basicConfig(level=logging.WARNING)
+
+MODES = ["blocking", "executor", "native"]
+
+
+def timeline(mode: str, request_json: dict, iterations: int) -> dict:
+    # FirestoreClient reads the mode when it is constructed
+    firebase.FIRESTORE_ASYNC_MODE = mode
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        handler = DocAssist()
+        context = RequestContext(request_json).bind(handler.logger)
+        result = run_in_background_loop(handler.handle_request(request_json, context))
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        if result["status"] != 200:
+            raise RuntimeError(result["message"])
+    return {
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "mean_ms": sum(latencies) / len(latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--attorney", required=True)
+    parser.add_argument("--applicant", required=True)
+    parser.add_argument("--message", default="Give me a summary of the skills")
+    parser.add_argument("--filename", action="append", default=[])
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    request_json = {
+        "attorneyId": args.attorney,
+        "applicantId": args.applicant,
+        "message": args.message,
+        "tag": [],
+        "filename": args.filename,
+    }
+    results = {mode: timeline(mode, request_json, args.iterations) for mode in MODES}
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,85 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Measures the startup cost of Firestore access.
+Setup FIREBASE_CREDENTIALS and BUCKET env vars (or secret manager access) before use.
+
+Reports the cold creation of the shared client, the warm construction of the
+db_interfaces clients, and what every construction used to cost when each
+FireStoreDB resolved credentials and built its own client.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from argparse import ArgumentParser
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+from firebase_admin import credentials, firestore
+from or_store.firebase import (
+    environment_or_secret,
+    get_firebase_admin_app,
+    get_firestore_client,
+    get_async_firestore_client,
+)
+from or_store.db_interfaces import (
+    ScreeningClient,
+    GoogleScholarClient,
+    ChatMemoryClient,
+)
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def timed(fn, iterations=1):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000.0
+
+
+def per_call_client():
+    # What FireStoreDB.__init__ used to do for every handler and client
+    cred_dict = json.loads(environment_or_secret("FIREBASE_CREDENTIALS"))
+    environment_or_secret("BUCKET")
+    credentials.Certificate(cred_dict)
+    firestore.client(get_firebase_admin_app())
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    results = {
+        "cold_shared_client_ms": timed(get_firestore_client),
+        "cold_shared_async_client_ms": timed(get_async_firestore_client),
+        "warm_client_construction_ms": timed(
+            lambda: (ScreeningClient(), GoogleScholarClient(), ChatMemoryClient()),
+            args.iterations,
+        )
+        / 3,
+        "per_call_client_construction_ms": timed(per_call_client, args.iterations),
+    }
+    print(json.dumps(results, indent=2))
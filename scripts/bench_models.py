@@ -0,0 +1,135 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Measures encoding and decoding of a scholar profile with 500 publications,
+the way FirestoreClient writes and reads it.
+
+If mongoengine is installed, the same profile is also run through the
+mongoengine models that were used before for comparison.
+"""
+
+import os
+import sys
+import json
+import time
+from datetime import datetime
+from argparse import ArgumentParser
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+from or_store.models import GoogleScholarDB
+
+try:
+    import mongoengine
+except ImportError:
+    mongoengine = None
+
+
+def scholar_profile(publications: int) -> dict:
+    # Firestore dictionary of a scholar profile
+    return {
+        "attorney_id": "attorney",
+        "applicant_id": "applicant",
+        "date_created": datetime.utcnow(),
+        "author": {"name": "Applicant", "profile_link": "https://scholar.google.com"},
+        "co_authors": [{"name": f"Co-author {i}"} for i in range(20)],
+        "keywords": ["machine learning", "computer vision"],
+        "cited_by": 12000,
+        "h_index": 40,
+        "cited_each_year": {str(year): 1000 for year in range(2010, 2025)},
+        "publications": [
+            {
+                "title": f"Publication {i}",
+                "authors": "First Author and Second Author",
+                "abstract": "Abstract " * 40,
+                "cited_by": i,
+                "forum_name": "Journal of Results",
+                "year": str(2000 + i % 25),
+                "type_of_paper": "Journal",
+            }
+            for i in range(publications)
+        ],
+    }
+
+
+def legacy_models():
+    # Subset of the mongoengine models previously in or_store/models.py
+    from mongoengine import fields
+
+    class Author(mongoengine.EmbeddedDocument):
+        profile_link = fields.StringField()
+        name = fields.StringField(required=True)
+
+    class Publication(mongoengine.EmbeddedDocument):
+        title = fields.StringField(required=True)
+        authors = fields.ListField(fields.StringField())
+        cited_by = fields.IntField()
+        forum_name = fields.StringField()
+        abstract = fields.StringField()
+        year = fields.IntField()
+        type_of_paper = fields.StringField()
+
+    class LegacyScholar(mongoengine.Document):
+        attorney_id = fields.StringField(required=True)
+        applicant_id = fields.StringField(required=True)
+        date_created = fields.DateTimeField()
+        author = fields.EmbeddedDocumentField(Author)
+        co_authors = fields.ListField(fields.EmbeddedDocumentField(Author))
+        keywords = fields.ListField(fields.StringField())
+        cited_by = fields.IntField()
+        h_index = fields.IntField()
+        cited_each_year = fields.DictField()
+        publications = fields.ListField(fields.EmbeddedDocumentField(Publication))
+
+    return LegacyScholar
+
+
+def timed(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000.0
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-p", "--publications", type=int, default=500)
+    parser.add_argument("-n", "--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    data = scholar_profile(args.publications)
+    scholar = GoogleScholarDB.from_dict(data)
+    results = {
+        "decode_ms": timed(lambda: GoogleScholarDB.from_dict(data), args.iterations),
+        "encode_ms": timed(
+            lambda: (scholar.validate(), scholar.to_dict()), args.iterations
+        ),
+    }
+    if mongoengine is not None:
+        LegacyScholar = legacy_models()
+        legacy = LegacyScholar(**data)
+        results["mongoengine_decode_ms"] = timed(
+            lambda: LegacyScholar(**data), args.iterations
+        )
+        results["mongoengine_encode_ms"] = timed(
+            lambda: legacy.to_mongo().to_dict(), args.iterations
+        )
+    print(json.dumps(results, indent=2))
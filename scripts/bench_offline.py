@@ -0,0 +1,323 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Runs VectorizeFiles, DocAssist, Summarize and DeleteFileVectors end to end
+through the gateway dispatcher against the local stand-ins of
+offline_standins.py, without OpenAI, Qdrant or Firebase. Reports throughput,
+p50/p95/p99 latency and peak RSS per scenario and writes them as JSON.
+
+python scripts/bench_offline.py -o bench.json
+python scripts/bench_offline.py --baseline bench.json --tolerance 0.15
+
+With --baseline the run fails if a scenario got slower or its throughput
+dropped by more than the tolerance. Every applicant has its file vectorized
+once before the timed scenarios, which also warms the clients and caches.
+
+Needs the gateway requirements and the tiktoken encodings, set
+TIKTOKEN_CACHE_DIR to a directory holding them when offline. The LLM
+scheduler limits apply as in production, raise LLM_TOKENS_PER_MINUTE and
+LLM_MAX_CONCURRENCY to measure the gateway rather than the token budget.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import platform
+import resource
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+from offline_standins import FakeOpenAIServer, install
+from utils import percentile, run_in_background_loop
+from gateway import GatewayRequest, GatewayRequestType, dispatch
+from request_context import RequestContext
+from vectorize_files import VectorizeFiles, DeleteFileVectors
+from summarize import Summarize, DEFAULT_QUESTIONNAIRE
+from docassist import DocAssist
+from or_llm import llm_cache
+
+logging.basicConfig(level=logging.WARNING)
+_logger = logging.getLogger("bench_offline")
+
+TEMPLATES = os.path.join(
+    os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function", "templates"
+)
+SCENARIOS = ["vectorize", "docassist", "summarize", "delete"]
+ATTORNEY_ID = "bench_attorney"
+FILE_ID = "bench_document.txt"
+TAG = "research"
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def document_text(size_kb: int) -> str:
+    # The vectorization test document repeated to the requested size
+    with open(os.path.join(TEMPLATES, "test_vectorize.txt")) as f:
+        text = f.read()
+    return (text * (size_kb * 1024 // len(text) + 1))[: size_kb * 1024]
+
+
+def questionnaire(questions: int) -> dict:
+    # Template document in the format Summarize.compile_questionnaire reads
+    with open(os.path.join(TEMPLATES, f"{DEFAULT_QUESTIONNAIRE}.json")) as f:
+        template = json.load(f)
+    tasks = [
+        {"question": question, "detail_level": detail_level, "tag": [template["tag"]]}
+        for question, detail_level in zip(
+            template["question"], template["detail_level"]
+        )
+    ]
+    return {"task": tasks[:questions] if questions else tasks}
+
+
+def seed(stand_ins, applicants: list, file_kb: int, questions: int):
+    text = document_text(file_kb)
+    for applicant_id in applicants:
+        stand_ins.firestore.collection("applicants").document(applicant_id).set(
+            {"attorney_id": ATTORNEY_ID, "vectorized_files": []}
+        )
+        blob = stand_ins.bucket.blob(
+            VectorizeFiles._file_path_builder(ATTORNEY_ID, applicant_id, TAG, FILE_ID)
+        )
+        blob.upload_from_string(text)
+    stand_ins.firestore.collection("templates").document(DEFAULT_QUESTIONNAIRE).set(
+        questionnaire(questions)
+    )
+
+
+def payload(scenario: str, applicant_id: str, index: int) -> dict:
+    ids = {"attorneyId": ATTORNEY_ID, "applicantId": applicant_id}
+    match scenario:
+        case "vectorize" | "delete":
+            return ids | {"fileId": FILE_ID, "tag": TAG}
+        case "docassist":
+            return ids | {
+                "message": f"Summarize the research contributions, question {index}",
+                "tag": [],
+                "filename": [FILE_ID],
+            }
+        case _:
+            return ids
+
+
+REQUEST_TYPES = {
+    "vectorize": GatewayRequestType.VECTORIZE_FILES,
+    "docassist": GatewayRequestType.DOCASSIST,
+    "summarize": GatewayRequestType.SUMMARIZE,
+    "delete": GatewayRequestType.DELETE_FILE_VECTORS,
+}
+
+
+async def run_scenario(
+    routes: dict, scenario: str, applicants: list, requests: int, concurrency: int
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def send(index: int):
+        applicant_id = applicants[index % len(applicants)]
+        gateway_request = GatewayRequest(
+            REQUEST_TYPES[scenario].value, payload(scenario, applicant_id, index)
+        )
+        async with semaphore:
+            context = RequestContext(
+                payload=gateway_request.or_request_payload,
+                request_id=f"{scenario}-{index}",
+            ).bind(_logger)
+            start = time.perf_counter()
+            try:
+                result = await dispatch(routes, gateway_request, context)
+            except Exception as e:
+                result = {"status": 500, "message": f"{type(e).__name__}: {e}"}
+            latencies.append((time.perf_counter() - start) * 1000.0)
+        if result["status"] >= 300:
+            errors.append(result["message"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(index) for index in range(requests)))
+    duration = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(requests / duration, 3),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "mean": round(sum(latencies) / len(latencies), 2),
+            "max": round(max(latencies), 2),
+        },
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    # Scenarios slower or with less throughput than the baseline beyond the tolerance
+    regressions = []
+    for scenario, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if previous is None:
+            continue
+        p95_change = current["latency_ms"]["p95"] / previous["latency_ms"]["p95"] - 1
+        throughput_change = current["throughput_rps"] / previous["throughput_rps"] - 1
+        print(
+            f"{scenario:>10}: p95 {previous['latency_ms']['p95']:.1f} -> "
+            f"{current['latency_ms']['p95']:.1f} ms ({p95_change:+.1%}), throughput "
+            f"{previous['throughput_rps']:.2f} -> {current['throughput_rps']:.2f} rps "
+            f"({throughput_change:+.1%})"
+        )
+        if p95_change > tolerance or throughput_change < -tolerance:
+            regressions.append(scenario)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("-n", "--requests", type=int, default=20)
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--applicants", type=int, default=4)
+    parser.add_argument("--file-kb", type=int, default=64)
+    parser.add_argument(
+        "--questions", type=int, default=0, help="Questions per screening, 0 for all"
+    )
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--firestore-latency", type=float, default=0.01)
+    parser.add_argument("--storage-latency", type=float, default=0.02)
+    parser.add_argument(
+        "--openai-url", help="Fake OpenAI API served by offline_standins.py"
+    )
+    parser.add_argument(
+        "--llm-cache",
+        action="store_true",
+        help="Keep the LLM cache, repeated screenings are then served from it",
+    )
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    server = None
+    openai_url = args.openai_url
+    if openai_url is None:
+        server = FakeOpenAIServer(
+            chat_latency=args.chat_latency,
+            embedding_latency=args.embedding_latency,
+            jitter=args.jitter,
+        ).start()
+        openai_url = server.url
+    if not args.llm_cache:
+        llm_cache.LLM_CACHE_BACKEND = "none"
+
+    bucket_root = tempfile.mkdtemp(prefix="orison_bench_bucket_")
+    stand_ins = install(
+        openai_url, bucket_root, args.firestore_latency, args.storage_latency
+    )
+    applicants = [f"bench_applicant_{i}" for i in range(args.applicants)]
+    seed(stand_ins, applicants, args.file_kb, args.questions)
+    routes = {
+        GatewayRequestType.VECTORIZE_FILES: VectorizeFiles(),
+        GatewayRequestType.DELETE_FILE_VECTORS: DeleteFileVectors(),
+        GatewayRequestType.SUMMARIZE: Summarize(),
+        GatewayRequestType.DOCASSIST: DocAssist(),
+    }
+
+    warmup = run_in_background_loop(
+        run_scenario(routes, "vectorize", applicants, len(applicants), 1)
+    )
+    if warmup["errors"]:
+        sys.exit(
+            f"Vectorization of the applicant files failed: {warmup['first_error']}"
+        )
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "scenarios": {},
+    }
+    for scenario in args.scenario or SCENARIOS:
+        openai_before = server.stats() if server else {}
+        firestore_before = stand_ins.firestore.operations
+        result = run_in_background_loop(
+            run_scenario(routes, scenario, applicants, args.requests, args.concurrency)
+        )
+        if server:
+            result["openai"] = {
+                name: value - openai_before[name]
+                for name, value in server.stats().items()
+            }
+        result["firestore_operations"] = (
+            stand_ins.firestore.operations - firestore_before
+        )
+        result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        results["scenarios"][scenario] = result
+        print(
+            f"{scenario:>10}: {result['throughput_rps']:.2f} rps, "
+            f"p50 {result['latency_ms']['p50']:.1f} ms, "
+            f"p95 {result['latency_ms']['p95']:.1f} ms, "
+            f"p99 {result['latency_ms']['p99']:.1f} ms, "
+            f"{result['errors']} errors, peak RSS {result['peak_rss_mb']} MB"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+    else:
+        print(json.dumps(results, indent=2, default=str))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+    if server:
+        server.stop()
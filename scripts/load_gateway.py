@@ -0,0 +1,435 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Load test of a single gateway instance. Drives the Flask app functions_framework
+builds from main.py with a mix of requests at increasing concurrency, through
+token verification and the router, against the stand-ins of
+offline_standins.py. Reports latency and throughput per concurrency level and
+where the instance saturates.
+
+python scripts/load_gateway.py --mix docassist=6,delete-file-vectors=3,summarize=1 \
+    --concurrency 1,2,4,8,16,32 --duration 30 -o load.json --csv load.csv
+
+Each level runs that many clients sending requests back to back for
+--duration seconds, the first --ramp seconds are not measured. The instance
+is saturated at the last level after which throughput grows by less than
+--min-gain while p95 latency keeps rising. With --slo-ms the highest level
+whose p95 meets it is reported as well.
+
+Summarize and vectorize-files are queued in a local SQLite job store, as
+the gateway does with background jobs, unless --inline is given. Payload
+sizes take lists that requests cycle through. See bench_offline.py for the
+requirements and the LLM scheduler limits.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import tempfile
+import threading
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(__file__))
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+from functions_framework import create_app
+
+from offline_standins import (
+    FakeOpenAIServer,
+    install,
+    install_auth,
+    offline_id_token,
+)
+from bench_offline import (
+    ATTORNEY_ID,
+    TAG,
+    document_text,
+    questionnaire,
+    peak_rss_mb,
+    git_revision,
+)
+from utils import percentile
+from summarize import DEFAULT_QUESTIONNAIRE
+from vectorize_files import VectorizeFiles
+from or_store import job_store
+from or_llm import llm_cache
+
+GATEWAY_MAIN = os.path.join(
+    os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function", "main.py"
+)
+REQUEST_TYPES = [
+    "docassist",
+    "summarize",
+    "vectorize-files",
+    "delete-file-vectors",
+    "batch",
+]
+
+
+def parse_mix(mix: str) -> dict:
+    # "docassist=6,summarize=1" -> {"docassist": 6.0, "summarize": 1.0}
+    weights = {}
+    for item in mix.split(","):
+        request_type, _, weight = item.partition("=")
+        if request_type not in REQUEST_TYPES:
+            raise ValueError(f"Unknown request type {request_type}")
+        weights[request_type] = float(weight or 1)
+    return weights
+
+
+def parse_ints(values: str) -> list:
+    return [int(value) for value in values.split(",")]
+
+
+def file_id(size_kb: int) -> str:
+    return f"load_{size_kb}kb.txt"
+
+
+class RequestMix:
+    """
+    Deterministic sequence of gateway requests drawn from the weighted
+    request types. Payload sizes and applicants are cycled through.
+    """
+
+    def __init__(self, args, applicants: list, seed: int):
+        self._weights = parse_mix(args.mix)
+        self._applicants = applicants
+        self._message_chars = parse_ints(args.message_chars)
+        self._file_kb = parse_ints(args.file_kb)
+        self._batch_size = args.batch_size
+        self._unauthenticated = args.unauthenticated
+        self._random = random.Random(seed)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def _item(self, request_type: str, index: int) -> dict:
+        applicant_id = self._applicants[index % len(self._applicants)]
+        payload = {"attorneyId": ATTORNEY_ID, "applicantId": applicant_id}
+        match request_type:
+            case "docassist":
+                chars = self._message_chars[index % len(self._message_chars)]
+                message = f"Question {index} about the research contributions. "
+                payload |= {
+                    "message": (message * (chars // len(message) + 1))[:chars],
+                    "tag": [],
+                    "filename": [file_id(size) for size in self._file_kb],
+                }
+            case "vectorize-files" | "delete-file-vectors":
+                size = self._file_kb[index % len(self._file_kb)]
+                payload |= {"fileId": file_id(size), "tag": TAG}
+        return {"or_request_type": request_type, "or_request_payload": payload}
+
+    def next(self):
+        """
+        :return: (request type, request JSON, authenticated)
+        """
+        with self._lock:
+            index = self._count
+            self._count += 1
+            request_type = self._random.choices(
+                list(self._weights), list(self._weights.values())
+            )[0]
+            authenticated = self._random.random() >= self._unauthenticated
+        if request_type == "batch":
+            data = {
+                "or_request_type": "batch",
+                "or_request_payload": {
+                    "requests": [
+                        self._item("docassist", index + offset)
+                        for offset in range(self._batch_size)
+                    ]
+                },
+            }
+        else:
+            data = self._item(request_type, index)
+        return request_type, {"data": data}, authenticated
+
+
+def latency_summary(latencies: list) -> dict:
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    return {
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+        "mean": round(sum(latencies) / len(latencies), 2),
+    }
+
+
+def run_level(app, mix: RequestMix, concurrency: int, duration: float, ramp: float):
+    # Closed loop: every client sends its next request once the last one returned
+    token = offline_id_token("load-test")
+    samples = []  # (request type, status, latency ms)
+    samples_lock = threading.Lock()
+    start = time.monotonic()
+    measure_from = start + ramp
+    deadline = measure_from + duration
+
+    def client(index: int):
+        test_client = app.test_client()
+        sent = 0
+        while time.monotonic() < deadline:
+            request_type, request_json, authenticated = mix.next()
+            headers = {"X-Request-Id": f"load-{concurrency}-{index}-{sent}"}
+            if authenticated:
+                headers["Authorization"] = f"Bearer {token}"
+            else:
+                request_type = "unauthenticated"
+            sent += 1
+            request_start = time.monotonic()
+            response = test_client.post("/", json=request_json, headers=headers)
+            latency = (time.monotonic() - request_start) * 1000.0
+            if request_start >= measure_from:
+                with samples_lock:
+                    samples.append((request_type, response.status_code, latency))
+
+    threads = [
+        threading.Thread(target=client, args=(index,), name=f"load-client-{index}")
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Requests still running at the deadline finish after it
+    window = max(time.monotonic() - measure_from, 1e-9)
+
+    statuses = {}
+    by_type = {}
+    for request_type, status, latency in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        by_type.setdefault(request_type, []).append(latency)
+    # Answered requests, accepted jobs and rejected tokens included
+    ok = [latency for _, status, latency in samples if status < 500]
+    failed = sum(1 for _, status, _ in samples if status >= 500)
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "throughput_rps": round(len(ok) / window, 3),
+        "error_rate": round(failed / len(samples), 4) if samples else 0.0,
+        "statuses": statuses,
+        "latency_ms": latency_summary([latency for _, _, latency in samples]),
+        "by_type": {
+            request_type: {"requests": len(latencies)} | latency_summary(latencies)
+            for request_type, latencies in sorted(by_type.items())
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def saturation(levels: list, min_gain: float, slo_ms: float = None) -> dict:
+    knee = None
+    for previous, current in zip(levels, levels[1:]):
+        gain = (
+            current["throughput_rps"] / previous["throughput_rps"] - 1
+            if previous["throughput_rps"]
+            else 0.0
+        )
+        if gain < min_gain and (current["latency_ms"]["p95"] or 0) > (
+            previous["latency_ms"]["p95"] or 0
+        ):
+            knee = previous["concurrency"]
+            break
+    peak = max(levels, key=lambda level: level["throughput_rps"])
+    result = {
+        "saturation_concurrency": knee,
+        "peak_throughput_rps": peak["throughput_rps"],
+        "peak_throughput_concurrency": peak["concurrency"],
+        "first_concurrency_with_errors": next(
+            (level["concurrency"] for level in levels if level["error_rate"] > 0),
+            None,
+        ),
+    }
+    if slo_ms is not None:
+        within = [
+            level["concurrency"]
+            for level in levels
+            if level["latency_ms"]["p95"] is not None
+            and level["latency_ms"]["p95"] <= slo_ms
+        ]
+        result["max_concurrency_within_slo"] = max(within) if within else None
+    return result
+
+
+def seed(stand_ins, applicants: list, file_sizes: list, questions: int):
+    for applicant_id in applicants:
+        stand_ins.firestore.collection("applicants").document(applicant_id).set(
+            {"attorney_id": ATTORNEY_ID, "vectorized_files": []}
+        )
+        for size in file_sizes:
+            stand_ins.bucket.blob(
+                VectorizeFiles._file_path_builder(
+                    ATTORNEY_ID, applicant_id, TAG, file_id(size)
+                )
+            ).upload_from_string(document_text(size))
+    stand_ins.firestore.collection("templates").document(DEFAULT_QUESTIONNAIRE).set(
+        questionnaire(questions)
+    )
+
+
+def vectorize_all(app, applicants: list, file_sizes: list):
+    # Vectors for DocAssist retrieval. Files are vectorized inline one at a time.
+    test_client = app.test_client()
+    headers = {"Authorization": f"Bearer {offline_id_token('load-test')}"}
+    for applicant_id in applicants:
+        for size in file_sizes:
+            data = {
+                "or_request_type": "vectorize-files",
+                "or_request_payload": {
+                    "attorneyId": ATTORNEY_ID,
+                    "applicantId": applicant_id,
+                    "fileId": file_id(size),
+                    "tag": TAG,
+                },
+            }
+            response = test_client.post("/", json={"data": data}, headers=headers)
+            if response.status_code != 200:
+                sys.exit(f"Vectorization of {file_id(size)} failed: {response.json}")
+
+
+def print_curve(levels: list):
+    print(
+        f"{'clients':>8} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    )
+    for level in levels:
+        latency = level["latency_ms"]
+        print(
+            f"{level['concurrency']:>8} {level['throughput_rps']:>9.2f} "
+            f"{latency['p50'] or 0:>9.1f} {latency['p95'] or 0:>9.1f} "
+            f"{latency['p99'] or 0:>9.1f} {level['error_rate']:>7.2%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--mix",
+        default="docassist=6,delete-file-vectors=2,summarize=1,vectorize-files=1",
+        help=f"Weighted request types out of {', '.join(REQUEST_TYPES)}",
+    )
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--ramp", type=float, default=2.0)
+    parser.add_argument("--applicants", type=int, default=8)
+    parser.add_argument("--message-chars", default="200,2000")
+    parser.add_argument("--file-kb", default="16,128")
+    parser.add_argument("--questions", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=3)
+    parser.add_argument(
+        "--unauthenticated",
+        type=float,
+        default=0.0,
+        help="Fraction of requests sent without a token",
+    )
+    parser.add_argument("--inline", action="store_true")
+    parser.add_argument("--auth-latency", type=float, default=0.0)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--firestore-latency", type=float, default=0.01)
+    parser.add_argument("--storage-latency", type=float, default=0.02)
+    parser.add_argument(
+        "--openai-url", help="Fake OpenAI API served by offline_standins.py"
+    )
+    parser.add_argument("--llm-cache", action="store_true")
+    parser.add_argument("--min-gain", type=float, default=0.1)
+    parser.add_argument("--slo-ms", type=float)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--csv", help="Write the latency curve to this CSV file")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    levels = parse_ints(args.concurrency)
+
+    server = None
+    openai_url = args.openai_url
+    if openai_url is None:
+        server = FakeOpenAIServer(
+            chat_latency=args.chat_latency,
+            embedding_latency=args.embedding_latency,
+            jitter=args.jitter,
+        ).start()
+        openai_url = server.url
+    if not args.llm_cache:
+        llm_cache.LLM_CACHE_BACKEND = "none"
+
+    work_dir = tempfile.mkdtemp(prefix="orison_load_")
+    stand_ins = install(
+        openai_url,
+        os.path.join(work_dir, "bucket"),
+        args.firestore_latency,
+        args.storage_latency,
+    )
+    install_auth(args.auth_latency)
+    job_store._job_store = job_store.SqliteJobStore(
+        os.path.join(work_dir, "jobs.sqlite")
+    )
+    applicants = [f"load_applicant_{i}" for i in range(args.applicants)]
+    file_sizes = parse_ints(args.file_kb)
+    seed(stand_ins, applicants, file_sizes, args.questions)
+
+    app = create_app(target="gateway_function", source=GATEWAY_MAIN)
+    # The module functions_framework loaded main.py as
+    gateway_main = sys.modules["main"]
+    gateway_main.GATEWAY_BACKGROUND_JOBS = False
+    vectorize_all(app, applicants, file_sizes)
+    gateway_main.GATEWAY_BACKGROUND_JOBS = not args.inline
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "config": vars(args),
+        "levels": [],
+    }
+    for index, concurrency in enumerate(levels):
+        mix = RequestMix(args, applicants, args.seed + index)
+        level = run_level(app, mix, concurrency, args.duration, args.ramp)
+        results["levels"].append(level)
+        print(
+            f"{concurrency:>4} clients: {level['throughput_rps']:.2f} rps, "
+            f"p95 {level['latency_ms']['p95']} ms, errors {level['error_rate']:.2%}",
+            file=sys.stderr,
+        )
+    results["saturation"] = saturation(results["levels"], args.min_gain, args.slo_ms)
+
+    print_curve(results["levels"])
+    print(json.dumps(results["saturation"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("concurrency,throughput_rps,p50_ms,p95_ms,p99_ms,error_rate\n")
+            for level in results["levels"]:
+                latency = level["latency_ms"]
+                f.write(
+                    f"{level['concurrency']},{level['throughput_rps']},"
+                    f"{latency['p50']},{latency['p95']},{latency['p99']},"
+                    f"{level['error_rate']}\n"
+                )
+    if server:
+        server.stop()
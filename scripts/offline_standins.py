@@ -0,0 +1,830 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Local stand-ins for the services the gateway calls, used by the offline
+benchmarks:
+- FakeOpenAIServer answers the chat completion and embedding endpoints over
+  HTTP with deterministic content and a configurable latency
+- FakeFirestore keeps documents in memory for the sync and async clients
+- LocalBucket serves storage blobs from a directory
+- in_memory_qdrant backs the Qdrant clients with one in-memory store
+- install_auth accepts the ID tokens of offline_id_token
+
+install() points the gateway modules of the process at them. Run this file
+to serve the fake OpenAI API on its own, so its threads do not compete with
+the benchmarked process:
+python scripts/offline_standins.py --port 8089 --chat-latency 0.8
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import base64
+import asyncio
+import hashlib
+import shutil
+import threading
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+# Marker of the prompt MultiQueryRetriever sends to generate query variants
+QUERY_VARIANTS_PROMPT = "different versions of the given user question"
+
+
+def _digest(data) -> bytes:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).digest()
+
+
+def _fill(schema: dict):
+    # Deterministic value matching a JSON schema, for structured outputs
+    match schema.get("type"):
+        case "object":
+            return {
+                name: _fill(field)
+                for name, field in schema.get("properties", {}).items()
+            }
+        case "array":
+            return []
+        case "boolean":
+            return True
+        case "integer" | "number":
+            return 1
+        case _:
+            return "Stand-in answer"
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    # Keeps connections open, the OpenAI client pools them
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/embeddings"):
+            self._reply(200, self.server.embeddings(body))
+        elif self.path.endswith("/chat/completions"):
+            self._reply(200, self.server.chat_completion(body))
+        else:
+            self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _reply(self, status: int, data: dict):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Serves /v1/chat/completions and /v1/embeddings. Responses depend only on
+    the request: embeddings are unit vectors seeded by the input, answers
+    carry a digest of the prompt. Every request is delayed by its base
+    latency, varied by up to +-jitter of it, again derived from the request.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        chat_latency: float = 0.5,
+        embedding_latency: float = 0.05,
+        jitter: float = 0.2,
+        dimensions: int = 1536,
+        answer_tokens: int = 200,
+    ):
+        """
+        :param port: 0 picks a free port
+        :param chat_latency: Seconds per chat completion
+        :param embedding_latency: Seconds per embedding request
+        :param jitter: Fraction the latency of a request varies by
+        :param dimensions: Size of the embeddings
+        :param answer_tokens: Approximate length of the chat answers
+        """
+        super().__init__((host, port), _OpenAIHandler)
+        self.chat_latency = chat_latency
+        self.embedding_latency = embedding_latency
+        self.jitter = jitter
+        self.dimensions = dimensions
+        self.answer_tokens = answer_tokens
+        self._lock = threading.Lock()
+        self.chat_calls = 0
+        self.embedding_calls = 0
+        self.embedded_inputs = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        threading.Thread(
+            target=self.serve_forever, name="fake-openai", daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chat_calls": self.chat_calls,
+                "embedding_calls": self.embedding_calls,
+                "embedded_inputs": self.embedded_inputs,
+            }
+
+    def _delay(self, latency: float, digest: bytes):
+        fraction = int.from_bytes(digest[:4], "little") / 2**32
+        time.sleep(max(latency * (1.0 + self.jitter * (2.0 * fraction - 1.0)), 0.0))
+
+    def _embedding(self, item) -> np.ndarray:
+        seed = int.from_bytes(_digest(item)[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+    def embeddings(self, body: dict) -> dict:
+        inputs = body.get("input")
+        # A string or a token list is a single input
+        if isinstance(inputs, str) or (
+            inputs and isinstance(inputs, list) and isinstance(inputs[0], int)
+        ):
+            inputs = [inputs]
+        inputs = inputs or []
+        self._delay(self.embedding_latency, _digest(inputs))
+        base64_encoded = body.get("encoding_format") == "base64"
+        data = []
+        tokens = 0
+        for index, item in enumerate(inputs):
+            vector = self._embedding(item)
+            tokens += len(item) if isinstance(item, list) else len(item) // 4 + 1
+            data.append(
+                {
+                    "object": "embedding",
+                    "index": index,
+                    "embedding": (
+                        base64.b64encode(vector.tobytes()).decode()
+                        if base64_encoded
+                        else vector.tolist()
+                    ),
+                }
+            )
+        with self._lock:
+            self.embedding_calls += 1
+            self.embedded_inputs += len(inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def chat_completion(self, body: dict) -> dict:
+        messages = body.get("messages", [])
+        text = "\n".join(
+            (
+                message.get("content")
+                if isinstance(message.get("content"), str)
+                else json.dumps(message.get("content"))
+            )
+            for message in messages
+        )
+        digest = _digest(messages)
+        self._delay(self.chat_latency, digest)
+        label = digest[:4].hex()
+        if QUERY_VARIANTS_PROMPT in text:
+            answer = "\n".join(f"Stand-in query {i} {label}" for i in range(1, 4))
+        else:
+            answer = f"Stand-in answer {label}." + " lorem" * self.answer_tokens
+
+        message = {"role": "assistant", "content": answer}
+        finish_reason = "stop"
+        response_format = body.get("response_format") or {}
+        if body.get("tools"):
+            function = body["tools"][0]["function"]
+            arguments = _fill(function.get("parameters", {}))
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [
+                    {
+                        "id": f"call_{label}",
+                        "type": "function",
+                        "function": {
+                            "name": function["name"],
+                            "arguments": json.dumps(arguments),
+                        },
+                    }
+                ],
+            }
+            finish_reason = "tool_calls"
+        elif response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"].get("schema", {})
+            message["content"] = json.dumps(_fill(schema))
+
+        prompt_tokens = len(text) // 4 + 1
+        completion_tokens = (
+            len(message["content"] or json.dumps(message.get("tool_calls"))) // 4 + 1
+        )
+        with self._lock:
+            self.chat_calls += 1
+        return {
+            "id": f"chatcmpl-{label}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "logprobs": None,
+                    "finish_reason": finish_reason,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+class _Store:
+    # Documents of the fake Firestore by collection path and document id
+
+    def __init__(self, latency: float = 0.0):
+        self.collections: Dict[str, Dict[str, dict]] = {}
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.operations = 0
+
+    @staticmethod
+    def _split(path: str) -> Tuple[str, str]:
+        collection, _, document_id = path.rpartition("/")
+        return collection, document_id
+
+    def get(self, path: str) -> Optional[dict]:
+        collection, document_id = self._split(path)
+        with self.lock:
+            data = self.collections.get(collection, {}).get(document_id)
+            return copy.deepcopy(data)
+
+    def write(self, path: str, data: Optional[dict]):
+        collection, document_id = self._split(path)
+        with self.lock:
+            documents = self.collections.setdefault(collection, {})
+            if data is None:
+                documents.pop(document_id, None)
+            else:
+                documents[document_id] = data
+
+    def documents(self, collection: str) -> List[Tuple[str, dict]]:
+        with self.lock:
+            return [
+                (document_id, copy.deepcopy(data))
+                for document_id, data in self.collections.get(collection, {}).items()
+            ]
+
+
+def _apply(target: dict, key: str, value):
+    # Writes a value or applies a transform to a field
+    from firebase_admin import firestore
+
+    if value is firestore.DELETE_FIELD:
+        target.pop(key, None)
+    elif value is firestore.SERVER_TIMESTAMP:
+        target[key] = datetime.now(timezone.utc)
+    elif isinstance(value, firestore.ArrayUnion):
+        current = target.get(key)
+        current = list(current) if isinstance(current, list) else []
+        target[key] = current + [v for v in value.values if v not in current]
+    elif isinstance(value, firestore.ArrayRemove):
+        current = target.get(key)
+        current = list(current) if isinstance(current, list) else []
+        target[key] = [v for v in current if v not in value.values]
+    elif isinstance(value, firestore.Increment):
+        current = target.get(key)
+        current = current if isinstance(current, (int, float)) else 0
+        target[key] = current + value.value
+    else:
+        target[key] = copy.deepcopy(value)
+
+
+def _merge(target: dict, data: dict):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge(target[key], value)
+        else:
+            _apply(target, key, value)
+
+
+def _field(data: dict, field_path: str):
+    for name in field_path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(name)
+    return data
+
+
+class _Reference:
+    def __init__(self, store: _Store, path: str, asynchronous: bool):
+        self._store = store
+        self._asynchronous = asynchronous
+        self.path = path
+        self.id = path.rpartition("/")[2]
+
+    def _result(self, operation):
+        # Sync references block for the latency, async ones return a coroutine
+        self._store.operations += 1
+        if self._asynchronous:
+
+            async def run():
+                await asyncio.sleep(self._store.latency)
+                return operation()
+
+            return run()
+        time.sleep(self._store.latency)
+        return operation()
+
+
+class _DocumentSnapshot:
+    def __init__(self, reference: "_DocumentReference", data: Optional[dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        return _field(self._data or {}, field_path)
+
+
+class _Watch:
+    def unsubscribe(self):
+        pass
+
+
+class _DocumentReference(_Reference):
+    def collection(self, collection_id: str) -> "_CollectionReference":
+        return _CollectionReference(
+            self._store, f"{self.path}/{collection_id}", self._asynchronous
+        )
+
+    def _set(self, data: dict, merge: bool = False):
+        with self._store.lock:
+            current = (self._store.get(self.path) or {}) if merge else {}
+            _merge(current, data)
+            self._store.write(self.path, current)
+
+    def _update(self, data: dict):
+        from google.api_core.exceptions import NotFound
+
+        with self._store.lock:
+            current = self._store.get(self.path)
+            if current is None:
+                raise NotFound(f"No document to update: {self.path}")
+            for field_path, value in data.items():
+                *parents, name = field_path.split(".")
+                target = current
+                for parent in parents:
+                    if not isinstance(target.get(parent), dict):
+                        target[parent] = {}
+                    target = target[parent]
+                _apply(target, name, value)
+            self._store.write(self.path, current)
+
+    def get(self, field_paths=None, transaction=None):
+        return self._result(lambda: _DocumentSnapshot(self, self._store.get(self.path)))
+
+    def set(self, document_data: dict, merge: bool = False):
+        return self._result(lambda: self._set(document_data, merge))
+
+    def update(self, field_updates: dict):
+        return self._result(lambda: self._update(field_updates))
+
+    def delete(self):
+        return self._result(lambda: self._store.write(self.path, None))
+
+    def on_snapshot(self, callback) -> _Watch:
+        # Documents only change through the benchmark, nothing to listen to
+        return _Watch()
+
+
+class _Query(_Reference):
+    _OPERATORS = {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a is not None and a < b,
+        "<=": lambda a, b: a is not None and a <= b,
+        ">": lambda a, b: a is not None and a > b,
+        ">=": lambda a, b: a is not None and a >= b,
+        "in": lambda a, b: a in b,
+        "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    }
+
+    def __init__(self, store: _Store, path: str, asynchronous: bool):
+        super().__init__(store, path, asynchronous)
+        self._filters = []
+        self._fields = None
+        self._orders = []
+        self._cursor = None
+        self._limit = None
+
+    def _copy(self, **changes) -> "_Query":
+        query = copy.copy(self)
+        for name, value in changes.items():
+            setattr(query, f"_{name}", value)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        filters = getattr(filter, "filters", None) or ([filter] if filter else [])
+        conditions = [(f.field_path, f.op_string, f.value) for f in filters]
+        if field_path is not None:
+            conditions.append((field_path, op_string, value))
+        return self._copy(filters=self._filters + conditions)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING"):
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def start_after(self, document_fields):
+        return self._copy(cursor=document_fields)
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def _run(self) -> List[_DocumentSnapshot]:
+        documents = [
+            (document_id, data)
+            for document_id, data in self._store.documents(self.path)
+            if all(
+                self._OPERATORS[op](_field(data, field_path), value)
+                for field_path, op, value in self._filters
+            )
+        ]
+        for field_path, direction in reversed(self._orders):
+            documents.sort(
+                key=lambda item: (
+                    _field(item[1], field_path) is not None,
+                    _field(item[1], field_path),
+                ),
+                reverse=direction == "DESCENDING",
+            )
+        if self._cursor is not None:
+            ids = [document_id for document_id, _ in documents]
+            if self._cursor.id in ids:
+                documents = documents[ids.index(self._cursor.id) + 1 :]
+        if self._limit is not None:
+            documents = documents[: self._limit]
+        collection = _CollectionReference(self._store, self.path, self._asynchronous)
+        return [
+            _DocumentSnapshot(
+                collection.document(document_id),
+                (
+                    {k: v for k, v in data.items() if k in self._fields}
+                    if self._fields
+                    else data
+                ),
+            )
+            for document_id, data in documents
+        ]
+
+    def stream(self, transaction=None):
+        if self._asynchronous:
+
+            async def stream():
+                await asyncio.sleep(self._store.latency)
+                for snapshot in self._run():
+                    yield snapshot
+
+            self._store.operations += 1
+            return stream()
+        return iter(self._result(self._run))
+
+    def get(self, transaction=None):
+        return self._result(self._run)
+
+
+class _CollectionReference(_Query):
+    def document(self, document_id: Optional[str] = None) -> _DocumentReference:
+        return _DocumentReference(
+            self._store,
+            f"{self.path}/{document_id or uuid.uuid4().hex[:20]}",
+            self._asynchronous,
+        )
+
+    def add(self, document_data: dict, document_id: Optional[str] = None):
+        reference = self.document(document_id)
+
+        def add():
+            reference._set(document_data)
+            return datetime.now(timezone.utc), reference
+
+        return self._result(add)
+
+
+class _WriteBatch(_Reference):
+    def __init__(self, store: _Store, asynchronous: bool):
+        super().__init__(store, "", asynchronous)
+        self._writes = []
+        self._creates = []
+
+    def create(self, reference: _DocumentReference, document_data: dict):
+        self._creates.append(reference.path)
+        self._writes.append(lambda: reference._set(document_data))
+
+    def set(self, reference: _DocumentReference, document_data: dict, merge=False):
+        self._writes.append(lambda: reference._set(document_data, merge))
+
+    def update(self, reference: _DocumentReference, field_updates: dict):
+        self._writes.append(lambda: reference._update(field_updates))
+
+    def delete(self, reference: _DocumentReference):
+        self._writes.append(lambda: self._store.write(reference.path, None))
+
+    def commit(self):
+        def commit():
+            from google.api_core.exceptions import AlreadyExists
+
+            with self._store.lock:
+                # Nothing is written when a created document exists
+                for path in self._creates:
+                    if self._store.get(path) is not None:
+                        raise AlreadyExists(f"Document already exists: {path}")
+                for write in self._writes:
+                    write()
+            return []
+
+        return self._result(commit)
+
+
+class FakeFirestore:
+    """
+    In-memory Firestore client covering the calls of the gateway: documents,
+    nested collections, queries, batches and field transforms. Every call
+    waits for the latency of the store. Transactions are not supported.
+    """
+
+    def __init__(
+        self,
+        store: Optional[_Store] = None,
+        asynchronous: bool = False,
+        latency: float = 0.0,
+    ):
+        """
+        :param store: Documents shared with another client, e.g. the async one
+        :param asynchronous: Return coroutines like firestore_async clients
+        :param latency: Seconds every call of a new store takes
+        """
+        self._store = store or _Store(latency)
+        self._asynchronous = asynchronous
+
+    def async_client(self) -> "FakeFirestore":
+        # Async client on the same documents
+        return FakeFirestore(self._store, asynchronous=True)
+
+    @property
+    def operations(self) -> int:
+        return self._store.operations
+
+    def collection(self, collection_path: str) -> _CollectionReference:
+        return _CollectionReference(self._store, collection_path, self._asynchronous)
+
+    def document(self, document_path: str) -> _DocumentReference:
+        return _DocumentReference(self._store, document_path, self._asynchronous)
+
+    def batch(self) -> _WriteBatch:
+        return _WriteBatch(self._store, self._asynchronous)
+
+    def transaction(self, **kwargs):
+        raise NotImplementedError("Transactions are not supported by FakeFirestore")
+
+
+class _LocalBlob:
+    def __init__(self, bucket: "LocalBucket", name: str):
+        self._bucket = bucket
+        self.name = name
+        self.local_path = os.path.join(bucket.root, name)
+
+    @property
+    def size(self) -> Optional[int]:
+        if not os.path.exists(self.local_path):
+            return None
+        return os.path.getsize(self.local_path)
+
+    def upload_from_filename(self, filename: str):
+        time.sleep(self._bucket.latency)
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+        shutil.copyfile(filename, self.local_path)
+
+    def upload_from_string(self, data):
+        time.sleep(self._bucket.latency)
+        os.makedirs(os.path.dirname(self.local_path), exist_ok=True)
+        with open(self.local_path, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+
+    def download_to_filename(self, filename: str):
+        time.sleep(self._bucket.latency)
+        shutil.copyfile(self.local_path, filename)
+
+
+class LocalBucket:
+    # Storage bucket whose blobs are the files below a directory
+
+    def __init__(self, root: str, latency: float = 0.0):
+        self.root = root
+        self.latency = latency
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, blob_name: str) -> _LocalBlob:
+        return _LocalBlob(self, blob_name)
+
+    def get_blob(self, blob_name: str) -> Optional[_LocalBlob]:
+        blob = self.blob(blob_name)
+        return blob if os.path.exists(blob.local_path) else None
+
+
+def in_memory_qdrant():
+    """
+    Sync and async Qdrant clients sharing one in-memory store. langchain
+    searches local stores through the sync client, vectorization writes
+    through the async one.
+    :return: (QdrantClient, AsyncQdrantClient)
+    """
+    from qdrant_client import QdrantClient
+    from qdrant_client.async_qdrant_client import AsyncQdrantClient
+
+    client = QdrantClient(location=":memory:")
+    async_client = AsyncQdrantClient(location=":memory:")
+    async_client._client.collections = client._client.collections
+    async_client._client.aliases = client._client.aliases
+    return client, async_client
+
+
+def offline_id_token(uid: str) -> str:
+    # ID token accepted in place of a Firebase one once install_auth ran
+    claims = {"uid": uid, "user_id": uid, "sub": uid, "iss": "offline"}
+    return "offline." + base64.urlsafe_b64encode(json.dumps(claims).encode()).decode()
+
+
+def install_auth(latency: float = 0.0):
+    """
+    Replaces firebase_admin.auth.verify_id_token with a check of the tokens
+    made by offline_id_token. Every verification takes latency seconds.
+    """
+    from firebase_admin import auth
+
+    def verify_id_token(id_token, app=None, check_revoked=False, clock_skew_seconds=0):
+        time.sleep(latency)
+        prefix, _, encoded = str(id_token).partition(".")
+        try:
+            if prefix != "offline":
+                raise ValueError("not an offline token")
+            return json.loads(base64.urlsafe_b64decode(encoded))
+        except Exception as e:
+            raise auth.InvalidIdTokenError(f"Invalid offline ID token: {e}")
+
+    auth.verify_id_token = verify_id_token
+
+
+def _offline_credential():
+    from firebase_admin import credentials
+    from google.auth.credentials import AnonymousCredentials
+
+    class OfflineCredential(credentials.Base):
+        def get_credential(self):
+            return AnonymousCredentials()
+
+    return OfflineCredential()
+
+
+@dataclass
+class StandIns:
+    firestore: FakeFirestore
+    bucket: LocalBucket
+    qdrant: object
+
+
+def install(
+    openai_url: str,
+    bucket_root: str,
+    firestore_latency: float = 0.0,
+    storage_latency: float = 0.0,
+) -> StandIns:
+    """
+    Points the gateway modules of this process at the stand-ins. Must run
+    before the first request, messengers and clients created earlier keep
+    talking to the real services.
+    :param openai_url: Base URL of the OpenAI API, e.g. FakeOpenAIServer.url
+    :param bucket_root: Directory holding the storage blobs
+    """
+    import firebase_admin
+    from or_store import firebase
+    from or_store.firebase_storage import FirebaseStorage
+    from or_llm import orison_messenger
+    from utils import get_background_loop
+
+    # Secrets resolve from the environment instead of the secret manager
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "offline",
+            "OPENAI_API_BASE": openai_url,
+            "OPENAI_BASE_URL": openai_url,
+            "QDRANT_URL": "http://localhost",
+            "QDRANT_API_KEY": "offline",
+        }
+    )
+
+    # The gateway initializes the Firebase admin app, without credentials here
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(
+            _offline_credential(), {"projectId": "orison-offline"}
+        )
+
+    firestore_client = FakeFirestore(latency=firestore_latency)
+    firebase._firestore_client = firestore_client
+    # Requests run on the background loop, its async client is the only one used
+    firebase._async_firestore_clients[get_background_loop()] = (
+        firestore_client.async_client()
+    )
+
+    bucket = LocalBucket(bucket_root, storage_latency)
+    FirebaseStorage._bucket = staticmethod(lambda: bucket)
+
+    qdrant, async_qdrant = in_memory_qdrant()
+    orison_messenger.QdrantClient = lambda **kwargs: qdrant
+    orison_messenger.AsyncQdrantClient = lambda **kwargs: async_qdrant
+    return StandIns(firestore=firestore_client, bucket=bucket, qdrant=qdrant)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Serves the fake OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(
+        args.host,
+        args.port,
+        args.chat_latency,
+        args.embedding_latency,
+        args.jitter,
+        args.dimensions,
+        args.answer_tokens,
+    )
+    print(f"Fake OpenAI API at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
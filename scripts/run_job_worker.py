@@ -0,0 +1,134 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Runs a gateway job worker locally.
+
+Start the gateway with JOB_STORE=sqlite and run the worker next to it:
+JOB_STORE=sqlite GATEWAY_BACKGROUND_JOBS=true FUNCTION_MODE=gateway_function python main.py
+python scripts/run_job_worker.py --store sqlite
+
+Queue and follow a job without the gateway:
+python scripts/run_job_worker.py --store sqlite --enqueue summarize '{"attorneyId": "a", "applicantId": "b"}'
+python scripts/run_job_worker.py --store sqlite --status <job id>
+
+--echo replaces the handlers with one that reports progress and fails the
+first attempts, to exercise leases and retries without external services.
+"""
+
+import os
+import sys
+import json
+import asyncio
+from argparse import ArgumentParser
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+
+def echo_routes(fail_first: int, duration: float):
+    from gateway import BACKGROUND_REQUEST_TYPES
+    from request_handler import RequestHandler, OKResponse, ErrorResponse
+    from jobs import report_progress
+
+    attempts = {}
+
+    class Echo(RequestHandler):
+        def __init__(self):
+            super().__init__("Echo")
+
+        async def handle_request(self, request_json, context):
+            key = json.dumps(request_json, sort_keys=True)
+            attempts[key] = attempts.get(key, 0) + 1
+            steps = 5
+            for step in range(steps):
+                report_progress("echo", step, steps)
+                await asyncio.sleep(duration / steps)
+            if attempts[key] <= fail_first:
+                return ErrorResponse(f"Injected failure {attempts[key]}", 500)
+            return OKResponse(f"Echo: {request_json}")
+
+    return {request_type: Echo() for request_type in BACKGROUND_REQUEST_TYPES}
+
+
+async def enqueue(request_type: str, payload: dict):
+    from or_store.job_store import get_job_store, new_job
+
+    job, key_hash = new_job(request_type, payload)
+    job, queued = await get_job_store().enqueue(job, key_hash)
+    print(f"{job.job_id} {'queued' if queued else 'exists'}: {job.status}")
+
+
+async def status(job_id: str):
+    from or_store.job_store import get_job_store
+
+    job = await get_job_store().get(job_id)
+    print(job.to_json() if job else f"No job {job_id}")
+
+
+async def work(args):
+    from jobs import JobWorker
+
+    if args.echo:
+        routes = echo_routes(args.fail_first, args.duration)
+    else:
+        import main
+
+        main.init_firebase()
+        main.init_routes()
+        routes = main.routes
+    worker = JobWorker(
+        routes,
+        concurrency=args.concurrency,
+        lease=args.lease,
+        retry_delay=args.retry_delay,
+        poll_interval=args.poll_interval,
+    )
+    print(f"Worker {worker.worker_id} started")
+    await worker.run(until_idle=args.until_idle)
+    print(f"Worker {worker.worker_id} processed {worker.processed} jobs")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--store", choices=["sqlite", "firestore"], default="sqlite")
+    parser.add_argument("--path", help="SQLite job store path")
+    parser.add_argument("--enqueue", nargs=2, metavar=("REQUEST_TYPE", "PAYLOAD"))
+    parser.add_argument("--status", metavar="JOB_ID")
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    parser.add_argument("--lease", type=float, default=60)
+    parser.add_argument("--retry-delay", type=float, default=10)
+    parser.add_argument("--poll-interval", type=float, default=2)
+    parser.add_argument("--until-idle", action="store_true")
+    parser.add_argument("--echo", action="store_true")
+    parser.add_argument("--fail-first", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=2)
+    args = parser.parse_args()
+
+    # The job store reads its configuration when it is imported
+    os.environ["JOB_STORE"] = args.store
+    if args.path:
+        os.environ["JOB_STORE_PATH"] = args.path
+
+    if args.enqueue:
+        asyncio.run(enqueue(args.enqueue[0], json.loads(args.enqueue[1])))
+    elif args.status:
+        asyncio.run(status(args.status))
+    else:
+        asyncio.run(work(args))
@@ -0,0 +1,109 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Races parallel vectorize-style status updates on one applicant document and
+checks that none of them are lost.
+
+Start the Firestore emulator and point the script to it before use:
+firebase emulators:start --only firestore
+export FIRESTORE_EMULATOR_HOST=localhost:8080
+"""
+
+import os
+import sys
+import asyncio
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+import firebase_admin
+from firebase_admin import credentials
+from google.auth.credentials import AnonymousCredentials
+from or_store.firebase import FireStoreDB
+
+logging.basicConfig(level=logging.WARNING)
+_logger = logging.getLogger(__name__)
+
+COLLECTION = "applicants"
+DOCUMENT = "concurrency_test_applicant"
+
+
+class EmulatorCredential(credentials.Base):
+    def get_credential(self):
+        return AnonymousCredentials()
+
+
+def vectorize_status_updates(file_id: str, transactional: bool):
+    # Same sequence of writes as VectorizeFiles.handle_request
+    async def run():
+        client = FireStoreDB()
+        await client.update_collection_document(
+            COLLECTION, DOCUMENT, "vectorize_in_progress", file_id, transactional
+        )
+        await client.update_collection_document(
+            COLLECTION, DOCUMENT, "vectorized_files", file_id, transactional
+        )
+        await client.remove_value_from_field(
+            COLLECTION, DOCUMENT, "vectorize_in_progress", file_id, transactional
+        )
+
+    asyncio.run(run())
+
+
+def race(workers: int, transactional: bool) -> bool:
+    document = FireStoreDB().client.collection(COLLECTION).document(DOCUMENT)
+    document.set({"vectorized_files": [], "vectorize_in_progress": []})
+
+    file_ids = [f"file_{i}.pdf" for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(
+            executor.map(
+                lambda file_id: vectorize_status_updates(file_id, transactional),
+                file_ids,
+            )
+        )
+
+    data = document.get().to_dict()
+    lost = set(file_ids) - set(data["vectorized_files"])
+    passed = not lost and not data["vectorize_in_progress"]
+    mode = "transactional" if transactional else "atomic transforms"
+    print(
+        f"{mode}: {len(file_ids) - len(lost)}/{len(file_ids)} files recorded, "
+        f"{len(data['vectorize_in_progress'])} left in progress -> {'PASS' if passed else 'FAIL'}"
+    )
+    return passed
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-w", "--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("FIRESTORE_EMULATOR_HOST must point to a running Firestore emulator")
+
+    firebase_admin.initialize_app(
+        EmulatorCredential(), {"projectId": os.getenv("GCLOUD_PROJECT", "demo-orison")}
+    )
+    results = [race(args.workers, False), race(args.workers, True)]
+    sys.exit(0 if all(results) else 1)
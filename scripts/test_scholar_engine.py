@@ -0,0 +1,197 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+"""
+Runs the scholar fetch engine against recorded Google Scholar responses.
+
+Without arguments a synthetic profile is replayed with injected failures,
+and fetched once more through a cold cache by a backend that fills in place.
+Record a real profile once with --record, then replay it with --replay:
+python scripts/test_scholar_engine.py --record pXQ4_EUAAAAJ profile.json
+python scripts/test_scholar_engine.py --replay pXQ4_EUAAAAJ profile.json
+"""
+
+import os
+import sys
+import time
+import asyncio
+from argparse import ArgumentParser
+from typing import List, Optional
+
+sys.path.append(
+    os.path.join(
+        os.path.dirname(__file__), "..", "src", "orison_ai", "gateway_function"
+    )
+)
+
+from or_retriever import google_scholar
+from or_retriever.scholar_cache import ScholarCache
+from or_retriever.scholar_engine import (
+    HostRateLimiter,
+    ScholarFetchEngine,
+    ScholarlyBackend,
+    RecordedScholarBackend,
+    RecordingScholarBackend,
+)
+
+
+class InPlaceScholarBackend(RecordedScholarBackend):
+    # Fills the passed item and returns it, as scholarly does
+    def fill(self, item: dict, sections: Optional[List[str]] = None) -> dict:
+        item.update(super().fill(item, sections))
+        return item
+
+
+def synthetic_records(scholar_id: str, publications: int) -> dict:
+    listing = [
+        {
+            "container_type": "Publication",
+            "author_pub_id": f"{scholar_id}:{i}",
+            "bib": {"title": f"Publication {i}"},
+            "num_citations": i,
+        }
+        for i in range(publications)
+    ]
+    records = {
+        f"search:{scholar_id}": {
+            "container_type": "Author",
+            "scholar_id": scholar_id,
+            "name": "Applicant",
+        },
+        f"author:{scholar_id}": {
+            "container_type": "Author",
+            "scholar_id": scholar_id,
+            "name": "Applicant",
+            "coauthors": [],
+            "publications": listing,
+        },
+    }
+    for pub in listing:
+        records[f"publication:{pub['author_pub_id']}"] = {
+            **pub,
+            "bib": {**pub["bib"], "abstract": "Abstract"},
+        }
+    return records
+
+
+async def fetch(engine: ScholarFetchEngine, scholar_id: str):
+    author = await engine.fill(await engine.search_author_id(scholar_id))
+    publications, progress = await engine.fill_all(
+        author.get("publications"),
+        lambda p: print(f"\r{p}", end="", flush=True),
+    )
+    print()
+    return author, publications, progress
+
+
+def replay(scholar_id: str, backend: RecordedScholarBackend, rps: float) -> tuple:
+    engine = ScholarFetchEngine(
+        backend=backend,
+        workers=4,
+        rate_limiter=HostRateLimiter(requests_per_second=rps, jitter=0.0),
+        max_attempts=3,
+        backoff=0.05,
+    )
+    start = time.monotonic()
+    result = asyncio.run(fetch(engine, scholar_id))
+    return result, time.monotonic() - start
+
+
+def check_synthetic() -> bool:
+    scholar_id = "synthetic"
+    records = synthetic_records(scholar_id, 40)
+    # One publication recovers after a retry, one is missing entirely
+    records.pop(f"publication:{scholar_id}:7")
+    backend = RecordedScholarBackend(
+        records, latency=0.01, failures={f"publication:{scholar_id}:3": 1}
+    )
+    rps = 50.0
+    (_, publications, progress), elapsed = replay(scholar_id, backend, rps)
+
+    gaps = [b[0] - a[0] for a, b in zip(backend.calls, backend.calls[1:])]
+    checks = {
+        "all publications returned": len(publications) == 40,
+        "failed publication kept unfilled": progress.failed
+        == [f"publication:{scholar_id}:7"]
+        and "abstract" not in publications[7]["bib"],
+        "retried publication filled": publications[3]["bib"].get("abstract")
+        == "Abstract",
+        "rate limit respected": min(gaps) >= 1.0 / rps * 0.9,
+    }
+    for name, passed in checks.items():
+        print(f"{name}: {'PASS' if passed else 'FAIL'}")
+    print(f"{len(backend.calls)} requests in {elapsed:.2f}s")
+    return all(checks.values())
+
+
+def check_cold_cache() -> bool:
+    scholar_id = "synthetic"
+    records = synthetic_records(scholar_id, 10)
+    records.pop(f"publication:{scholar_id}:7")
+    engine = ScholarFetchEngine(
+        backend=InPlaceScholarBackend(records),
+        rate_limiter=HostRateLimiter(requests_per_second=0),
+        max_attempts=1,
+    )
+    cache = ScholarCache(path=":memory:")
+
+    async def reachable(url: str):
+        pass
+
+    google_scholar.url_exists = reachable
+    asyncio.run(
+        google_scholar.get_google_scholar_info(
+            "attorney",
+            "applicant",
+            f"https://scholar.google.com/citations?user={scholar_id}",
+            engine=engine,
+            progress=None,
+            cache=cache,
+        )
+    )
+    listing = records[f"author:{scholar_id}"]["publications"]
+    cached = [cache.get_publication(pub) is not None for pub in listing]
+    checks = {
+        "filled publications cached": all(cached[:7] + cached[8:]),
+        "failed publication not cached": not cached[7],
+    }
+    for name, passed in checks.items():
+        print(f"{name}: {'PASS' if passed else 'FAIL'}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--record", nargs=2, metavar=("SCHOLAR_ID", "PATH"))
+    parser.add_argument("--replay", nargs=2, metavar=("SCHOLAR_ID", "PATH"))
+    parser.add_argument("--rps", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.record:
+        scholar_id, path = args.record
+        backend = RecordingScholarBackend(ScholarlyBackend())
+        asyncio.run(fetch(ScholarFetchEngine(backend=backend), scholar_id))
+        backend.save(path)
+    elif args.replay:
+        scholar_id, path = args.replay
+        (_, _, progress), elapsed = replay(
+            scholar_id, RecordedScholarBackend.load(path), args.rps
+        )
+        print(f"{progress} in {elapsed:.2f}s")
+    else:
+        passed = check_synthetic()
+        passed = check_cold_cache() and passed
+        sys.exit(0 if passed else 1)
@@ -17,33 +17,40 @@
 # Internal
 
 from request_handler import RequestHandler, OKResponse, ErrorResponse
-from or_store.firebase import OrisonSecrets
 from exceptions import OrisonMessenger_INITIALIZATION_FAILED
-from or_llm.orison_messenger import OrisonMessenger, Prompt, DetailLevel
+from or_llm.scheduler import get_llm_scheduler, Priority
+from or_store.persistence_queue import get_persistence_queue
+from request_context import RequestContext
+from tracing import span
+from or_llm.orison_messenger import (
+    OrisonMessenger,
+    Prompt,
+    DetailLevel,
+    ESTIMATED_REQUEST_TOKENS,
+)
 
 
 class DocAssist(RequestHandler):
     def __init__(self):
         super().__init__(str(self.__class__.__qualname__))
 
-    def initialize(self, secrets):
+    async def handle_request(self, request_json, context: RequestContext):
+        logger = context.logger
         try:
-            self._orison_messenger = OrisonMessenger(secrets=secrets)
-        except Exception as e:
-            raise OrisonMessenger_INITIALIZATION_FAILED(exception=e)
-
-    async def handle_request(self, request_json):
-        try:
-            self.logger.info(f"Handling docassist request: {request_json}")
-            attorney_id = request_json["attorneyId"]
-            applicant_id = request_json["applicantId"]
+            logger.info(f"Handling docassist request: {request_json}")
+            attorney_id = context.attorney_id
+            applicant_id = context.applicant_id
             prompt_message = request_json["message"]
             tag = request_json["tag"]  # List of tags
             filename = request_json["filename"]  # List of filenames
-            secrets = OrisonSecrets.from_attorney_applicant(attorney_id, applicant_id)
-            self.logger.info("Initializing docassist secrets")
-            self.initialize(secrets)
-            self.logger.info("Generating docassist prompt")
+            logger.info("Initializing docassist secrets")
+            # Not pooled, the messenger keeps the chat memory of this conversation
+            try:
+                with span("messenger.init"):
+                    messenger = OrisonMessenger(secrets=context.secrets)
+            except Exception as e:
+                raise OrisonMessenger_INITIALIZATION_FAILED(exception=e)
+            logger.info("Generating docassist prompt")
             prompt = Prompt(
                 question=prompt_message,
                 tag=tag,
@@ -52,12 +59,20 @@ class DocAssist(RequestHandler):
                 applicant_id=applicant_id,
                 attorney_id=attorney_id,
             )
-            response = await self._orison_messenger.request(prompt, use_memory=True)
+            # Interactive messages are admitted ahead of queued screening prompts
+            response = await get_llm_scheduler().submit(
+                lambda: messenger.request(prompt, use_memory=True),
+                priority=Priority.INTERACTIVE,
+                tokens=OrisonMessenger.number_tokens(str(prompt_message))
+                + ESTIMATED_REQUEST_TOKENS,
+            )
             output_message = response.answer + f" (Source: {response.source})"
-            self.logger.info(f"Generated response from DocAssist: {output_message}")
+            logger.info(f"Generated response from DocAssist: {output_message}")
+            # Chat memory is persisted in the background
+            logger.info(f"Persistence queue: {get_persistence_queue().stats()}")
         except Exception as e:
             message = f"Error generating response from DocAssist. Error code: {type(e).__name__}. Error message: {e}"
-            self.logger.error(message, exc_info=True)
+            logger.error(message, exc_info=True)
             return ErrorResponse(message)
         return OKResponse(output_message)
 
@@ -66,14 +81,15 @@ if __name__ == "__main__":
     import asyncio
 
     docassist = DocAssist()
+    request_json = {
+        "attorneyId": "xlMsyQpatdNCTvgRfW4TcysSDgX2",
+        "applicantId": "tYdtBdc7lJHyVCxquubj",
+        "message": "Give me a summary of Rishi's skills",
+        "tag": [],
+        "filename": ["MalhanCV.pdf"],
+    }
     asyncio.run(
         docassist.handle_request(
-            {
-                "attorneyId": "xlMsyQpatdNCTvgRfW4TcysSDgX2",
-                "applicantId": "tYdtBdc7lJHyVCxquubj",
-                "message": "Give me a summary of Rishi's skills",
-                "tag": [],
-                "filename": ["MalhanCV.pdf"],
-            }
+            request_json, RequestContext(request_json).bind(docassist.logger)
         )
     )
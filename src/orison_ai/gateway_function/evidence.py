@@ -30,7 +30,7 @@ from or_llm.orison_messenger import OrisonMessenger
 
 class CoverLetterGenerator:
     def __init__(self, secrets):
-        self.llm = OrisonMessenger(secrets=secrets)._system_chain
+        self.messenger = OrisonMessenger(secrets=secrets)
 
     async def fetch_scholar_info(self, attorney_id: str, applicant_id: str) -> Dict:
         scholar_client = GoogleScholarClient()
@@ -39,7 +39,9 @@ class CoverLetterGenerator:
 
     async def fetch_screening_info(self, attorney_id: str, applicant_id: str) -> List:
         screening_client = ScreeningClient()
-        screening_info, _ = await screening_client.find_top(attorney_id, applicant_id)
+        screening_info, _ = await screening_client.find_top(
+            attorney_id, applicant_id, fields=["summary"]
+        )
         return [qna.answer for qna in screening_info.summary]
 
     async def generate_section(self, criterion: str, details: Dict) -> str:
@@ -47,13 +49,9 @@ class CoverLetterGenerator:
             f'Write a detailed cover letter section explaining how the candidate meets the following criterion: "{criterion}". '
             f"Include the provided details: {details}. Use simple language understandable by a 6th grader."
         )
-        # Ensure the response is a string
-        response = await self.llm.ainvoke(prompt)
-        return (
-            response["text"]
-            if isinstance(response, dict) and "text" in response
-            else str(response)
-        )
+        # Sections are regenerated only when the criterion or details change
+        response = await self.messenger.ainvoke(prompt, use_cache=True)
+        return str(response)
 
     async def process_evidence(self, criteria: List[str], details: Dict) -> List[str]:
         async def process_criterion(criterion):
@@ -83,8 +81,10 @@ class CoverLetterGenerator:
             "Evidence of authorship of scholarly books or articles (in scholarly journals with international circulation) in the field",
         ]
 
-        scholar_info = await self.fetch_scholar_info(attorney_id, applicant_id)
-        screening_info = await self.fetch_screening_info(attorney_id, applicant_id)
+        scholar_info, screening_info = await asyncio.gather(
+            self.fetch_scholar_info(attorney_id, applicant_id),
+            self.fetch_screening_info(attorney_id, applicant_id),
+        )
         details = {"scholar_info": scholar_info, "screening_info": screening_info}
 
         # Process evidence criteria in parallel
@@ -108,7 +108,11 @@ class CoverLetterGenerator:
 
         # Save to the database
         evidence_client = EvidenceClient()
-        evidence_letter = EvidenceBuilder(summary=full_cover_letter)
+        evidence_letter = EvidenceBuilder(
+            attorney_id=attorney_id,
+            applicant_id=applicant_id,
+            summary=full_cover_letter,
+        )
         await evidence_client.insert(
             attorney_id=attorney_id,
             applicant_id=applicant_id,
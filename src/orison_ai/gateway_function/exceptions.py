@@ -67,3 +67,15 @@ class RateLimiter_INITIALIZATION_FAILED(Exception):
     ):
         self.message = message + " . Error: " + str(exception)
         super().__init__(self.message)
+
+
+class DOCUMENT_NOT_FOUND(LookupError):
+    def __init__(self, message="Document not found", exception="UNKNOWN"):
+        self.message = message + " . Error: " + str(exception)
+        super().__init__(self.message)
+
+
+class INVALID_DOCUMENT(Exception):
+    def __init__(self, message="Invalid document", exception="UNKNOWN"):
+        self.message = message + " . Error: " + str(exception)
+        super().__init__(self.message)
@@ -32,6 +32,13 @@ from or_store.db_interfaces import (
 from or_retriever.google_scholar import (
     get_google_scholar_info,
 )
+from or_retriever.scholar_engine import FetchProgress
+from jobs import report_progress
+from request_context import RequestContext
+
+
+def _report_progress(progress: FetchProgress):
+    report_progress("publications", progress.done, progress.total)
 
 
 class FetchScholar(RequestHandler):
@@ -44,6 +51,7 @@ class FetchScholar(RequestHandler):
                 attorney_id=user_request.attorney_id,
                 applicant_id=user_request.applicant_id,
                 scholar_link=user_request.scholar_link,
+                progress=_report_progress,
             )
         except Exception as e:
             self.logger.error(f"Failed to generate google scholar database. Error: {e}")
@@ -56,7 +64,7 @@ class FetchScholar(RequestHandler):
             self.logger.error(f"Failed to insert google scholar data. Error: {e}")
             raise e
 
-    async def handle_request(self, request_json):
+    async def handle_request(self, request_json, context: RequestContext):
         # Convert JSON to UserRequest dataclass
         if request_json:
             user_request = GoogleScholarRequest(
@@ -72,7 +80,7 @@ class FetchScholar(RequestHandler):
             client = GoogleScholarClient()
         except Exception as e:
             message = f"Failed to connect to the database. Error: {e}"
-            self.logger.error(message)
+            context.logger.error(message)
             return ErrorResponse(f"Internal Server Error: {message}")
 
         # Download the Google Scholar page
@@ -82,11 +90,13 @@ class FetchScholar(RequestHandler):
                 attorney_id=user_request.attorney_id,
                 applicant_id=user_request.applicant_id,
                 doc=scholar_info,
+                # Retried jobs replace the document of the failed attempt
+                doc_id=context.job_id,
             )
             return OKResponse(
                 f"Scholar info:\n{scholar_info.to_json()} \nsaved with ID: {id}."
             )
         except Exception as e:
             message = f"Failed to download Google Scholar page. Error: {e}"
-            self.logger.error(message)
+            context.logger.error(message)
             return ErrorResponse(f"Internal Server Error: {message}", 500)
@@ -16,7 +16,9 @@
 
 # External
 
+import os
 import asyncio
+from datetime import datetime, timedelta, timezone
 from request_handler import (
     RequestHandler,
     ErrorResponse,
@@ -25,69 +27,122 @@ from request_handler import (
 
 # Internal
 
-from or_store.models import SimplifiedScholarSummary, GoogleScholarNetworkDB
+from or_store.models import NetworkNode
 from or_store.db_interfaces import (
     GoogleScholarNetworkClient,
 )
-from or_retriever.google_scholar import gather_network, extract_user
+from or_retriever.google_scholar import (
+    ScholarSummary,
+    gather_network,
+    extract_user,
+    summarize_scholar,
+)
+from jobs import report_progress
+from request_context import RequestContext
+
+# Stored scholars are fetched again once they are older than this
+NETWORK_NODE_TTL = timedelta(
+    seconds=float(os.getenv("NETWORK_NODE_TTL", str(7 * 24 * 3600)))
+)
+
+
+def _is_fresh(node: NetworkNode, count_publications: bool, now: datetime) -> bool:
+    return (
+        node.fetched_at is not None
+        and now - node.fetched_at < NETWORK_NODE_TTL
+        and (node.publication_count is not None or not count_publications)
+    )
 
 
 class FetchScholarNetwork(RequestHandler):
     def __init__(self):
         super().__init__(str(self.__class__.__qualname__))
 
-    async def handle_request(self, request_json):
+    async def handle_request(self, request_json, context: RequestContext):
         # Convert JSON to UserRequest dataclass
         if request_json:
             attorney_id = request_json["attorneyId"]
             applicant_id = request_json["applicantId"]
             scholar_link = request_json["scholarLink"]
-
             scholar_id = extract_user(scholar_link)
-            seen_scholar_ids = set()
-            scholar_summaries_tmp = await gather_network(
-                scholar_id, depth=1, seen_scholar_ids=seen_scholar_ids
-            )
-            simplified_scholar_summaries = list(
-                map(
-                    lambda summary: SimplifiedScholarSummary(
-                        name=summary.name,
-                        scholar_id=summary.scholar_id,
-                        hindex=summary.hindex,
-                        citations=summary.citedby,
-                        publication_count=summary.publication_count,
-                    ),
-                    scholar_summaries_tmp,
-                )
-            )
-            # scholar_summaries = list(map(simplified_scholar_summary, scholar_summaries_tmp))
-            scholar_network_entry = GoogleScholarNetworkDB(
-                network=simplified_scholar_summaries
-            )
         else:
             return ErrorResponse("Could not parse input to JSON")
 
         # Attempt connection to the database
         try:
             client = GoogleScholarNetworkClient()
+            previous = await client.get_snapshot(attorney_id, applicant_id, scholar_id)
         except Exception as e:
             message = f"Failed to connect to the database. Error: {e}"
-            self.logger.error(message)
+            context.logger.error(message)
             return ErrorResponse(f"Internal Server Error: {message}")
 
-        # Insert data into scholar network database
+        # Only stale scholars and new co-authors are fetched again
+        known = previous.nodes if previous is not None else {}
+        now = datetime.now(timezone.utc)
+        reused = set()
+        visited = []
+
+        async def summarize(node_id: str, count_publications: bool = True):
+            visited.append(node_id)
+            report_progress("scholars", len(visited))
+            node = known.get(node_id)
+            if node is None or not _is_fresh(node, count_publications, now):
+                return await summarize_scholar(node_id, count_publications)
+            reused.add(node_id)
+            return ScholarSummary(
+                name=node.name,
+                scholar_id=node_id,
+                publication_count=node.publication_count,
+                hindex=node.hindex,
+                hindex_5y=None,
+                citedby=node.citations,
+                citedby_5y=None,
+                coauthor_ids=node.coauthor_ids,
+            )
+
+        try:
+            crawl = await gather_network(scholar_id, summarize=summarize)
+        except Exception as e:
+            message = f"Failed to gather Google Scholar network. Error: {e}"
+            context.logger.error(message)
+            return ErrorResponse(f"Internal Server Error: {message}", 500)
+
+        nodes = {
+            summary.scholar_id: NetworkNode(
+                scholar_id=summary.scholar_id,
+                name=summary.name,
+                citations=summary.citedby,
+                hindex=summary.hindex,
+                publication_count=summary.publication_count,
+                coauthor_ids=summary.coauthor_ids,
+                depth=crawl.depths[summary.scholar_id],
+                fetched_at=(
+                    known[summary.scholar_id].fetched_at
+                    if summary.scholar_id in reused
+                    else now
+                ),
+            )
+            for summary in crawl.summaries
+        }
+
+        # Write the changed scholars of the network
         try:
-            scholar_network_entry.attorney_id = attorney_id
-            scholar_network_entry.applicant_id = applicant_id
-            id = await client.insert(
+            written = await client.save_snapshot(
                 attorney_id=attorney_id,
                 applicant_id=applicant_id,
-                doc=scholar_network_entry,
+                root_scholar_id=scholar_id,
+                nodes=nodes,
+                previous=previous,
             )
-            return OKResponse(
-                f"Scholar info:\n{scholar_network_entry.to_json()} \nsaved with ID: {id}."
+            message = (
+                f"Scholar network of {len(nodes)} scholars saved with ID: {scholar_id}. "
+                f"{len(nodes) - len(reused)} fetched, {len(reused)} reused, "
+                f"{written} written."
             )
+            context.logger.info(message)
+            return OKResponse(message)
         except Exception as e:
             message = f"Failed to write Google Scholar network. Error: {e}"
-            self.logger.error(message)
+            context.logger.error(message)
             return ErrorResponse(f"Internal Server Error: {message}", 500)
@@ -16,21 +16,33 @@
 
 # External
 
+import os
+import time
+import asyncio
 import logging
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, Coroutine
+from typing import Any, Coroutine, Optional
 
 # Internal
 
 from request_handler import (
     RequestHandler,
     ErrorResponse,
+    AcceptedResponse,
+    BatchResponse,
 )
+from or_store.job_store import JobStore, new_job
+from request_context import RequestContext
+from tracing import span
+from metrics import GATEWAY_REQUESTS, HANDLER_SECONDS
+from or_llm.token_usage import track_usage
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
 
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+
 
 def _str_to_enum(enum_class, string):
     # Helper function to convert a string to an enum member
@@ -51,6 +63,16 @@ class GatewayRequestType(Enum):
     SUMMARIZE = "summarize"
     DOCASSIST = "docassist"
     CoverLetterGenerator = "evidence"
+    BATCH = "batch"
+
+
+# Requests answered with a job ID and processed by a job worker
+BACKGROUND_REQUEST_TYPES = {
+    GatewayRequestType.GOOGLE_SCHOLAR,
+    GatewayRequestType.GOOGLE_SCHOLAR_NETWORK,
+    GatewayRequestType.VECTORIZE_FILES,
+    GatewayRequestType.SUMMARIZE,
+}
 
 
 @dataclass
@@ -63,10 +85,115 @@ class GatewayRequest:
         self.or_request_type = _str_to_enum(GatewayRequestType, self.or_request_type)
 
 
+async def dispatch(
+    routes: dict[GatewayRequestType, RequestHandler],
+    gateway_request: GatewayRequest,
+    context: RequestContext,
+    job_store: Optional[JobStore] = None,
+) -> dict:
+    # Runs a parsed request. Background requests are queued in the job store if one is given
+    status = 500
+    try:
+        result = await _route(routes, gateway_request, context, job_store)
+        status = result["status"]
+        return result
+    finally:
+        GATEWAY_REQUESTS.inc(gateway_request.or_request_type.value, str(status))
+
+
+async def _route(
+    routes: dict[GatewayRequestType, RequestHandler],
+    gateway_request: GatewayRequest,
+    context: RequestContext,
+    job_store: Optional[JobStore],
+) -> dict:
+    if gateway_request.or_request_type == GatewayRequestType.BATCH:
+        return await _dispatch_batch(
+            routes, gateway_request.or_request_payload, context, job_store
+        )
+    if gateway_request.or_request_type not in routes:
+        return ErrorResponse("Requested route not implemented")
+    if (
+        job_store is not None
+        and gateway_request.or_request_type in BACKGROUND_REQUEST_TYPES
+    ):
+        job, key_hash = new_job(
+            gateway_request.or_request_type.value, gateway_request.or_request_payload
+        )
+        job, queued = await job_store.enqueue(job, key_hash)
+        context.logger.info(
+            f"Job {job.job_id} {'queued' if queued else 'already exists'}: {job.status}"
+        )
+        return AcceptedResponse(f"Job {job.status}", job.job_id)
+    handler = routes[gateway_request.or_request_type]
+    payload = gateway_request.or_request_payload
+    request_type = gateway_request.or_request_type.value
+    with span(
+        "handler",
+        {"request.type": request_type, "applicant.id": payload.get("applicantId")},
+    ) as handler_span:
+        with track_usage(
+            request_type,
+            context.request_id,
+            payload.get("attorneyId"),
+            payload.get("applicantId"),
+        ):
+            result = await handler.handle_request(payload, context.bind(handler.logger))
+        handler_span.set_attribute("http.status_code", result["status"])
+    HANDLER_SECONDS.observe(handler_span.duration_ms / 1000.0, request_type)
+    return result
+
+
+async def _dispatch_batch(
+    routes: dict[GatewayRequestType, RequestHandler],
+    payload: dict,
+    context: RequestContext,
+    job_store: Optional[JobStore],
+) -> dict:
+    # Sub-requests run concurrently and share the secrets and messengers of the batch
+    items = payload.get("requests") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return ErrorResponse("Batch payload needs a non-empty list of requests")
+    if len(items) > BATCH_MAX_REQUESTS:
+        return ErrorResponse(
+            f"Batch of {len(items)} requests exceeds the limit of {BATCH_MAX_REQUESTS}"
+        )
+
+    async def run(index: int, item) -> dict:
+        try:
+            gateway_request = GatewayRequest(**item)
+        except Exception as e:
+            GATEWAY_REQUESTS.inc("invalid", "400")
+            return ErrorResponse(f"Could not parse input to GatewayRequest: {e}")
+        if gateway_request.or_request_type == GatewayRequestType.BATCH:
+            return ErrorResponse("Batches cannot be nested")
+        child = context.child(gateway_request.or_request_payload, index)
+        try:
+            return await dispatch(routes, gateway_request, child, job_store)
+        except Exception as e:
+            child.logger.error(f"Batch request {gateway_request} failed: {e}")
+            return ErrorResponse(f"{type(e).__name__}: {e}", 500)
+
+    start_time = time.monotonic()
+    results = await asyncio.gather(
+        *(run(index, item) for index, item in enumerate(items))
+    )
+    succeeded = sum(1 for result in results if result["status"] < 300)
+    context.logger.info(
+        f"Batch of {len(items)} requests took {time.monotonic() - start_time:.2f}s, "
+        f"{succeeded} succeeded"
+    )
+    return BatchResponse(f"{succeeded}/{len(items)} requests succeeded", results)
+
+
 async def router(
-    routes: dict[GatewayRequestType, RequestHandler], request
+    routes: dict[GatewayRequestType, RequestHandler],
+    request,
+    job_store: Optional[JobStore] = None,
+    claims: Optional[dict] = None,
 ) -> Coroutine[Any, Any, Any]:
     # Function to route the incoming request to the appropriate handler based the given routes
+    # claims are those of the verified ID token of the caller
 
     async def as_async(err):
         return err
@@ -80,11 +207,13 @@ async def router(
         gateway_request = GatewayRequest(**(request_json["data"]))
         _logger.info(f"Parsed GatewayRequest type: {gateway_request}")
     except Exception as e:
+        GATEWAY_REQUESTS.inc("invalid", "400")
         return await as_async(
             ErrorResponse(f"Could not parse input to GatewayRequest: {e}")
         )
-    if gateway_request.or_request_type not in routes:
-        return await as_async(ErrorResponse("Requested route not implemented"))
-    return await routes[gateway_request.or_request_type].handle_request(
-        gateway_request.or_request_payload
-    )
+    context = RequestContext(
+        payload=gateway_request.or_request_payload,
+        claims=claims,
+        request_id=request.headers.get("X-Request-Id"),
+    ).bind(_logger)
+    return await dispatch(routes, gateway_request, context, job_store)
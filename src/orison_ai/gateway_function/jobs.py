@@ -0,0 +1,243 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+# Internal
+
+from gateway import GatewayRequestType
+from request_handler import RequestHandler, ErrorResponse
+from request_context import RequestContext
+from or_store.models import Job, JobProgress
+from or_store.job_store import JobStore, get_job_store
+from tracing import trace_request
+from metrics import HANDLER_SECONDS, JOBS
+from or_llm.token_usage import track_usage
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "10"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "5"))
+# Jobs a worker invocation runs at once
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "1"))
+
+
+class _RunningJob:
+    def __init__(self, job: Job):
+        self.job = job
+        self.progress = job.progress
+        self.lease_lost = False
+
+
+_running_job: ContextVar[Optional[_RunningJob]] = ContextVar(
+    "running_job", default=None
+)
+
+
+def report_progress(
+    stage: str, done: Optional[int] = None, total: Optional[int] = None
+):
+    """
+    Records the progress of the job the caller runs in. The worker writes it
+    to the job document with the next lease renewal. No-op outside of jobs.
+    """
+    running = _running_job.get()
+    if running is not None:
+        running.progress = JobProgress(stage=stage, done=done, total=total)
+
+
+class JobWorker:
+    """
+    Claims queued jobs and runs them with the gateway handlers. Leases are
+    renewed while a handler runs; a handler whose lease was lost is cancelled.
+    Attempts that raised or returned a server error are retried with
+    exponential backoff until the job runs out of attempts. Client errors fail
+    the job at once, a retry would get the same answer.
+    """
+
+    def __init__(
+        self,
+        routes: dict[GatewayRequestType, RequestHandler],
+        store: Optional[JobStore] = None,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        lease: float = JOB_LEASE_SECONDS,
+        retry_delay: float = JOB_RETRY_DELAY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        progress_interval: float = JOB_PROGRESS_INTERVAL,
+    ):
+        self._routes = routes
+        self._store = store or get_job_store()
+        self._concurrency = concurrency
+        self._lease = lease
+        self._retry_delay = retry_delay
+        self._poll_interval = poll_interval
+        self._progress_interval = progress_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.processed = 0
+
+    async def run(
+        self,
+        stop: Optional[asyncio.Event] = None,
+        deadline: Optional[float] = None,
+        until_idle: bool = False,
+    ):
+        """
+        Processes jobs until stopped
+        :param stop: Set to stop claiming jobs
+        :param deadline: time.monotonic() after which no job is claimed
+        :param until_idle: Stop once no job is available
+        """
+        stop = stop or asyncio.Event()
+
+        async def slot():
+            while not stop.is_set() and (
+                deadline is None or time.monotonic() < deadline
+            ):
+                if await self.run_once():
+                    continue
+                if until_idle:
+                    return
+                try:
+                    await asyncio.wait_for(stop.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        await asyncio.gather(*(slot() for _ in range(self._concurrency)))
+
+    async def run_once(self) -> bool:
+        """
+        Claims and processes one job
+        :return: False if no job was available
+        """
+        job = await self._store.claim(self.worker_id, self._lease)
+        if job is None:
+            return False
+        await self._process(job)
+        self.processed += 1
+        return True
+
+    async def _process(self, job: Job):
+        _logger.info(
+            f"Job {job.job_id} ({job.request_type}) attempt {job.attempts}/{job.max_attempts}"
+        )
+        try:
+            handler = self._routes[GatewayRequestType(job.request_type)]
+        except (KeyError, ValueError):
+            await self._store.finish(
+                job, error=f"No handler for request type {job.request_type}"
+            )
+            return
+
+        context = RequestContext(
+            payload=job.payload, request_id=job.job_id[:12], job_id=job.job_id
+        ).bind(handler.logger)
+        running = _RunningJob(job)
+        with trace_request(
+            "job",
+            {
+                "request.type": job.request_type,
+                "applicant.id": job.applicant_id,
+                "job.id": job.job_id,
+                "job.attempt": job.attempts,
+            },
+        ) as root, track_usage(
+            job.request_type,
+            context.request_id,
+            job.attorney_id,
+            job.applicant_id,
+            job.job_id,
+        ):
+            token = _running_job.set(running)
+            # The handler task copies the context holding the running job and its trace
+            task = asyncio.create_task(handler.handle_request(job.payload, context))
+            _running_job.reset(token)
+            heartbeat = asyncio.create_task(self._heartbeat(running, task))
+            start_time = time.monotonic()
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if not running.lease_lost:
+                    raise
+                _logger.warning(f"Job {job.job_id} cancelled after its lease was lost")
+                JOBS.inc(job.request_type, "lost")
+                return
+            except Exception as e:
+                result = ErrorResponse(f"{type(e).__name__}: {e}", 500)
+            finally:
+                heartbeat.cancel()
+            root.set_attribute("http.status_code", result["status"])
+
+        elapsed = time.monotonic() - start_time
+        HANDLER_SECONDS.observe(elapsed, job.request_type)
+        if result["status"] < 300:
+            finished = await self._store.finish(job, result=result["message"])
+            JOBS.inc(job.request_type, "succeeded")
+            _logger.info(f"Job {job.job_id} succeeded in {elapsed:.2f}s")
+        elif result["status"] >= 500 and job.attempts < job.max_attempts:
+            retry_at = datetime.now(timezone.utc) + timedelta(
+                seconds=self._retry_delay * 2 ** (job.attempts - 1)
+            )
+            finished = await self._store.finish(
+                job, error=result["message"], retry_at=retry_at
+            )
+            JOBS.inc(job.request_type, "retried")
+            _logger.warning(
+                f"Job {job.job_id} failed in {elapsed:.2f}s, retrying at {retry_at}: "
+                f"{result['message']}"
+            )
+        else:
+            finished = await self._store.finish(job, error=result["message"])
+            JOBS.inc(job.request_type, "failed")
+            _logger.error(f"Job {job.job_id} failed: {result['message']}")
+        if not finished:
+            _logger.warning(f"Job {job.job_id} outcome dropped, the lease was lost")
+
+    async def _heartbeat(self, running: _RunningJob, task: asyncio.Task):
+        # Writes progress as it changes and renews the lease well before it expires
+        renewed_at = time.monotonic()
+        written = running.progress
+        while True:
+            await asyncio.sleep(min(self._progress_interval, self._lease / 3))
+            if (
+                running.progress == written
+                and time.monotonic() - renewed_at < self._lease / 3
+            ):
+                continue
+            progress = running.progress
+            try:
+                owned = await self._store.renew(running.job, self._lease, progress)
+            except Exception as e:
+                _logger.error(f"Failed to renew job {running.job.job_id}: {e}")
+                continue
+            if not owned:
+                running.lease_lost = True
+                task.cancel()
+                return
+            renewed_at = time.monotonic()
+            written = progress
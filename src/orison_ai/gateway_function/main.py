@@ -16,8 +16,8 @@
 
 # External
 import os
+import time
 import logging
-import asyncio
 from flask import Request
 
 # GCP
@@ -25,25 +25,51 @@ from functions_framework import create_app, http
 
 # Firebase
 from firebase_admin import auth
+from google.oauth2 import id_token
+from google.auth.exceptions import GoogleAuthError
+from google.auth.transport import requests as google_requests
 
 # Internal
-from or_store.firebase import get_firebase_admin_app
+from or_store.firebase import get_firebase_admin_app, get_firestore_client
 from fetch_scholar import FetchScholar
 from fetch_scholar_network import FetchScholarNetwork
-from summarize import Summarize
+from summarize import Summarize, DEFAULT_QUESTIONNAIRE
 from docassist import DocAssist
 
 # from evidence import CoverLetterGenerator
 from vectorize_files import VectorizeFiles, DeleteFileVectors
 from gateway import GatewayRequestType, router
+from jobs import JobWorker
+from or_store.job_store import get_job_store
+from or_store.persistence_queue import flush_on_sigterm
+from utils import run_in_background_loop
+from tracing import span, trace_request
+import metrics
 
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
+# Queued writes are flushed when the instance is shut down
+flush_on_sigterm()
 
 firebase_app = None
 routes = None
 
+# Long running requests are queued for job_worker_function instead of answered inline.
+# Only enable once job_worker_function is deployed and scheduled, see the README.
+GATEWAY_BACKGROUND_JOBS = (
+    os.getenv("GATEWAY_BACKGROUND_JOBS", "false").lower() == "true"
+)
+# Seconds a job_worker_function invocation keeps claiming jobs
+JOB_WORKER_DEADLINE = float(os.getenv("JOB_WORKER_DEADLINE", "480"))
+# job_worker_function only runs for OIDC tokens issued for its URL to these service accounts
+JOB_WORKER_AUDIENCE = os.getenv("JOB_WORKER_AUDIENCE", "")
+JOB_WORKER_INVOKERS = {
+    email.strip()
+    for email in os.getenv("JOB_WORKER_INVOKERS", "").split(",")
+    if email.strip()
+}
+
 CORS_PREFLIGHT_HEADERS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
@@ -68,6 +94,8 @@ def init_routes():
             GatewayRequestType.DOCASSIST: DocAssist(),
             # GatewayRequestType.CoverLetterGenerator: CoverLetterGenerator(),
         }
+        # Screenings start without a Firestore round trip for the questionnaire
+        Summarize.templates.warm([DEFAULT_QUESTIONNAIRE])
         _logger.info("Initializing routes....DONE")
 
 
@@ -79,6 +107,7 @@ def init_firebase():
     else:
         _logger.info("Getting firebase admin app.")
         firebase_app = get_firebase_admin_app()
+        get_firestore_client()
     _logger.info("Getting firebase admin app....DONE")
 
 
@@ -89,10 +118,36 @@ def verify_bearer_token(request: Request):
         raise ValueError("Authorization header missing")
 
     token = auth_header.split(" ")[1]
-    decoded_token = auth.verify_id_token(token)
+    with span("auth.verify_token"):
+        decoded_token = auth.verify_id_token(token)
     return decoded_token
 
 
+def verify_worker_token(request: Request):
+    """
+    Verifies the Google-signed OIDC token of a job_worker_function call, as
+    sent by Cloud Scheduler. Refuses every call unless the audience and the
+    invoking service accounts are configured.
+    """
+    if not JOB_WORKER_AUDIENCE or not JOB_WORKER_INVOKERS:
+        raise ValueError("JOB_WORKER_AUDIENCE and JOB_WORKER_INVOKERS are not set")
+    auth_header = request.headers.get("Authorization") or ""
+    scheme, _, token = auth_header.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise ValueError("Authorization header missing")
+
+    with span("auth.verify_worker_token"):
+        claims = id_token.verify_oauth2_token(
+            token, google_requests.Request(), audience=JOB_WORKER_AUDIENCE
+        )
+    if (
+        not claims.get("email_verified")
+        or claims.get("email") not in JOB_WORKER_INVOKERS
+    ):
+        raise ValueError(f"{claims.get('email')} may not run jobs")
+    return claims
+
+
 @http
 def gateway_function(request: Request):
     global CORS_PREFLIGHT_HEADERS
@@ -110,20 +165,32 @@ def gateway_function(request: Request):
 
     try:
         _logger.info(f"Gateway received request: {request.json}")
+        data = (request.json or {}).get("data") or {}
+        payload = data.get("or_request_payload") or {}
 
-        init_firebase()
-        verify_bearer_token(request)
-        init_routes()
+        # The background loop runs the router in a copy of the request's context
+        with trace_request(
+            "gateway",
+            {
+                "request.type": data.get("or_request_type"),
+                "applicant.id": payload.get("applicantId"),
+            },
+        ) as root:
+            init_firebase()
+            claims = verify_bearer_token(request)
+            init_routes()
 
-        _logger.info("Token verified. Sending request to router.")
-        result = asyncio.run(router(routes, request))
-        code = result["status"]
+            _logger.info("Token verified. Sending request to router.")
+            job_store = get_job_store() if GATEWAY_BACKGROUND_JOBS else None
+            result = run_in_background_loop(router(routes, request, job_store, claims))
+            code = result["status"]
+            root.set_attribute("http.status_code", code)
 
         return (
             {
                 "data": (
-                    {"message": result["message"]}
-                    if code == 200
+                    {key: value for key, value in result.items() if key != "status"}
+                    if 200 <= code < 300
                     else {"Internal Server Error": result["message"]}
                 )
             },
@@ -153,10 +220,45 @@ def gateway_function_staging(request: Request):
     return gateway_function(request)
 
 
+def metrics_endpoint():
+    # Metrics of this instance in the Prometheus text format
+    return (metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE})
+
+
+@http
+def job_worker_function(request: Request):
+    """
+    Processes queued jobs until none is left or JOB_WORKER_DEADLINE passes.
+    Invoked on a schedule, jobs of workers that time out are claimed again
+    once their lease expires. Callers need an OIDC token, see verify_worker_token.
+    """
+    try:
+        verify_worker_token(request)
+    except (ValueError, GoogleAuthError) as e:
+        _logger.error(f"Job worker authentication error: {e}")
+        return ({"error": "Unauthorized"}, 401)
+
+    try:
+        init_firebase()
+        init_routes()
+        worker = JobWorker(routes)
+        run_in_background_loop(
+            worker.run(deadline=time.monotonic() + JOB_WORKER_DEADLINE, until_idle=True)
+        )
+        return ({"processed": worker.processed}, 200)
+    except Exception as e:
+        _logger.error(f"ERROR: {e}")
+        return ({"error": str(e)}, 500)
+
+
 if __name__ == "__main__":
     function_mode = os.getenv("FUNCTION_MODE", "gateway_function")
     if function_mode == "gateway_function":
         app = create_app(gateway_function)
     elif function_mode == "gateway_function_staging":
         app = create_app(gateway_function_staging)
+    elif function_mode == "job_worker_function":
+        app = create_app(job_worker_function)
+    # Takes precedence over the catch-all route of the function
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint, methods=["GET"])
     app.run(port=int(os.environ.get("PORT", 8080)), host="0.0.0.0", debug=True)
@@ -0,0 +1,267 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import math
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Collection costs a dictionary update under a lock per sample
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(ABC):
+    TYPE = None
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _labels(self, label_values: Tuple, extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(value)}"'
+            for name, value in zip(self.label_names, label_values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        pass
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.TYPE}",
+        ]
+        return "\n".join(lines + self._samples())
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def inc(self, *label_values, amount: float = 1.0):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [
+            f"{self.name}{self._labels(labels)} {_format(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(_Metric):
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._function = None
+
+    def set(self, value: float, *label_values):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[label_values] = value
+
+    def set_function(self, function: Callable[[], float]):
+        # Read when rendered, for values that change without an event to record
+        self._function = function
+
+    def value(self, *label_values) -> float:
+        if self._function is not None and not label_values:
+            return self._function()
+        return self._values.get(label_values, 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        if self._function is not None:
+            values = [((), self._function())]
+        return [
+            f"{self.name}{self._labels(labels)} {_format(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        if not METRICS_ENABLED:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                # Count per bucket, sum and count of the observations
+                state = self._values[label_values] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                    0,
+                ]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *label_values) -> int:
+        state = self._values.get(label_values)
+        return state[2] if state else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [
+                (labels, (list(state[0]), state[1], state[2]))
+                for labels, state in self._values.items()
+            ]
+        lines = []
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                bucket_labels = self._labels(labels, 'le="' + _format(bound) + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_format(total)}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {count}")
+        return lines
+
+
+def render() -> str:
+    # All metrics of the process in the Prometheus text exposition format
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+def clear():
+    for metric in _registry:
+        metric.clear()
+
+
+GATEWAY_REQUESTS = Counter(
+    "orison_gateway_requests_total",
+    "Gateway requests by request type and response status, batch items included",
+    ["request_type", "status"],
+)
+HANDLER_SECONDS = Histogram(
+    "orison_handler_duration_seconds",
+    "Time a handler took to answer a request or run a job",
+    ["request_type"],
+)
+JOBS = Counter(
+    "orison_jobs_total",
+    "Finished job attempts by outcome: succeeded, retried, failed or lost",
+    ["request_type", "outcome"],
+)
+SPAN_SECONDS = Histogram(
+    "orison_span_duration_seconds",
+    "Duration of the traced operations, Firestore, Qdrant and storage calls included",
+    ["span"],
+)
+LLM_TOKENS = Counter(
+    "orison_llm_tokens_total",
+    "Tokens sent to and received from the OpenAI chat and embedding models",
+    ["model", "direction"],
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "orison_embedding_batch_size",
+    "Texts per embedding request",
+    buckets=SIZE_BUCKETS,
+)
+RATE_LIMITER_WAIT_SECONDS = Histogram(
+    "orison_rate_limiter_wait_seconds",
+    "Time spent waiting for a rate limiter",
+    ["limiter"],
+)
+CACHE_REQUESTS = Counter(
+    "orison_cache_requests_total",
+    "Cache lookups by cache and result, hit or miss",
+    ["cache", "result"],
+)
+
+PERSISTENCE_QUEUE_DEPTH = Gauge(
+    "orison_persistence_queue_depth",
+    "Writes waiting in the persistence queue, the running ones included",
+)
+PERSISTENCE_QUEUE_LAG_SECONDS = Gauge(
+    "orison_persistence_queue_lag_seconds",
+    "Age of the oldest write waiting in the persistence queue",
+)
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
@@ -0,0 +1,228 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import json
+import sqlite3
+import hashlib
+import logging
+import datetime
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Sequence
+from langchain_core.caches import BaseCache
+from langchain_core.outputs import Generation
+from langchain_core.load import dumps, loads
+
+# Internal
+
+from or_store.firebase import FireStoreDB
+from metrics import cache_lookup
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE", "memory").lower()
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "/tmp/llm_cache.sqlite")
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE", "2048"))
+LLM_CACHE_COLLECTION = "llm_cache"
+
+
+def cache_key(llm_string: str, prompt: str) -> str:
+    """
+    Build the exact-match key of an LLM call.
+    :param llm_string: Serialized model parameters (model name, temperature, ...)
+    :param prompt: Fully rendered prompt
+    :return: Hex digest identifying the call
+    """
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMCacheStore(ABC):
+    """
+    Key/value storage behind the LLM cache. Values are serialized generations.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+
+class InMemoryLRUStore(LLMCacheStore):
+    def __init__(self, max_size: int = LLM_CACHE_MAX_SIZE):
+        self._max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteStore(LLMCacheStore):
+    def __init__(self, path: str = LLM_CACHE_PATH):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, date_created TEXT)"
+            )
+            self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, date_created) VALUES (?, ?, ?)",
+                (key, value, datetime.datetime.utcnow().isoformat()),
+            )
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM llm_cache")
+            self._connection.commit()
+
+
+class FirestoreStore(LLMCacheStore):
+    def __init__(self, collection_name: str = LLM_CACHE_COLLECTION):
+        self._collection = FireStoreDB().client.collection(collection_name)
+
+    def get(self, key: str) -> Optional[str]:
+        doc = self._collection.document(key).get()
+        if not doc.exists:
+            return None
+        return doc.to_dict().get("value")
+
+    def set(self, key: str, value: str):
+        self._collection.document(key).set(
+            {"value": value, "date_created": datetime.datetime.utcnow()}
+        )
+
+    def clear(self):
+        for doc in self._collection.stream():
+            doc.reference.delete()
+
+
+class LLMCache(BaseCache):
+    """
+    Exact-match cache of LLM generations. Keys hash the model parameters
+    (model name, temperature, ...) together with the fully rendered prompt,
+    so only calls that would be sent verbatim to the model share an entry.
+    """
+
+    def __init__(self, store: LLMCacheStore, name: str = "llm"):
+        self._store = store
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        try:
+            value = self._store.get(cache_key(llm_string, prompt))
+        except Exception as e:
+            logger.warning(f"LLM cache lookup failed. Treating as miss. Error: {e}")
+            value = None
+        cache_lookup(self.name, value is not None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        generations = [loads(generation) for generation in json.loads(value)]
+        for generation in generations:
+            # Cached answers cost no tokens, keep them out of the usage counts
+            message = getattr(generation, "message", None)
+            if getattr(message, "usage_metadata", None) is not None:
+                message.usage_metadata = None
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]):
+        try:
+            value = json.dumps([dumps(generation) for generation in return_val])
+            self._store.set(cache_key(llm_string, prompt), value)
+        except Exception as e:
+            logger.warning(f"LLM cache update failed. Error: {e}")
+
+    def clear(self, **kwargs):
+        self._store.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    Process-wide LLM cache selected through the LLM_CACHE environment variable:
+    memory (default), sqlite, firestore or none.
+    """
+    global _llm_cache
+
+    if _llm_cache is not None or LLM_CACHE_BACKEND == "none":
+        return _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            match LLM_CACHE_BACKEND:
+                case "sqlite":
+                    store = SQLiteStore()
+                case "firestore":
+                    store = FirestoreStore()
+                case _:
+                    store = InMemoryLRUStore()
+            _llm_cache = LLMCache(store=store, name=LLM_CACHE_BACKEND)
+            logger.info(f"LLM cache initialized with backend: {LLM_CACHE_BACKEND}")
+    return _llm_cache
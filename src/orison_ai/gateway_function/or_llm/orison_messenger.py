@@ -16,11 +16,13 @@
 
 # External
 
+import time
 import uuid
+import asyncio
 import numpy as np
 import logging
 import tiktoken
-from typing import Union
+from typing import Union, Optional
 from collections import defaultdict
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import (
@@ -38,6 +40,7 @@ from qdrant_client.async_qdrant_client import AsyncQdrantClient
 from qdrant_client import QdrantClient
 from langchain_qdrant import Qdrant
 from langchain_openai import OpenAIEmbeddings
+from pydantic import BaseModel, Field
 from dataclasses import dataclass
 from enum import Enum
 from qdrant_client.http import models
@@ -52,7 +55,11 @@ from exceptions import (
     QDrant_INITIALIZATION_FAILED,
     Retriever_INITIALIZATION_FAILED,
 )
-from or_store.db_interfaces import ChatMemoryClient
+from or_store.conversation_cache import get_conversation_cache
+from or_llm.llm_cache import LLMCache, get_llm_cache
+from tracing import span
+from metrics import EMBEDDING_BATCH_SIZE, RATE_LIMITER_WAIT_SECONDS
+from or_llm.token_usage import TokenUsageCallback, add_embedding_usage
 
 
 logging.basicConfig(level=logging.INFO)
@@ -62,6 +69,9 @@ MODEL_NAME = "gpt-4o"
 EMBEDDING_MODEL = "text-embedding-ada-002"
 RETRIEVAL_DOC_LIMIT = 10
 CHAT_HISTORY_LIMIT = 10
+# Rough token cost of one request: retrieved chunks, query variants and the answer
+ESTIMATED_REQUEST_TOKENS = RETRIEVAL_DOC_LIMIT * 512 + 1024
+INVALID_RESPONSE = "Invalid response from AI. Either data is missing or question is not applicable to you."
 
 
 @dataclass
@@ -76,6 +86,16 @@ class Prompt:
     attorney_id: str = None
 
 
+class ValidatedAnswer(BaseModel):
+    """Answer to the question along with whether the context supports it"""
+
+    answer: str = Field(description="Answer to the question")
+    applicable: bool = Field(
+        description="True if the answer is even a little bit appropriate response to the question "
+        "based on the given context. False if the data is missing or the question is not applicable."
+    )
+
+
 class DetailLevel(Enum):
     LIGHT = "light detail"
     MODERATE = "moderate detail"
@@ -97,6 +117,22 @@ class DetailLevel(Enum):
         raise ValueError(f"No matching DetailLevel for keyword: {keyword}")
 
 
+class TimedRateLimiter(InMemoryRateLimiter):
+    # Records how long callers wait for a token
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        start = time.perf_counter()
+        acquired = super().acquire(blocking=blocking)
+        RATE_LIMITER_WAIT_SECONDS.observe(time.perf_counter() - start, "openai")
+        return acquired
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        start = time.perf_counter()
+        acquired = await super().aacquire(blocking=blocking)
+        RATE_LIMITER_WAIT_SECONDS.observe(time.perf_counter() - start, "openai")
+        return acquired
+
+
 class OrisonEmbeddings(OpenAIEmbeddings):
     rate_limiter: InMemoryRateLimiter
 
@@ -104,13 +140,23 @@ class OrisonEmbeddings(OpenAIEmbeddings):
         # Allow arbitrary types like InMemoryRateLimiter to be used
         arbitrary_types_allowed = True
 
+    def _add_usage(self, texts: models.List[str]):
+        # Accounting must not fail embeddings that succeeded
+        try:
+            add_embedding_usage(self.model, texts)
+        except Exception as e:
+            logger.warning(f"Failed to count embedding tokens. Error: {e}")
+
     def embed_query(self, text: str):
         try:
             token_acquired = True
             if self.rate_limiter:
                 token_acquired = self.rate_limiter.acquire()
             if token_acquired:
-                embeddings = super().embed_query(text)
+                EMBEDDING_BATCH_SIZE.observe(1)
+                with span("embeddings", {"embeddings.texts": 1}):
+                    embeddings = super().embed_query(text)
+                self._add_usage([text])
             return embeddings
         except Exception as e:
             logger.error(f"Failed to get embeddings for text: {text}. Error: {e}")
@@ -122,7 +168,10 @@ class OrisonEmbeddings(OpenAIEmbeddings):
             if self.rate_limiter:
                 token_acquired = await self.rate_limiter.aacquire()
             if token_acquired:
-                embeddings = await super().aembed_query(text)
+                EMBEDDING_BATCH_SIZE.observe(1)
+                with span("embeddings", {"embeddings.texts": 1}):
+                    embeddings = await super().aembed_query(text)
+                self._add_usage([text])
             return embeddings
         except Exception as e:
             logger.error(f"Failed to get embeddings for text: {text}. Error: {e}")
@@ -134,7 +183,10 @@ class OrisonEmbeddings(OpenAIEmbeddings):
             if self.rate_limiter:
                 token_acquired = self.rate_limiter.acquire()
             if token_acquired:
-                embeddings = super().embed_documents(texts, chunk_size)
+                EMBEDDING_BATCH_SIZE.observe(len(texts))
+                with span("embeddings", {"embeddings.texts": len(texts)}):
+                    embeddings = super().embed_documents(texts, chunk_size)
+                self._add_usage(texts)
             return embeddings
         except Exception as e:
             logger.error(f"Failed to get embeddings for texts: {texts}. Error: {e}")
@@ -148,7 +200,10 @@ class OrisonEmbeddings(OpenAIEmbeddings):
             if self.rate_limiter:
                 token_acquired = await self.rate_limiter.aacquire()
             if token_acquired:
-                embeddings = await super().aembed_documents(texts, chunk_size)
+                EMBEDDING_BATCH_SIZE.observe(len(texts))
+                with span("embeddings", {"embeddings.texts": len(texts)}):
+                    embeddings = await super().aembed_documents(texts, chunk_size)
+                self._add_usage(texts)
             return embeddings
         except Exception as e:
             logger.error(f"Failed to get embeddings for texts: {texts}. Error: {e}")
@@ -173,10 +228,13 @@ class OrisonMessenger:
         max_tokens: int = 4096,
         max_retries: int = 5,
         memory_window_size: int = CHAT_HISTORY_LIMIT,
+        llm_cache: Optional[LLMCache] = None,
+        shared: bool = False,
         **kwargs,
     ):
+        # Shared messengers answer requests of several applicants and keep no chat memory
         try:
-            self._rate_limiter = InMemoryRateLimiter(
+            self._rate_limiter = TimedRateLimiter(
                 requests_per_second=7,  # Value which throttles the requests
                 check_every_n_seconds=0.1,
                 max_bucket_size=1,  # Controls the maximum burst size. We don't want to allow burst requests.
@@ -184,12 +242,17 @@ class OrisonMessenger:
         except Exception as e:
             raise RateLimiter_INITIALIZATION_FAILED(exception=e)
 
+        self.model = model
         try:
-            self.chat_memory_client = ChatMemoryClient()
-            self.memory = ConversationBufferWindowMemory(
-                k=memory_window_size,  # Keep track of the last `k` interactions
-                memory_key="chat_history",  # Key for the memory in the prompt
-                return_messages=True,
+            self.conversation_cache = get_conversation_cache()
+            self.memory = (
+                None
+                if shared
+                else ConversationBufferWindowMemory(
+                    k=memory_window_size,  # Keep track of the last `k` interactions
+                    memory_key="chat_history",  # Key for the memory in the prompt
+                    return_messages=True,
+                )
             )
             self._system_prompt = ChatPromptTemplate(
                 messages=[
@@ -205,15 +268,27 @@ class OrisonMessenger:
                 max_tokens=max_tokens,
                 timeout=90.0,
                 rate_limiter=self._rate_limiter,
+                callbacks=[TokenUsageCallback(model)],
                 **kwargs,
             )
+            # Call sites opt into caching by using the cached model instead
+            self._llm_cache = llm_cache or get_llm_cache()
+            self._cached_chat_bot = (
+                self._chat_bot.model_copy(update={"cache": self._llm_cache})
+                if self._llm_cache
+                else self._chat_bot
+            )
             self._parser = StrOutputParser()
-            self._system_chain = LLMChain(
-                llm=self._chat_bot,
-                prompt=self._system_prompt,
-                verbose=False,
-                output_parser=self._parser,
-                memory=self.memory,
+            self._system_chain = (
+                None
+                if shared
+                else LLMChain(
+                    llm=self._chat_bot,
+                    prompt=self._system_prompt,
+                    verbose=False,
+                    output_parser=self._parser,
+                    memory=self.memory,
+                )
             )
             self._embeddings = OrisonEmbeddings(
                 model=embedding_model,
@@ -317,18 +392,55 @@ class OrisonMessenger:
         result = " and ".join(pairs)
         return result
 
+    async def ainvoke(self, text: str, use_cache: bool = False) -> str:
+        """
+        Send a single message through the system prompt without touching the chat memory
+        :param text: Message to send
+        :param use_cache: Serve identical prompts from the LLM cache
+        :return: Text response of the LLM
+        """
+        chat_bot = self._cached_chat_bot if use_cache else self._chat_bot
+        chain = self._system_prompt | chat_bot | self._parser
+        with span("llm.call", {"llm.model": self.model, "llm.cached": use_cache}):
+            return await chain.ainvoke({"text": text, "chat_history": []})
+
+    async def ainvoke_validated(
+        self, text: str, use_cache: bool = False
+    ) -> ValidatedAnswer:
+        """
+        Send a single message and get the answer together with an applicability flag in one call
+        :param text: Message to send
+        :param use_cache: Serve identical prompts from the LLM cache
+        :return: Structured answer of the LLM
+        """
+        chat_bot = self._cached_chat_bot if use_cache else self._chat_bot
+        chain = self._system_prompt | chat_bot.with_structured_output(ValidatedAnswer)
+        with span(
+            "llm.call",
+            {"llm.model": self.model, "llm.cached": use_cache, "llm.validated": True},
+        ):
+            return await chain.ainvoke({"text": text, "chat_history": []})
+
     async def request(
         self,
         prompt: Prompt,
         use_memory: bool = False,
+        use_cache: bool = False,
+        validate: bool = False,
     ):
         """
         Request the LLM to answer a question
         :param prompt: Prompt object
         :param use_memory: Use memory to store the context
+        :param use_cache: Serve identical query generation and answer calls from the LLM cache
+        :param validate: Let the same call flag answers that are not applicable to the question
         :return: Answer to the question
         :rtype: QandA
         """
+        if use_memory and self.memory is None:
+            raise RuntimeError(
+                "Shared messengers keep no chat memory, chats need their own messenger"
+            )
 
         query = prompt.question
         detail_level = prompt.detail_level
@@ -366,7 +478,7 @@ class OrisonMessenger:
                 retriever=self.vectordb.as_retriever(
                     search_kwargs={"k": RETRIEVAL_DOC_LIMIT, "filter": filter},
                 ),
-                llm=self._chat_bot,
+                llm=self._cached_chat_bot if use_cache else self._chat_bot,
             )
         except Exception as e:
             raise Retriever_INITIALIZATION_FAILED(exception=e)
@@ -374,7 +486,26 @@ class OrisonMessenger:
         if isinstance(detail_level, str):
             detail_level = DetailLevel.from_keyword(detail_level)
 
-        retrieved_docs = await retriever.ainvoke(query)
+        # Load the chat history from Firestore while documents are retrieved
+        load_memory = None
+        if use_memory:
+            load_memory = asyncio.ensure_future(
+                self.conversation_cache.load_into_buffer(
+                    memory_buffer=self.memory,
+                    attorney_id=prompt.attorney_id,
+                    applicant_id=prompt.applicant_id,
+                    window_size=CHAT_HISTORY_LIMIT,
+                )
+            )
+        try:
+            # Includes the LLM call generating the query variants
+            with span("retrieval") as retrieval_span:
+                retrieved_docs = await retriever.ainvoke(query)
+                retrieval_span.set_attribute("retrieval.documents", len(retrieved_docs))
+        except Exception:
+            if load_memory is not None:
+                load_memory.cancel()
+            raise
         logger.info(
             f"Retrieved {len(retrieved_docs)} documents from the query: {query}"
         )
@@ -392,24 +523,31 @@ class OrisonMessenger:
             "Checking if context exceeds max tokens. Truncating if required...DONE"
         )
         text = f"Given the context: \n{context}, \n answer the following: {query} in {detail_level.value}."
-        if use_memory:
-            await self.chat_memory_client.load_memory_into_buffer(
-                memory_buffer=self.memory,
-                applicant_id=prompt.applicant_id,
-                attorney_id=prompt.attorney_id,
-                window_size=CHAT_HISTORY_LIMIT,
-            )
-        chain_response = await self._system_chain.ainvoke({"text": text})
-        response = chain_response.get("text")
+        if load_memory is not None:
+            await load_memory
+        if validate and not use_memory:
+            validated = await self.ainvoke_validated(text, use_cache=use_cache)
+            if not validated.applicable:
+                return QandA(
+                    question=prompt.question, answer=INVALID_RESPONSE, source="N/A"
+                )
+            response = validated.answer
+        elif use_cache and not use_memory:
+            response = await self.ainvoke(text, use_cache=True)
+        elif self.memory is None:
+            response = await self.ainvoke(text)
+        else:
+            with span("llm.call", {"llm.model": self.model, "llm.memory": use_memory}):
+                chain_response = await self._system_chain.ainvoke({"text": text})
+            response = chain_response.get("text")
         if use_memory:
             await self.memory.asave_context(
                 inputs={"question": query}, outputs={"answer": response}
             )
-            await self.chat_memory_client.update_memory(
-                applicant_id=prompt.applicant_id,
+            await self.conversation_cache.append(
                 attorney_id=prompt.attorney_id,
+                applicant_id=prompt.applicant_id,
                 user_message=query,
                 assistant_response=response,
-                window_size=CHAT_HISTORY_LIMIT,
             )
         return QandA(question=prompt.question, answer=response, source=source)
@@ -0,0 +1,198 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from enum import IntEnum
+from collections import deque
+from typing import Any, Awaitable, Callable
+from openai import RateLimitError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "300000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+TOKEN_WINDOW_SECONDS = 60.0
+
+
+class Priority(IntEnum):
+    # Lower value is admitted first
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class LLMScheduler:
+    """
+    Admits LLM jobs under a concurrency limit and a tokens-per-minute budget.
+    Waiting jobs are admitted by priority and then in arrival order, so
+    interactive DocAssist messages overtake queued screening prompts.
+    Jobs failing with a rate limit error are retried with jittered backoff.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be greater than 0")
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self._in_flight = 0
+        self._waiting = []  # heap of (priority, sequence, tokens, future)
+        self._sequence = itertools.count()
+        self._token_window = deque()  # (admission time, tokens)
+        self._timer = None
+        self._timer_loop = None
+
+    def _tokens_in_window(self, now: float) -> int:
+        while self._token_window and (
+            now - self._token_window[0][0] >= TOKEN_WINDOW_SECONDS
+        ):
+            self._token_window.popleft()
+        return sum(tokens for _, tokens in self._token_window)
+
+    def _admissible(self, tokens: int, now: float) -> bool:
+        if self._in_flight >= self.max_concurrency:
+            return False
+        used = self._tokens_in_window(now)
+        # A single job larger than the budget is admitted once the window is empty
+        return used + tokens <= self.tokens_per_minute or not self._token_window
+
+    def _dispatch(self, from_timer: bool = False):
+        if from_timer:
+            self._timer = None
+        now = time.monotonic()
+        while self._waiting:
+            _, _, tokens, future = self._waiting[0]
+            if future.done() or future.get_loop().is_closed():
+                heapq.heappop(self._waiting)
+                continue
+            if not self._admissible(tokens, now):
+                break
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            self._token_window.append((now, tokens))
+            future.set_result(None)
+        if self._timer is not None and self._timer_loop.is_closed():
+            self._timer = None
+        if (
+            self._waiting
+            and self._in_flight < self.max_concurrency
+            and self._token_window
+            and self._timer is None
+        ):
+            # Token budget exhausted. Retry once the oldest admission leaves the window.
+            delay = TOKEN_WINDOW_SECONDS - (now - self._token_window[0][0])
+            self._timer_loop = asyncio.get_running_loop()
+            self._timer = self._timer_loop.call_later(
+                max(delay, 0.01), self._dispatch, True
+            )
+
+    async def _acquire(self, priority: Priority, tokens: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiting, (int(priority), next(self._sequence), tokens, future)
+        )
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    @staticmethod
+    def _backoff(attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, BACKOFF_BASE_SECONDS)
+            except ValueError:
+                pass
+        # Full jitter keeps retries of parallel prompts from synchronizing
+        return random.uniform(
+            0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+        )
+
+    async def submit(
+        self,
+        job: Callable[[], Awaitable[Any]],
+        priority: Priority = Priority.BATCH,
+        tokens: int = 0,
+    ) -> Any:
+        """
+        Run a job once admitted
+        :param job: Coroutine function performing the LLM work. Called again on retries.
+        :param priority: Priority of the job
+        :param tokens: Estimated number of tokens consumed by the job
+        :return: Result of the job
+        """
+        attempt = 0
+        while True:
+            await self._acquire(priority, tokens)
+            try:
+                return await job()
+            except RateLimitError as e:
+                if attempt >= self.max_retries:
+                    raise e
+                delay = self._backoff(attempt, e)
+                logger.warning(
+                    f"Rate limited by LLM provider. Retrying in {delay:.2f}s. Attempt {attempt + 1}/{self.max_retries}"
+                )
+            finally:
+                self._release()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiting),
+            "tokens_in_window": self._tokens_in_window(time.monotonic()),
+        }
+
+
+_scheduler = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    # Process-wide scheduler shared by all handlers
+    global _scheduler
+
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
@@ -0,0 +1,193 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import json
+import uuid
+import logging
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import tiktoken
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Internal
+
+from metrics import LLM_TOKENS
+from tracing import current_span
+from or_store.models import ModelUsage, TokenUsage
+from or_store.usage_store import get_usage_recorder
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# USD per million prompt and completion tokens. Versioned model names match
+# the longest listed prefix. LLM_PRICES adds or replaces entries, e.g.
+# {"gpt-4o": [2.5, 10.0]}
+LLM_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "text-embedding-ada-002": (0.1, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+LLM_PRICES.update(
+    {
+        model: tuple(prices)
+        for model, prices in json.loads(os.getenv("LLM_PRICES", "{}")).items()
+    }
+)
+
+_current_usage: ContextVar[Optional[TokenUsage]] = ContextVar(
+    "current_usage", default=None
+)
+
+
+def prices(model: str) -> Tuple[float, float]:
+    """
+    :return: USD per million prompt and completion tokens, zero for unknown models
+    """
+    for name in sorted(LLM_PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return LLM_PRICES[name]
+    return 0.0, 0.0
+
+
+def add_usage(model: str, prompt_tokens: int, completion_tokens: int = 0):
+    """
+    Adds the tokens of one model call to the metrics and to the usage of the
+    request the caller runs in
+    """
+    if prompt_tokens:
+        LLM_TOKENS.inc(model, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.inc(model, "completion", amount=completion_tokens)
+    usage = _current_usage.get()
+    if usage is None:
+        return
+    model_usage = usage.models.get(model)
+    if model_usage is None:
+        model_usage = usage.models[model] = ModelUsage()
+    prompt_price, completion_price = prices(model)
+    model_usage.calls += 1
+    model_usage.prompt_tokens += prompt_tokens
+    model_usage.completion_tokens += completion_tokens
+    model_usage.cost_usd += (
+        prompt_tokens * prompt_price + completion_tokens * completion_price
+    ) / 1e6
+
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def add_embedding_usage(model: str, texts: List[str]):
+    # The embeddings API does not return usage through langchain, the input is counted instead
+    encoding = _encoding(model)
+    add_usage(model, sum(len(encoding.encode(text)) for text in texts))
+
+
+@contextmanager
+def track_usage(
+    request_type: str,
+    request_id: Optional[str] = None,
+    attorney_id: Optional[str] = None,
+    applicant_id: Optional[str] = None,
+    job_id: Optional[str] = None,
+):
+    """
+    Collects the tokens spent by the enclosed request. When it ends the usage
+    is added to the current span and queued for the usage collection.
+    """
+    usage = TokenUsage(
+        usage_id=uuid.uuid4().hex,
+        request_id=request_id,
+        request_type=request_type,
+        attorney_id=attorney_id,
+        applicant_id=applicant_id,
+        job_id=job_id,
+    )
+    token = _current_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _current_usage.reset(token)
+        if usage.models:
+            current = current_span()
+            if current is not None:
+                for name in ("prompt_tokens", "completion_tokens", "cost_usd"):
+                    current.set_attribute(
+                        f"llm.{name}",
+                        sum(getattr(m, name) for m in usage.models.values()),
+                    )
+            try:
+                get_usage_recorder().record(usage)
+            except Exception as e:
+                logger.error(f"Failed to record token usage. Error: {e}")
+
+
+def response_usage(response: LLMResult) -> Tuple[int, int]:
+    """
+    Prompt and completion tokens billed for a chat model response. Responses
+    served from the LLM cache carry no usage.
+    :return: (prompt tokens, completion tokens)
+    """
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(
+                getattr(generation, "message", None), "usage_metadata", None
+            )
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens:
+        # Older integrations only report the usage of the whole call
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = token_usage.get("prompt_tokens", 0)
+        completion_tokens = token_usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """
+    Records the tokens of every response of the chat model it is attached
+    to, including the calls made by retrievers and structured output chains.
+    """
+
+    # Runs in the task of the call, which holds the usage of its request
+    run_inline = True
+
+    def __init__(self, model: str):
+        self.model = model
+
+    def on_llm_end(self, response: LLMResult, **kwargs):
+        try:
+            prompt_tokens, completion_tokens = response_usage(response)
+        except Exception as e:
+            logger.warning(f"Failed to read token usage. Error: {e}")
+            return
+        if prompt_tokens or completion_tokens:
+            model = (response.llm_output or {}).get("model_name") or self.model
+            add_usage(model, prompt_tokens, completion_tokens)
@@ -16,14 +16,22 @@
 
 # External
 
+import os
+import time
 import logging
 import asyncio
-from scholarly import scholarly
-from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
 
 # Internal
 
 from or_store.models import GoogleScholarDB, Publication, Author
+from or_retriever.scholar_engine import (
+    FetchProgress,
+    ScholarFetchEngine,
+    get_scholar_engine,
+)
+from or_retriever.scholar_cache import CacheCoverage, ScholarCache, get_scholar_cache
 from or_retriever.helpers import (
     url_exists,
     INVALID_URL,
@@ -36,14 +44,56 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _type_of_paper(detailed_pub: dict) -> str:
+    venues = [
+        detailed_pub.get("bib").get("citation"),
+        detailed_pub.get("bib").get("publisher"),
+    ]
+    if "journal" in venues:
+        return "Journal"
+    elif "conference" in venues:
+        return "Conference"
+    elif "article" in venues:
+        return "Article"
+    return "Unknown"
+
+
+def _publication(detailed_pub: dict) -> Publication:
+    return Publication(
+        title=detailed_pub.get("bib").get("title"),
+        authors=detailed_pub.get("bib").get("author"),
+        abstract=detailed_pub.get("bib").get("abstract"),
+        cited_by=detailed_pub.get("num_citations"),
+        forum_name=detailed_pub.get("citation"),
+        year=detailed_pub.get("bib").get("pub_year"),
+        type_of_paper=_type_of_paper(detailed_pub),
+        peer_reviews=detailed_pub.get("bib").get("journal"),
+    )
+
+
+def _log_progress(progress: FetchProgress):
+    if progress.done == progress.total or progress.done % 10 == 0:
+        logger.info(f"Publications: {progress}")
+
+
 async def get_google_scholar_info(
-    attorney_id: str, applicant_id: str, scholar_link: str
+    attorney_id: str,
+    applicant_id: str,
+    scholar_link: str,
+    engine: Optional[ScholarFetchEngine] = None,
+    progress: Optional[Callable[[FetchProgress], None]] = _log_progress,
+    cache: Optional[ScholarCache] = None,
 ):
     """
     Extract information from a Google Scholar profile.
     :param scholar_link: The link to the Google Scholar profile
+    :param engine: Fetch engine running the Google Scholar requests
+    :param progress: Called after every publication is fetched
+    :param cache: Author and publication records reused across fetches
     :return: A GoogleScholarDB object containing the extracted information
     """
+    engine = engine or get_scholar_engine()
+    cache = cache or get_scholar_cache()
 
     if not scholar_link.startswith("http"):
         scholar_link = "http://" + scholar_link
@@ -61,10 +111,16 @@ async def get_google_scholar_info(
     else:
         logger.info(f"User ID found: {scholar_id}")
 
-    # Fetch data from the Google Scholar profile
-    author = scholarly.search_author_id(scholar_id)
-    # Fill the author object with more detailed information, including publications
-    author = scholarly.fill(author)
+    coverage = CacheCoverage()
+    author = cache.get_author(scholar_id)
+    if author is None:
+        # Fetch data from the Google Scholar profile
+        author = await engine.search_author_id(scholar_id)
+        # Fill the author object with more detailed information, including publications
+        author = await engine.fill(author)
+        cache.set_author(scholar_id, author)
+    else:
+        coverage.author_cached = True
 
     co_authors = []
     for co_author in author.get("coauthors"):
@@ -76,41 +132,28 @@ async def get_google_scholar_info(
             )
         )
 
-    with ThreadPoolExecutor() as executor:
-        detailed_publications = executor.map(
-            lambda x: scholarly.fill(x), author.get("publications")
+    # Only publications missing from the cache or cited differently are filled
+    listing = author.get("publications")
+    cached = [cache.get_publication(pub) for pub in listing]
+    stale = [pub for pub, hit in zip(listing, cached) if hit is None]
+    coverage.publications = len(listing)
+    coverage.publications_cached = len(listing) - len(stale)
+
+    # Publications that fail to fill keep the details of the profile listing
+    filled, fetch_progress = await engine.fill_all(stale, progress)
+    if fetch_progress.failed:
+        logger.warning(
+            f"Scholar {scholar_id}: {len(fetch_progress.failed)} publications "
+            f"stored without details"
         )
+    # Publications kept unfilled are fetched again next time
+    cache.set_publications([pub for pub in filled if fetch_progress.succeeded(pub)])
+    logger.info(f"Scholar {scholar_id} cache coverage: {coverage}")
 
-        publications = []
-        for detailed_pub in detailed_publications:
-            type_of_paper = "Unknown"
-            if "journal" in [
-                detailed_pub.get("bib").get("citation"),
-                detailed_pub.get("bib").get("publisher"),
-            ]:
-                type_of_paper = "Journal"
-            elif "conference" in [
-                detailed_pub.get("bib").get("citation"),
-                detailed_pub.get("bib").get("publisher"),
-            ]:
-                type_of_paper = "Conference"
-            elif "article" in [
-                detailed_pub.get("bib").get("citation"),
-                detailed_pub.get("bib").get("publisher"),
-            ]:
-                type_of_paper = "Article"
-            publications.append(
-                Publication(
-                    title=detailed_pub.get("bib").get("title"),
-                    authors=detailed_pub.get("bib").get("author"),
-                    abstract=detailed_pub.get("bib").get("abstract"),
-                    cited_by=detailed_pub.get("num_citations"),
-                    forum_name=detailed_pub.get("citation"),
-                    year=detailed_pub.get("bib").get("pub_year"),
-                    type_of_paper=type_of_paper,
-                    peer_reviews=detailed_pub.get("bib").get("journal"),
-                )
-            )
+    filled = iter(filled)
+    publications = [
+        _publication(hit if hit is not None else next(filled)) for hit in cached
+    ]
 
     return GoogleScholarDB(
         attorney_id=attorney_id,
@@ -133,15 +176,23 @@ async def get_google_scholar_info(
     )
 
 
-from dataclasses import dataclass
-from typing import List, Dict, Set
+NETWORK_DEPTH = int(os.getenv("NETWORK_DEPTH", "1"))
+NETWORK_MAX_NODES = int(os.getenv("NETWORK_MAX_NODES", "150"))
+NETWORK_WORKERS = int(os.getenv("NETWORK_WORKERS", "4"))
+NETWORK_NODE_TIMEOUT = float(os.getenv("NETWORK_NODE_TIMEOUT", "60"))
+# Stop crawling in time to store the network within the Cloud Function timeout
+NETWORK_DEADLINE = float(os.getenv("NETWORK_DEADLINE", "420"))
+# Publication lists are only fetched for scholars up to this depth
+NETWORK_COUNT_PUBLICATIONS_DEPTH = int(
+    os.getenv("NETWORK_COUNT_PUBLICATIONS_DEPTH", "1")
+)
 
 
 @dataclass
 class ScholarSummary:
     name: str
     scholar_id: str
-    publication_count: int
+    publication_count: Optional[int]
     hindex: int
     hindex_5y: int
     citedby: int
@@ -149,18 +200,36 @@ class ScholarSummary:
     coauthor_ids: List[str]
 
 
-def summarize_scholar(scholar_id: str) -> ScholarSummary:
-    # Fetch data from the Google Scholar profile
-    data = scholarly.search_author_id(scholar_id)
-    # Fill the author object with more detailed information, including publications
-    data = scholarly.fill(
-        data, sections=["basics", "indices", "coauthors", "publications"]
-    )
+async def summarize_scholar(
+    scholar_id: str,
+    count_publications: bool = True,
+    engine: Optional[ScholarFetchEngine] = None,
+    cache: Optional[ScholarCache] = None,
+) -> ScholarSummary:
+    """
+    Summarize a Google Scholar profile
+    :param count_publications: Fetch the publication list to count publications.
+        Without it only the profile page is fetched and the count is None
+    """
+    engine = engine or get_scholar_engine()
+    cache = cache or get_scholar_cache()
+    sections = ["basics", "indices", "coauthors"]
+    if count_publications:
+        sections.append("publications")
+    data = cache.get_author(scholar_id, sections)
+    if data is None:
+        # Fetch data from the Google Scholar profile
+        data = await engine.search_author_id(scholar_id)
+        # Fill the author object with the requested sections only
+        data = await engine.fill(data, sections=sections)
+        cache.set_author(scholar_id, data, sections)
 
     return ScholarSummary(
         name=data.get("name"),
         scholar_id=scholar_id,
-        publication_count=len(data.get("publications")),
+        publication_count=(
+            len(data.get("publications")) if count_publications else None
+        ),
         hindex=data.get("hindex"),
         hindex_5y=data.get("hindex5y"),
         citedby=data.get("citedby"),
@@ -171,43 +240,108 @@ def summarize_scholar(scholar_id: str) -> ScholarSummary:
     )
 
 
-async def gather_network(scholar_id: str, depth: int, seen_scholar_ids: Set[str]):
-    if scholar_id in seen_scholar_ids:
-        # print(f"\nAlready seen scholar {scholar_id}")
-        return []
-    seen_scholar_ids.add(scholar_id)
-    if depth == 0:
-        return [summarize_scholar(scholar_id)]
-    elif depth > 0:
-        scholar_summary = summarize_scholar(scholar_id)
-        summary = [scholar_summary]
-        tasks = list(
-            map(
-                lambda x: gather_network(x, depth - 1, seen_scholar_ids),
-                scholar_summary.coauthor_ids,
-            )
+@dataclass
+class NetworkCrawl:
+    summaries: List[ScholarSummary] = field(default_factory=list)
+    # Number of co-author hops from the root by scholar_id
+    depths: Dict[str, int] = field(default_factory=dict)
+    failed: List[str] = field(default_factory=list)
+    # Scholars left out because of the node budget or the deadline
+    truncated: int = 0
+
+    def __str__(self):
+        return (
+            f"{len(self.summaries)} scholars, {len(self.failed)} failed, "
+            f"{self.truncated} left out"
         )
-        others = await asyncio.gather(*tasks)
-        retval = []
-        for item_list in others:
-            for item in item_list:
-                retval.append(item)
-        retval.append(scholar_summary)
-        return retval
+
+
+async def gather_network(
+    scholar_id: str,
+    depth: int = NETWORK_DEPTH,
+    max_nodes: int = NETWORK_MAX_NODES,
+    workers: int = NETWORK_WORKERS,
+    node_timeout: float = NETWORK_NODE_TIMEOUT,
+    deadline: float = NETWORK_DEADLINE,
+    count_publications_depth: int = NETWORK_COUNT_PUBLICATIONS_DEPTH,
+    summarize: Optional[Callable[..., Awaitable[ScholarSummary]]] = None,
+) -> NetworkCrawl:
+    """
+    Breadth first crawl of the co-author network of a scholar. Every scholar
+    is summarized once, by a bounded pool of workers.
+    :param scholar_id: Scholar at the root of the network
+    :param depth: Number of co-author hops from the root
+    :param max_nodes: Maximum number of scholars summarized
+    :param workers: Number of scholars summarized concurrently
+    :param node_timeout: Seconds after which a scholar is given up
+    :param deadline: Seconds after which no new scholar is started
+    :param count_publications_depth: Deepest level whose publications are counted
+    :param summarize: Summarizes one scholar, defaults to summarize_scholar
+    """
+    summarize = summarize or summarize_scholar
+    crawl = NetworkCrawl()
+    seen = {scholar_id}
+    queue = asyncio.Queue()
+    queue.put_nowait((scholar_id, 0))
+    stop_at = time.monotonic() + deadline
+    summaries = {}  # scholar_id -> summary, in order of discovery
+    order = [scholar_id]
+
+    async def visit(node_id: str, level: int):
+        try:
+            summary = await asyncio.wait_for(
+                summarize(
+                    node_id, count_publications=level <= count_publications_depth
+                ),
+                node_timeout,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to summarize scholar {node_id}. Error: {e!r}")
+            crawl.failed.append(node_id)
+            return
+        summaries[node_id] = summary
+        crawl.depths[node_id] = level
+        if level == depth:
+            return
+        for coauthor_id in summary.coauthor_ids:
+            if not coauthor_id or coauthor_id in seen:
+                continue
+            if len(seen) >= max_nodes:
+                crawl.truncated += 1
+                continue
+            seen.add(coauthor_id)
+            order.append(coauthor_id)
+            queue.put_nowait((coauthor_id, level + 1))
+
+    async def worker():
+        while True:
+            node_id, level = await queue.get()
+            try:
+                if time.monotonic() >= stop_at:
+                    crawl.truncated += 1
+                else:
+                    await visit(node_id, level)
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+    try:
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+    crawl.summaries = [summaries[i] for i in order if i in summaries]
+    logger.info(f"Network of scholar {scholar_id} to depth {depth}: {crawl}")
+    return crawl
 
 
 async def main():
     url = "https://scholar.google.com/citations?user=pXQ4_EUAAAAJ"
     scholar_id = extract_user(url)
-    summary = summarize_scholar(scholar_id)
+    summary = await summarize_scholar(scholar_id)
     print(summary)
-    # seen = set()
-    # network = await gather_network(scholar_id, 1, seen)
-    # import json
-    # json.dump(summary, open("author_summary.json", "w"))
-    # print(network)
-    # print("\n")
-    # print(seen)
+    # network = await gather_network(scholar_id, depth=1)
+    # print(network.summaries)
 
 
 if __name__ == "__main__":
@@ -18,6 +18,7 @@
 
 import traceback
 import re
+import asyncio
 import requests
 import traceback
 import logging
@@ -61,7 +62,8 @@ async def url_exists(url: str):
         if url == "":
             raise ValueError("URL is empty")
 
-        requests.head(url, allow_redirects=True, timeout=5)
+        # requests is blocking, keep it off the event loop
+        await asyncio.to_thread(requests.head, url, allow_redirects=True, timeout=5)
 
     except ValueError as e:
         message = f"Invalid URL: {e}"
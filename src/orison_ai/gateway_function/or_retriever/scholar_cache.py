@@ -0,0 +1,183 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from enum import Enum
+from dataclasses import dataclass
+from typing import List, Optional
+
+# Internal
+
+from metrics import cache_lookup
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHOLAR_CACHE_PATH = os.getenv("SCHOLAR_CACHE_PATH", "/tmp/scholar_cache.sqlite")
+SCHOLAR_AUTHOR_TTL = float(os.getenv("SCHOLAR_AUTHOR_TTL", str(24 * 3600)))
+SCHOLAR_PUBLICATION_TTL = float(
+    os.getenv("SCHOLAR_PUBLICATION_TTL", str(30 * 24 * 3600))
+)
+
+# Author records filled with every section serve requests for any subset
+ALL_SECTIONS = "all"
+
+
+def _dumps(record: dict) -> str:
+    # scholarly marks records with enums, stored by name
+    return json.dumps(
+        record, default=lambda o: o.name if isinstance(o, Enum) else str(o)
+    )
+
+
+def sections_key(sections: Optional[List[str]]) -> str:
+    return ALL_SECTIONS if sections is None else ",".join(sorted(sections))
+
+
+@dataclass
+class CacheCoverage:
+    author_cached: bool = False
+    publications: int = 0
+    publications_cached: int = 0
+
+    def __str__(self):
+        return (
+            f"author {'cached' if self.author_cached else 'fetched'}, "
+            f"{self.publications_cached}/{self.publications} publications cached"
+        )
+
+
+class ScholarCache:
+    """
+    Persistent cache of Google Scholar author and publication records.
+    Authors expire after SCHOLAR_AUTHOR_TTL. Publications expire after
+    SCHOLAR_PUBLICATION_TTL, or earlier when the citation count on the
+    profile listing differs from the cached one.
+    """
+
+    def __init__(
+        self,
+        path: str = SCHOLAR_CACHE_PATH,
+        author_ttl: float = SCHOLAR_AUTHOR_TTL,
+        publication_ttl: float = SCHOLAR_PUBLICATION_TTL,
+    ):
+        self._author_ttl = author_ttl
+        self._publication_ttl = publication_ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS authors (scholar_id TEXT, sections TEXT, "
+                "value TEXT NOT NULL, fetched_at REAL, PRIMARY KEY (scholar_id, sections))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS publications (pub_id TEXT PRIMARY KEY, "
+                "num_citations INTEGER, value TEXT NOT NULL, fetched_at REAL)"
+            )
+            self._connection.commit()
+
+    def get_author(
+        self, scholar_id: str, sections: Optional[List[str]] = None
+    ) -> Optional[dict]:
+        """
+        :param sections: Sections the record has to be filled with. None for all
+        :return: The cached author record or None if missing or expired
+        """
+        keys = {sections_key(sections), ALL_SECTIONS}
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT value, fetched_at FROM authors WHERE scholar_id = ? "
+                f"AND sections IN ({','.join('?' * len(keys))})",
+                (scholar_id, *keys),
+            ).fetchall()
+        fresh = [
+            value
+            for value, fetched_at in rows
+            if time.time() - fetched_at < self._author_ttl
+        ]
+        cache_lookup("scholar_author", bool(fresh))
+        return json.loads(fresh[0]) if fresh else None
+
+    def set_author(
+        self, scholar_id: str, record: dict, sections: Optional[List[str]] = None
+    ):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO authors (scholar_id, sections, value, fetched_at) "
+                "VALUES (?, ?, ?, ?)",
+                (scholar_id, sections_key(sections), _dumps(record), time.time()),
+            )
+            self._connection.commit()
+
+    def get_publication(self, listing: dict) -> Optional[dict]:
+        """
+        :param listing: Publication as listed on the author profile
+        :return: The cached filled publication or None if it has to be fetched
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT num_citations, value, fetched_at FROM publications WHERE pub_id = ?",
+                (listing.get("author_pub_id"),),
+            ).fetchone()
+        hit = (
+            row is not None
+            and time.time() - row[2] < self._publication_ttl
+            and row[0] == listing.get("num_citations")
+        )
+        cache_lookup("scholar_publication", hit)
+        return json.loads(row[1]) if hit else None
+
+    def set_publications(self, records: List[dict]):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO publications (pub_id, num_citations, value, fetched_at) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (r.get("author_pub_id"), r.get("num_citations"), _dumps(r), now)
+                    for r in records
+                    if r.get("author_pub_id")
+                ],
+            )
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM authors")
+            self._connection.execute("DELETE FROM publications")
+            self._connection.commit()
+
+
+_scholar_cache = None
+_scholar_cache_lock = threading.Lock()
+
+
+def get_scholar_cache() -> ScholarCache:
+    # Process-wide cache, shared by applicants with the same co-authors
+    global _scholar_cache
+
+    if _scholar_cache is None:
+        with _scholar_cache_lock:
+            if _scholar_cache is None:
+                _scholar_cache = ScholarCache()
+    return _scholar_cache
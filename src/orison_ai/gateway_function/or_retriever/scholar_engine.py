@@ -0,0 +1,303 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHOLAR_HOST = "scholar.google.com"
+SCHOLAR_WORKERS = int(os.getenv("SCHOLAR_WORKERS", "4"))
+# Google Scholar blocks clients that keep up more than about one request per second
+SCHOLAR_REQUESTS_PER_SECOND = float(os.getenv("SCHOLAR_REQUESTS_PER_SECOND", "1.0"))
+SCHOLAR_MAX_ATTEMPTS = int(os.getenv("SCHOLAR_MAX_ATTEMPTS", "4"))
+SCHOLAR_BACKOFF = float(os.getenv("SCHOLAR_BACKOFF", "2.0"))
+
+
+class ScholarBackend(ABC):
+    """
+    Blocking calls to Google Scholar used by the fetch engine
+    """
+
+    @abstractmethod
+    def search_author_id(self, scholar_id: str) -> dict:
+        pass
+
+    @abstractmethod
+    def fill(self, item: dict, sections: Optional[List[str]] = None) -> dict:
+        pass
+
+
+class ScholarlyBackend(ScholarBackend):
+    def __init__(self):
+        from scholarly import scholarly
+
+        self._scholarly = scholarly
+
+    def search_author_id(self, scholar_id: str) -> dict:
+        return self._scholarly.search_author_id(scholar_id)
+
+    @staticmethod
+    def _restore_source(item: dict) -> dict:
+        # Cached records store the scholarly source enum by name
+        source = item.get("source")
+        if not isinstance(source, str):
+            return item
+        from scholarly.data_types import AuthorSource, PublicationSource
+
+        enum = (
+            PublicationSource
+            if item.get("container_type") == "Publication"
+            else AuthorSource
+        )
+        return {**item, "source": enum[source]}
+
+    def fill(self, item: dict, sections: Optional[List[str]] = None) -> dict:
+        item = self._restore_source(item)
+        if sections is None:
+            return self._scholarly.fill(item)
+        return self._scholarly.fill(item, sections=sections)
+
+
+def _record_key(item: dict) -> str:
+    if item.get("container_type") == "Publication":
+        return f"publication:{item.get('author_pub_id')}"
+    return f"author:{item.get('scholar_id')}"
+
+
+class RecordedScholarBackend(ScholarBackend):
+    """
+    Local fake of Google Scholar replaying recorded responses.
+    Missing records raise KeyError, which the engine treats as a failed request.
+    """
+
+    def __init__(
+        self,
+        records: Dict[str, dict],
+        latency: float = 0.0,
+        failures: Optional[Dict[str, int]] = None,
+    ):
+        """
+        :param records: Responses by key, see RecordingScholarBackend
+        :param latency: Seconds every call takes
+        :param failures: Number of times a key fails before it succeeds
+        """
+        self._records = records
+        self._latency = latency
+        self._failures = dict(failures or {})
+        self.calls = []
+
+    @classmethod
+    def load(cls, path: str, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def _respond(self, key: str) -> dict:
+        self.calls.append((time.monotonic(), key))
+        if self._latency:
+            time.sleep(self._latency)
+        if self._failures.get(key, 0) > 0:
+            self._failures[key] -= 1
+            raise ConnectionError(f"Injected failure for {key}")
+        return json.loads(json.dumps(self._records[key]))
+
+    def search_author_id(self, scholar_id: str) -> dict:
+        return self._respond(f"search:{scholar_id}")
+
+    def fill(self, item: dict, sections: Optional[List[str]] = None) -> dict:
+        return self._respond(_record_key(item))
+
+
+class RecordingScholarBackend(ScholarBackend):
+    """
+    Passes calls to another backend and records the responses for
+    RecordedScholarBackend
+    """
+
+    def __init__(self, backend: ScholarBackend):
+        self._backend = backend
+        self.records = {}
+
+    def search_author_id(self, scholar_id: str) -> dict:
+        result = self._backend.search_author_id(scholar_id)
+        self.records[f"search:{scholar_id}"] = result
+        return result
+
+    def fill(self, item: dict, sections: Optional[List[str]] = None) -> dict:
+        result = self._backend.fill(item, sections)
+        self.records[_record_key(item)] = result
+        return result
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.records, f, default=str)
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to each host. A small random jitter keeps the request
+    pattern from looking automated.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = SCHOLAR_REQUESTS_PER_SECOND,
+        jitter: float = 0.25,
+    ):
+        self._interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._jitter = jitter
+        self._next_request = {}  # host -> monotonic time of the next allowed request
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, host: str = SCHOLAR_HOST):
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_request.get(host, now))
+            spacing = self._interval * (1.0 + random.uniform(0, self._jitter))
+            self._next_request[host] = start + spacing
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def penalize(self, delay: float, host: str = SCHOLAR_HOST):
+        # Hold back every request to the host, e.g. after being throttled
+        resume = time.monotonic() + delay
+        self._next_request[host] = max(self._next_request.get(host, 0.0), resume)
+
+
+@dataclass
+class FetchProgress:
+    total: int = 0
+    done: int = 0
+    failed: List[str] = field(default_factory=list)
+
+    def __str__(self):
+        return f"{self.done}/{self.total} fetched, {len(self.failed)} failed"
+
+    def succeeded(self, item: dict) -> bool:
+        # Backends may fill items in place, so a returned item can be the one passed
+        return _record_key(item) not in self.failed
+
+
+class ScholarFetchEngine:
+    """
+    Runs Google Scholar requests from a bounded worker pool, rate limited per
+    host and retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[ScholarBackend] = None,
+        workers: int = SCHOLAR_WORKERS,
+        rate_limiter: Optional[HostRateLimiter] = None,
+        max_attempts: int = SCHOLAR_MAX_ATTEMPTS,
+        backoff: float = SCHOLAR_BACKOFF,
+    ):
+        """
+        :param backend: Defaults to scholarly
+        :param workers: Number of requests in flight
+        :param rate_limiter: Shared with other engines talking to the same host
+        :param max_attempts: Attempts per request before it is reported as failed
+        :param backoff: Seconds before the first retry, doubled on every retry
+        """
+        self._backend = backend or ScholarlyBackend()
+        self._workers = workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="scholar"
+        )
+        self._semaphore = None
+        self._rate_limiter = rate_limiter or HostRateLimiter()
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self.requests = 0
+
+    async def _call(self, fn: Callable, *args) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._workers)
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, self._max_attempts + 1):
+            async with self._semaphore:
+                await self._rate_limiter.acquire()
+                self.requests += 1
+                try:
+                    return await loop.run_in_executor(self._executor, fn, *args)
+                except Exception as e:
+                    if attempt == self._max_attempts:
+                        raise
+                    delay = self._backoff * 2 ** (attempt - 1)
+                    logger.warning(
+                        f"Scholar request failed ({e}). Retrying in {delay:.1f}s"
+                    )
+                    self._rate_limiter.penalize(delay)
+
+    async def search_author_id(self, scholar_id: str) -> dict:
+        return await self._call(self._backend.search_author_id, scholar_id)
+
+    async def fill(self, item: dict, sections: Optional[List[str]] = None) -> dict:
+        return await self._call(self._backend.fill, item, sections)
+
+    async def fill_all(
+        self,
+        items: List[dict],
+        progress: Optional[Callable[[FetchProgress], None]] = None,
+    ) -> tuple:
+        """
+        Fills items concurrently. Items that cannot be filled are returned as
+        they are, so one bad publication does not fail the profile.
+        :param progress: Called after every item
+        :return: Filled items in input order and the final progress
+        """
+        state = FetchProgress(total=len(items))
+
+        async def fill_one(item):
+            try:
+                return await self.fill(item)
+            except Exception as e:
+                state.failed.append(_record_key(item))
+                logger.warning(f"Keeping unfilled {_record_key(item)}. Error: {e}")
+                return item
+            finally:
+                state.done += 1
+                if progress is not None:
+                    progress(state)
+
+        filled = await asyncio.gather(*[fill_one(item) for item in items])
+        return list(filled), state
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+_scholar_engine = None
+
+
+def get_scholar_engine() -> ScholarFetchEngine:
+    # Process-wide engine, so the rate limit holds across concurrent requests
+    global _scholar_engine
+
+    if _scholar_engine is None:
+        _scholar_engine = ScholarFetchEngine()
+    return _scholar_engine
@@ -0,0 +1,213 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from collections import OrderedDict
+from typing import List, Optional
+from langchain.memory import ConversationBufferWindowMemory
+
+# Internal
+
+from or_store.models import ChatTurn
+from or_store.db_interfaces import ChatMemoryClient
+from or_store.persistence_queue import PersistenceQueue, get_persistence_queue
+from metrics import cache_lookup
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+CONVERSATION_CACHE_MAX_SIZE = int(os.getenv("CONVERSATION_CACHE_MAX_SIZE", "256"))
+
+
+@dataclass
+class _Conversation:
+    version: Optional[str]  # Firestore id of the newest turn
+    turns: List[ChatTurn]  # Newest first
+    window_size: int
+
+
+class ConversationCache:
+    """
+    Keeps the last turns of recent conversations in memory.
+    Appends are written through to Firestore by the persistence queue, in
+    order per conversation. Before cached turns are used, the id of the newest
+    stored turn is compared with the cached version, so turns written by
+    another instance cause a reload.
+    """
+
+    def __init__(
+        self,
+        client: Optional[ChatMemoryClient] = None,
+        max_size: int = CONVERSATION_CACHE_MAX_SIZE,
+        queue: Optional[PersistenceQueue] = None,
+    ):
+        self._client = client
+        self._queue = queue or get_persistence_queue()
+        self._max_size = max_size
+        self._conversations = OrderedDict()  # (attorney, applicant) -> _Conversation
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def client(self) -> ChatMemoryClient:
+        if self._client is None:
+            self._client = ChatMemoryClient()
+        return self._client
+
+    def _conversation_lock(self, key: tuple) -> asyncio.Lock:
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            return lock
+
+    def _get(self, key: tuple) -> Optional[_Conversation]:
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None:
+                self._conversations.move_to_end(key)
+            return conversation
+
+    def _put(self, key: tuple, conversation: _Conversation):
+        with self._lock:
+            self._conversations[key] = conversation
+            self._conversations.move_to_end(key)
+            while len(self._conversations) > self._max_size:
+                evicted, _ = self._conversations.popitem(last=False)
+                self._locks.pop(evicted, None)
+
+    def invalidate(self, attorney_id: str, applicant_id: str):
+        with self._lock:
+            self._conversations.pop((attorney_id, applicant_id), None)
+
+    async def turns(
+        self, attorney_id: str, applicant_id: str, window_size: int
+    ) -> List[ChatTurn]:
+        """
+        Get the last turns of a conversation, newest first
+        :param attorney_id: Attorney ID
+        :param applicant_id: Applicant ID
+        :param window_size: Number of turns to retrieve
+        """
+        key = (attorney_id, applicant_id)
+        async with self._conversation_lock(key):
+            # Turns of this instance are written before the version is compared
+            await self._queue.wait(key)
+            version = await self.client.latest_turn_id(applicant_id, attorney_id)
+            conversation = self._get(key)
+            if (
+                conversation is not None
+                and conversation.version == version
+                and conversation.window_size >= window_size
+            ):
+                self.hits += 1
+                cache_lookup("conversation", True)
+                return conversation.turns[:window_size]
+            self.misses += 1
+            cache_lookup("conversation", False)
+            turns = await self.client.get_turns(applicant_id, attorney_id, window_size)
+            self._put(key, _Conversation(version, turns, window_size))
+            return turns
+
+    async def append(
+        self,
+        attorney_id: str,
+        applicant_id: str,
+        user_message: str,
+        assistant_response: str,
+    ) -> str:
+        """
+        Add a new turn to the cached conversation and queue its Firestore write
+        :return: Firestore id of the turn
+        """
+        key = (attorney_id, applicant_id)
+        turn_id = uuid.uuid4().hex
+        async with self._conversation_lock(key):
+            conversation = self._get(key)
+            previous_version = None
+            if conversation is not None:
+                previous_version = conversation.version
+                turn = ChatTurn(
+                    attorney_id=attorney_id,
+                    applicant_id=applicant_id,
+                    user_message=user_message,
+                    assistant_response=assistant_response,
+                )
+                turns = [turn] + conversation.turns[: conversation.window_size - 1]
+                self._put(key, _Conversation(turn_id, turns, conversation.window_size))
+
+        async def persist():
+            if conversation is not None:
+                latest = await self.client.latest_turn_id(applicant_id, attorney_id)
+                if latest not in (previous_version, turn_id):
+                    # Another instance wrote to this conversation, reload it on next use
+                    self.invalidate(attorney_id, applicant_id)
+            await self.client.update_memory(
+                applicant_id=applicant_id,
+                attorney_id=attorney_id,
+                user_message=user_message,
+                assistant_response=assistant_response,
+                turn_id=turn_id,
+            )
+
+        self._queue.submit(key, persist, f"chat turn {turn_id} of {key}")
+        return turn_id
+
+    async def load_into_buffer(
+        self,
+        memory_buffer: ConversationBufferWindowMemory,
+        attorney_id: str,
+        applicant_id: str,
+        window_size: int,
+    ):
+        """
+        Loads the cached conversation into an empty ConversationBufferWindowMemory
+        """
+        turns = await self.turns(attorney_id, applicant_id, window_size)
+        # Oldest first, so the buffer keeps the conversation order
+        for turn in reversed(turns):
+            await memory_buffer.asave_context(
+                {"question": turn.user_message},  # User's message
+                {"answer": turn.assistant_response},  # Assistant's response
+            )
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self._conversations),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_conversation_cache = None
+
+
+def get_conversation_cache() -> ConversationCache:
+    # Process-wide cache shared by every OrisonMessenger
+    global _conversation_cache
+
+    if _conversation_cache is None:
+        _conversation_cache = ConversationCache()
+    return _conversation_cache
@@ -16,9 +16,9 @@
 
 # External
 
-from typing import List
+from typing import Dict, List, Optional
 from datetime import datetime, timezone
-from mongoengine import DoesNotExist
+from google.cloud.firestore_v1.field_path import FieldPath
 from langchain.memory import ConversationBufferWindowMemory
 
 # Internal
@@ -26,13 +26,16 @@ from langchain.memory import ConversationBufferWindowMemory
 from or_store.models import (
     GoogleScholarDB,
     GoogleScholarNetworkDB,
+    NetworkNode,
     StoryBuilder,
     ScreeningBuilder,
     MemoryEntry,
     ChatMemoryDB,
+    ChatTurn,
     EvidenceBuilder,
 )
 from or_store.firebase import FirestoreClient
+from exceptions import DOCUMENT_NOT_FOUND
 
 
 class StoryClient(FirestoreClient):
@@ -89,13 +92,83 @@ class GoogleScholarNetworkClient(FirestoreClient):
         self._model = GoogleScholarNetworkDB
         self._collection = self.client.collection("google_scholar_network")
 
+    async def get_snapshot(
+        self, attorney_id: str, applicant_id: str, root_scholar_id: str
+    ) -> Optional[GoogleScholarNetworkDB]:
+        """
+        Retrieves the stored network of a root scholar, one document per root.
+        """
+        try:
+            snapshot, _ = await self.find_by_id(
+                attorney_id, applicant_id, root_scholar_id
+            )
+            return snapshot
+        except DOCUMENT_NOT_FOUND:
+            return None
 
-class ChatMemoryClient(FirestoreClient):
+    async def save_snapshot(
+        self,
+        attorney_id: str,
+        applicant_id: str,
+        root_scholar_id: str,
+        nodes: Dict[str, NetworkNode],
+        previous: Optional[GoogleScholarNetworkDB] = None,
+    ) -> int:
+        """
+        Stores the network of a root scholar, writing only nodes that changed.
+        Nodes missing from nodes are kept, since a crawl may stop early.
+        :param nodes: Crawled nodes by scholar_id
+        :param previous: The stored network, see get_snapshot
+        :return: Number of nodes written
+        """
+        now = datetime.utcnow()
+        if previous is None:
+            await self.insert(
+                attorney_id=attorney_id,
+                applicant_id=applicant_id,
+                doc_id=root_scholar_id,
+                doc=GoogleScholarNetworkDB(
+                    attorney_id=attorney_id,
+                    applicant_id=applicant_id,
+                    root_scholar_id=root_scholar_id,
+                    nodes=nodes,
+                    date_updated=now,
+                ),
+            )
+            return len(nodes)
+
+        updates = {}
+        for scholar_id, node in nodes.items():
+            stored = previous.nodes.get(scholar_id)
+            data = node.to_dict()
+            if stored is None or _without_fetched_at(stored) != _without_fetched_at(
+                node
+            ):
+                updates[FieldPath("nodes", scholar_id).to_api_repr()] = data
+            elif node.fetched_at != stored.fetched_at:
+                updates[FieldPath("nodes", scholar_id, "fetched_at").to_api_repr()] = (
+                    node.fetched_at
+                )
+        # The latest network document is the one shown
+        updates["date_created"] = now
+        updates["date_updated"] = now
+        await self.update_fields(attorney_id, applicant_id, root_scholar_id, updates)
+        return len(updates) - 2
+
+
+def _without_fetched_at(node: NetworkNode) -> dict:
+    data = node.to_dict()
+    data.pop("fetched_at", None)
+    return data
+
+
+class LegacyChatMemoryClient(FirestoreClient):
     def __init__(self):
         """
-        Initializes an instance of a ChatMemoryClient object, which interacts with the chat memory collection.
+        Initializes an instance of a LegacyChatMemoryClient object, which reads the
+        chat memory documents written before turns were stored one by one.
         """
-        super(ChatMemoryClient, self).__init__()
+        super(LegacyChatMemoryClient, self).__init__()
         self._model = ChatMemoryDB
         self._collection = self.client.collection("chat_memory")
 
@@ -107,76 +180,140 @@ class ChatMemoryClient(FirestoreClient):
         """
         try:
             memory_record, _ = await self.find_top(
-                applicant_id=applicant_id, attorney_id=attorney_id
+                applicant_id=applicant_id, attorney_id=attorney_id, fields=["history"]
             )
             return memory_record
-        except DoesNotExist:
+        except DOCUMENT_NOT_FOUND:
             return None
 
+    async def clear_memory(self, applicant_id: str, attorney_id: str):
+        """
+        Deletes the chat memory documents of a given applicant and attorney.
+        """
+        documents = [
+            doc_id
+            async for _, doc_id in self.stream(
+                attorney_id=attorney_id,
+                applicant_id=applicant_id,
+                fields=["date_created"],
+            )
+        ]
+        for doc_id in documents:
+            await self.delete(attorney_id, applicant_id, doc_id)
+
+
+class ChatMemoryClient(FirestoreClient):
+    def __init__(self):
+        """
+        Initializes an instance of a ChatMemoryClient object, which stores every chat
+        turn as its own document of the chat turns collection.
+        """
+        super(ChatMemoryClient, self).__init__()
+        self._model = ChatTurn
+        self._collection = self.client.collection("chat_turns")
+
+    async def get_turns(
+        self, applicant_id: str, attorney_id: str, window_size: int
+    ) -> List[ChatTurn]:
+        """
+        Retrieves the last turns of a conversation, newest first.
+        Conversations without turns fall back to the legacy chat memory document.
+        :param applicant_id: Applicant ID
+        :param attorney_id: Attorney ID
+        :param window_size: Number of turns to retrieve
+        """
+        turns = await self.find_top_k(
+            attorney_id=attorney_id,
+            applicant_id=applicant_id,
+            k=window_size,
+            fields=["user_message", "assistant_response"],
+        )
+        if turns:
+            return [turn for turn, _ in turns]
+        memory_record = await LegacyChatMemoryClient().get_memory(
+            applicant_id, attorney_id
+        )
+        if not memory_record:
+            return []
+        history = sorted(
+            memory_record.history,
+            key=lambda entry: entry.timestamp.astimezone(timezone.utc),
+            reverse=True,
+        )
+        return [
+            ChatTurn(
+                user_message=entry.user_message,
+                assistant_response=entry.assistant_response,
+                date_created=entry.timestamp,
+            )
+            for entry in history[:window_size]
+        ]
+
+    async def latest_turn_id(
+        self, applicant_id: str, attorney_id: str
+    ) -> Optional[str]:
+        """
+        Firestore id of the newest turn of a conversation, None if there are no turns.
+        Serves as the version of the conversation.
+        """
+        turns = await self.find_top_k(
+            attorney_id=attorney_id,
+            applicant_id=applicant_id,
+            k=1,
+            fields=["date_created"],
+        )
+        return turns[0][1] if turns else None
+
     async def update_memory(
         self,
         applicant_id: str,
         attorney_id: str,
         user_message: str,
         assistant_response: str,
-        window_size: int,
-    ):
+        turn_id: Optional[str] = None,
+    ) -> str:
         """
-        Updates the chat memory for a given applicant and attorney with a new user message and assistant response.
+        Appends a new user message and assistant response to the chat memory of a
+        given applicant and attorney.
         :param applicant_id: Applicant ID
         :param attorney_id: Attorney ID
         :param user_message: User message
         :param assistant_response: Assistant response
-        :param window_size: Window size of the memory buffer
+        :param turn_id: Firestore id of the turn. Makes repeated appends idempotent
+        :return: Firestore id of the stored turn
         """
-        memory_entry = MemoryEntry(
-            user_message=user_message,
-            assistant_response=assistant_response,
-        )
-        try:
-            memory_record, doc_id = await self.find_top(
-                applicant_id=applicant_id, attorney_id=attorney_id
-            )
-            memory_record.history.append(memory_entry)
-            sorted_history = sorted(
-                memory_record.history,
-                key=lambda entry: entry.timestamp.astimezone(timezone.utc),
-                reverse=True,
-            )
-            if len(sorted_history) > window_size:
-                sorted_history = sorted_history[:window_size]
-            memory_record.history = sorted_history
-            memory_record.date_updated = datetime.utcnow()
-            await self.replace(
+        return await self.insert(
+            applicant_id=applicant_id,
+            attorney_id=attorney_id,
+            doc_id=turn_id,
+            doc=ChatTurn(
                 applicant_id=applicant_id,
                 attorney_id=attorney_id,
-                doc_id=doc_id,
-                doc=memory_record,
-            )
-        except DoesNotExist:
-            memory_record = ChatMemoryDB(
-                applicant_id=applicant_id,
-                attorney_id=attorney_id,
-                history=[memory_entry],
-                date_updated=datetime.utcnow(),
-            )
-            await self.insert(
-                applicant_id=applicant_id, attorney_id=attorney_id, doc=memory_record
-            )
-        except Exception as e:
-            raise e
+                user_message=user_message,
+                assistant_response=assistant_response,
+            ),
+        )
 
     async def clear_memory(self, applicant_id: str, attorney_id: str):
         """
-        Clears the chat memory for a given applicant and attorney.
+        Clears the chat memory for a given applicant and attorney, including the
+        legacy chat memory document get_turns falls back to.
         """
-        try:
-            memory_record, _ = self.find_top(
-                applicant_id=applicant_id, attorney_id=attorney_id
+        # Imported here, the conversation cache is built on this client
+        from or_store.conversation_cache import get_conversation_cache
+
+        turns = [
+            doc_id
+            async for _, doc_id in self.stream(
+                attorney_id=attorney_id,
+                applicant_id=applicant_id,
+                fields=["date_created"],
             )
-            memory_record.update(history=[], date_updated=datetime.utcnow())
-        except DoesNotExist:
-            pass
+        ]
+        for doc_id in turns:
+            await self.delete(attorney_id, applicant_id, doc_id)
+        await LegacyChatMemoryClient().clear_memory(applicant_id, attorney_id)
+        get_conversation_cache().invalidate(attorney_id, applicant_id)
 
     async def load_memory_into_buffer(
         self,
@@ -192,14 +329,10 @@ class ChatMemoryClient(FirestoreClient):
         :param attorney_id: Attorney ID
         :param window_size: Window size of the memory buffer
         """
-        memory_record = await self.get_memory(applicant_id, attorney_id)
-        if not memory_record:
-            return
-        sorted_history = sorted(
-            memory_record.history, key=lambda entry: entry.timestamp, reverse=True
-        )
-        for entry in sorted_history[:window_size]:
+        turns = await self.get_turns(applicant_id, attorney_id, window_size)
+        # Oldest first, so the buffer keeps the conversation order
+        for turn in reversed(turns):
             await memory_buffer.asave_context(
-                {"question": entry.user_message},  # User's message
-                {"answer": entry.assistant_response},  # Assistant's response
+                {"question": turn.user_message},  # User's message
+                {"answer": turn.assistant_response},  # Assistant's response
             )
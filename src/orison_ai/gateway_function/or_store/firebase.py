@@ -17,26 +17,32 @@
 # External
 import os
 import json
+import asyncio
 import logging
+import time
+import threading
+import weakref
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
 import datetime
+from or_store.write_buffer import WriteBuffer
 from exceptions import (
     CREDENTIALS_NOT_FOUND,
     INVALID_CREDENTIALS,
     FIRESTORE_CONNECTION_FAILED,
+    DOCUMENT_NOT_FOUND,
 )
+from or_store.models import Model
+from tracing import span
+from metrics import cache_lookup
 from google.cloud.firestore_v1.base_query import FieldFilter, BaseCompositeFilter
 from google.cloud.firestore_v1.types import StructuredQuery
 from google.cloud.secretmanager_v1 import SecretManagerServiceClient
 import firebase_admin
 from firebase_admin import firestore
+from firebase_admin import firestore_async
 from firebase_admin import credentials
-from firebase_admin import firestore
-from bson import ObjectId
-from mongoengine import Document, EmbeddedDocument
 from typing import List, Union, Any, Optional
-from pymongo import DESCENDING, ASCENDING
-from mongoengine import DoesNotExist
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
@@ -44,6 +50,25 @@ _logger = logging.getLogger(__name__)
 
 PROJECT_PREFIX_FOR_SECRET_MANAGER = "projects/685108028813/secrets/"
 
+# Process-wide Firestore clients shared by every FireStoreDB
+_firestore_client = None
+# Async clients are bound to the event loop they were first used on
+_async_firestore_clients = weakref.WeakKeyDictionary()
+_firebase_lock = threading.RLock()
+
+# native: AsyncClient on the running loop
+# executor: sync client offloaded to worker threads
+# blocking: sync client called on the event loop
+FIRESTORE_ASYNC_MODE = os.getenv("FIRESTORE_ASYNC_MODE", "native")
+
+# Seconds secret manager values are reused by the process
+SECRET_CACHE_TTL = float(os.getenv("SECRET_CACHE_TTL", "600"))
+_secret_values = {}  # key -> (value, time read)
+
+# Sort orders of FirestoreClient queries
+ASCENDING = 1
+DESCENDING = -1
+
 
 @dataclass
 class OrisonSecrets:
@@ -82,7 +107,12 @@ def environment_or_secret(keys: Union[str, List[str]]):
     values = []
     for key in keys:
         value = os.getenv(key.upper())
+        cached = _secret_values.get(key.lower())
+        if value is None and cached and time.monotonic() - cached[1] < SECRET_CACHE_TTL:
+            value = cached[0]
+            cache_lookup("secret", True)
         if value is None:
+            cache_lookup("secret", False)
             if client is None:
                 client = SecretManagerServiceClient()
             _logger.info(
@@ -90,10 +120,12 @@ def environment_or_secret(keys: Union[str, List[str]]):
             )
             try:
                 # Getting secrets
-                value = read_remote_secret_url_as_string(
-                    client, build_secret_url(key.lower())
-                )
+                with span("secret_manager.access", {"secret": key.lower()}):
+                    value = read_remote_secret_url_as_string(
+                        client, build_secret_url(key.lower())
+                    )
                 _logger.info(f"{key.lower()} found in secret manager.")
+                _secret_values[key.lower()] = (value, time.monotonic())
             except Exception as e:
                 _logger.error(
                     f"Error getting {key.lower()} from secret manager. Error: {e}"
@@ -115,41 +147,79 @@ def read_remote_secret_url_as_string(
 
 def get_firebase_admin_app():
     try:
-        secret = environment_or_secret("FIREBASE_CREDENTIALS")
-        cred_dict = json.loads(secret)
-    except CREDENTIALS_NOT_FOUND as e:
-        _logger.error(
-            f"No Firebase credentials found in environment variables or secret manager. Error: {e}"
-        )
-        raise e
-    except json.JSONDecodeError as e:
-        raise INVALID_CREDENTIALS(exception=e)
-    except Exception as e:
-        _logger.error(f"Unknown error: {e}")
-    options = {}
-    try:
-        bucket_str = environment_or_secret("BUCKET")
-        options = {"storageBucket": str(bucket_str)}
-    except CREDENTIALS_NOT_FOUND as e:
-        _logger.error(
-            f"No bucket found in environment variables or secret manager. Error: {e}"
-        )
-    except Exception as e:
-        _logger.error(f"Unknown error: {e}")
-
-    # Convert string back to JSON
-    cred = credentials.Certificate(cred_dict)
-
-    try:
-        _logger.info("Getting existing Firestore client")
+        # Credentials are only resolved for the first app of the process
         return firebase_admin.get_app()
-    except ValueError as e:
-        _logger.info("No existing client found. Creating new Firestore client")
-        app = firebase_admin.initialize_app(cred, options)
-        _logger.info(f"Firestore client created with name: {app.name}")
-        return app
-    except Exception as e:
-        raise FIRESTORE_CONNECTION_FAILED(exception=e)
+    except ValueError:
+        pass
+
+    with _firebase_lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            pass
+
+        try:
+            secret = environment_or_secret("FIREBASE_CREDENTIALS")
+            cred_dict = json.loads(secret)
+        except CREDENTIALS_NOT_FOUND as e:
+            _logger.error(
+                f"No Firebase credentials found in environment variables or secret manager. Error: {e}"
+            )
+            raise e
+        except json.JSONDecodeError as e:
+            raise INVALID_CREDENTIALS(exception=e)
+        except Exception as e:
+            _logger.error(f"Unknown error: {e}")
+        options = {}
+        try:
+            bucket_str = environment_or_secret("BUCKET")
+            options = {"storageBucket": str(bucket_str)}
+        except CREDENTIALS_NOT_FOUND as e:
+            _logger.error(
+                f"No bucket found in environment variables or secret manager. Error: {e}"
+            )
+        except Exception as e:
+            _logger.error(f"Unknown error: {e}")
+
+        try:
+            # Convert string back to JSON
+            cred = credentials.Certificate(cred_dict)
+            _logger.info("No existing client found. Creating new Firestore client")
+            app = firebase_admin.initialize_app(cred, options)
+            _logger.info(f"Firestore client created with name: {app.name}")
+            return app
+        except Exception as e:
+            raise FIRESTORE_CONNECTION_FAILED(exception=e)
+
+
+def get_firestore_client():
+    """
+    Lazily creates the Firestore client shared by the whole process
+    """
+    global _firestore_client
+
+    if _firestore_client is None:
+        with _firebase_lock:
+            if _firestore_client is None:
+                _firestore_client = firestore.client(get_firebase_admin_app())
+    return _firestore_client
+
+
+def get_async_firestore_client():
+    """
+    Lazily creates the async Firestore client of the running event loop.
+    The gateway runs every request on one long-lived loop, so the process
+    effectively shares a single async client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_firestore_clients.get(loop)
+    if client is None:
+        with _firebase_lock:
+            client = _async_firestore_clients.get(loop)
+            if client is None:
+                client = firestore_async.client(get_firebase_admin_app())
+                _async_firestore_clients[loop] = client
+    return client
 
 
 class FireStoreDB:
@@ -158,8 +228,52 @@ class FireStoreDB:
         Initializes an instance of a FireStoreDB object, which can be used to
         connect to a FireStoreDB database
         """
-        app = get_firebase_admin_app()
-        self.client = firestore.client(app)
+        self.client = get_firestore_client()
+        self._async_mode = FIRESTORE_ASYNC_MODE
+        self._write_buffer = None
+
+    @asynccontextmanager
+    async def coalesce_writes(self, flush_interval: Optional[float] = None):
+        """
+        Buffers the field updates issued by this instance and commits them in
+        batches when the context exits, when flush is called on the yielded
+        buffer, or every flush_interval seconds for long running jobs.
+
+        :param flush_interval: seconds after which buffered updates are committed
+        """
+        self._write_buffer = WriteBuffer(
+            self.client,
+            flush_interval,
+            self._async_mode,
+            get_async_firestore_client() if self._async_mode == "native" else None,
+        )
+        try:
+            yield self._write_buffer
+        finally:
+            buffer, self._write_buffer = self._write_buffer, None
+            await buffer.flush()
+
+    async def _update(self, document, updates: dict):
+        if self._write_buffer is None:
+            with span("firestore.update"):
+                if self._async_mode == "native":
+                    await get_async_firestore_client().document(document.path).update(
+                        updates
+                    )
+                elif self._async_mode == "executor":
+                    await asyncio.to_thread(document.update, updates)
+                else:
+                    document.update(updates)
+            return
+        self._write_buffer.update(document, updates)
+        await self._write_buffer.maybe_flush()
+
+    @staticmethod
+    def _as_list(value: Union[Any, List[Any]]) -> List[Any]:
+        return value if isinstance(value, list) else [value]
+
+    def _document(self, collection_name: str, document_name: str):
+        return self.client.collection(collection_name).document(document_name)
 
     async def remove_value_from_field(
         self,
@@ -167,28 +281,26 @@ class FireStoreDB:
         document_name: str,
         field: str,
         value: Union[Any, List[Any]],
+        transactional: bool = False,
     ):
         """
         Deletes the value associated with field from a document in a collection in the Firestore DB
+        Array fields are updated with a single atomic ArrayRemove write.
 
         :param collection_name: the name of the collection to delete from
         :param document_name: the name of the document to delete from
         :param field: the field to delete
+        :param value: the value or list of values to remove from the array field
+        :param transactional: read the field in a transaction and clear it if it is not an array
         """
-        collection = self.client.collection(collection_name)
-        document = collection.document(document_name)
-        # Check if field value is instance of a list. In that case append to list.
-        current_value = document.get().to_dict().get(field)
-        # Check if field exists in document
-        if current_value is None:
-            logging.error("Field does not exist in document. Cannot update field")
-            return None
-        if isinstance(current_value, list):
-            if value in current_value:
-                current_value.remove(value)
-                document.update({field: current_value})
-        else:
-            document.update({field: None})
+        document = self._document(collection_name, document_name)
+        if transactional:
+            return await self._transactional_update(
+                document, field, value, FireStoreDB._removed_value
+            )
+        await self._update(
+            document, {field: firestore.ArrayRemove(self._as_list(value))}
+        )
         logging.info(
             f"Deleted field {field} from document {document_name} in collection {collection_name}"
         )
@@ -200,95 +312,194 @@ class FireStoreDB:
         document_name: str,
         field: str,
         value: Union[Any, List[Any]],
+        transactional: bool = False,
     ):
         """
         Updates the collection to be used in the Firestore DB
+        Array fields are updated with a single atomic ArrayUnion write.
 
         :param collection_name: the name of the collection to update
         :param document_name: the name of the document to update
         :param field: the field to update
-        :param value: the value to update the field to
+        :param value: the value or list of values to add to the array field
+        :param transactional: read the field in a transaction and overwrite it if it is not an array
         """
         if not value or not field:
             logging.error("Failed to update document. Field and value cannot be empty")
             return None
-        # Assumes a unique document is found
-        collection = self.client.collection(collection_name)
-        document = collection.document(document_name)
-        # Check if field value is instance of a list. In that case append to list.
-        current_value = document.get().to_dict().get(field)
-        # Check if field exists in document
-        if current_value is None:
-            logging.error("Field does not exist in document. Cannot update field")
-            return None
-        if isinstance(current_value, list):
-            if isinstance(value, list):
-                for val in value:
-                    if val not in current_value:
-                        current_value.append(val)
-            elif value not in current_value:
-                current_value.append(value)
-            document.update({field: current_value})
-        else:
-            document.update({field: value})
+        document = self._document(collection_name, document_name)
+        if transactional:
+            return await self._transactional_update(
+                document, field, value, FireStoreDB._added_value
+            )
+        await self._update(
+            document, {field: firestore.ArrayUnion(self._as_list(value))}
+        )
         logging.info(
             f"Updated document with new field:value {field}:{value} in collection {collection_name} and document {document_name}"
         )
         return True
 
+    async def increment_field(
+        self,
+        collection_name: str,
+        document_name: str,
+        field: str,
+        amount: Union[int, float] = 1,
+    ):
+        """
+        Atomically increments a numeric field of a document
+
+        :param collection_name: the name of the collection to update
+        :param document_name: the name of the document to update
+        :param field: the field to increment
+        :param amount: the amount to add to the field
+        """
+        await self._update(
+            self._document(collection_name, document_name),
+            {field: firestore.Increment(amount)},
+        )
+        return True
+
+    @staticmethod
+    def _added_value(current_value: Any, value: Union[Any, List[Any]]) -> Any:
+        if not isinstance(current_value, list):
+            return value
+        return current_value + [
+            val for val in FireStoreDB._as_list(value) if val not in current_value
+        ]
+
+    @staticmethod
+    def _removed_value(current_value: Any, value: Union[Any, List[Any]]) -> Any:
+        if not isinstance(current_value, list):
+            return None
+        values = FireStoreDB._as_list(value)
+        return [val for val in current_value if val not in values]
+
+    async def _transactional_update(self, document, field: str, value, merge) -> bool:
+        # Read-modify-write for fields that are not arrays. Retried by Firestore on contention.
+        if self._write_buffer is not None:
+            # Keep the transaction ordered after the updates issued before it
+            await self._write_buffer.flush()
+
+        def updates(snapshot) -> Optional[dict]:
+            current_value = (snapshot.to_dict() or {}).get(field)
+            # Check if field exists in document
+            if current_value is None:
+                logging.error("Field does not exist in document. Cannot update field")
+                return None
+            return {field: merge(current_value, value)}
+
+        if self._async_mode == "native":
+            client = get_async_firestore_client()
+            async_document = client.document(document.path)
+
+            @firestore_async.async_transactional
+            async def update_in_async_transaction(transaction):
+                snapshot = await async_document.get(transaction=transaction)
+                field_updates = updates(snapshot)
+                if field_updates is None:
+                    return None
+                transaction.update(async_document, field_updates)
+                return True
+
+            with span("firestore.transaction"):
+                return await update_in_async_transaction(client.transaction())
+
+        @firestore.transactional
+        def update_in_transaction(transaction):
+            snapshot = document.get(transaction=transaction)
+            field_updates = updates(snapshot)
+            if field_updates is None:
+                return None
+            transaction.update(document, field_updates)
+            return True
+
+        with span("firestore.transaction"):
+            if self._async_mode == "executor":
+                return await asyncio.to_thread(
+                    update_in_transaction, self.client.transaction()
+                )
+            return update_in_transaction(self.client.transaction())
+
 
 class FirestoreClient(FireStoreDB):
-    def __init__(self):
+    def __init__(self, async_mode: Optional[str] = None):
         """
         Initializes an instance of a FirestoreClient object, which can be used
         to insert into or update a Firestore collection given a file
+
+        :param async_mode: native, executor or blocking. Defaults to FIRESTORE_ASYNC_MODE
         """
         super(FirestoreClient, self).__init__()
+        self._async_mode = async_mode or FIRESTORE_ASYNC_MODE
+
+    def _applicant_collection(self, attorney_id: str, applicant_id: str):
+        # Collection reference on the client matching the async mode
+        collection = self._collection
+        if self._async_mode == "native":
+            collection = get_async_firestore_client().collection(self._collection.id)
+        return collection.document(attorney_id).collection(applicant_id)
+
+    async def _run(self, operation: str, native_call, sync_call):
+        """
+        Runs a Firestore operation according to the async mode
+        :param operation: name of the operation in traces
+        :param native_call: coroutine function using the async client
+        :param sync_call: function using the sync client
+        """
+        with span(
+            f"firestore.{operation}",
+            {"firestore.collection": self._collection.id},
+        ):
+            if self._async_mode == "native":
+                return await native_call()
+            if self._async_mode == "executor":
+                return await asyncio.to_thread(sync_call)
+            return sync_call()
 
     async def find_top(
         self,
         attorney_id: str,
         applicant_id: str,
-        filters: Optional[dict] = {},
+        filters: Optional[dict] = None,
         order=DESCENDING,
-    ) -> Union[EmbeddedDocument, Document, None]:
+        fields: Optional[List[str]] = None,
+    ) -> Optional[tuple]:
         """
-        Finds a firestore Document item from the collection and converts it to a mongo object
+        Finds a firestore Document item from the collection and converts it to a model object
         Order is either ASCENDING or DESCENDING
 
         :param attorney_id: the business id of the document to find
         :param applicant_id: the user id of the document to find
+        :param filters: field values the document has to match
         :param order: the order in which to sort the documents
+        :param fields: only decode these fields of the document
         :return: the entry found in firestore db for the requesting model class instance
-                converted to a mongo object
+                converted to a model object
         """
-        result = await self.find_top_k(attorney_id, applicant_id, filters, 1, order)
+        result = await self.find_top_k(
+            attorney_id, applicant_id, filters, 1, order, fields
+        )
         if result:
             return result[0]
         else:
-            raise DoesNotExist
+            raise DOCUMENT_NOT_FOUND
 
-    async def find_top_k(
+    def _query(
         self,
         attorney_id: str,
         applicant_id: str,
-        filters: Optional[dict] = {},
-        k: int = 1,
-        order=DESCENDING,
-    ) -> Union[List[EmbeddedDocument], List[Document], None]:
+        filters: Optional[dict],
+        k: int,
+        order,
+        fields: Optional[List[str]],
+        cursor=None,
+    ):
         """
-        Finds top K firestore document items given a limit k from the collection
-        and converts them to mongo objects
-        Order is either ASCENDING or DESCENDING
-
-        :param attorney_id: the business id of the document to find
-        :param applicant_id: the user id of the document to find
-        :param k: the number of documents to find
-        :param order: the order in which to sort the documents
-        :return: entries found in firestore converted to list of mongo objects
+        Builds the query over an applicant collection ordered by date_created
+        :param cursor: document snapshot the query starts after
         """
-        _logger.debug(f"Database operation: find {k} documents by order: {order}")
-
         if self._collection is None:
             raise ValueError("Collection not set")
         if self._model is None:
@@ -298,58 +509,145 @@ class FirestoreClient(FireStoreDB):
             raise ValueError(
                 f'Expected parameter "order" as 1 or -1. Instead, ' f"got {order}"
             )
-        order = (
-            firestore.Query.ASCENDING
-            if order == ASCENDING
-            else firestore.Query.DESCENDING
-        )
         if k < 1:
             raise ValueError("Number of documents k must be greater than 0")
 
-        attorney_document = self._collection.document(attorney_id)
-        applicant_collection = attorney_document.collection(applicant_id)
+        query = self._applicant_collection(attorney_id, applicant_id)
+        if filters:
+            query = query.where(
+                filter=BaseCompositeFilter(
+                    operator=StructuredQuery.CompositeFilter.Operator.AND,
+                    filters=[
+                        FieldFilter(field, "==", value)
+                        for field, value in filters.items()
+                    ],
+                )
+            )
+        if fields:
+            # The ordering field is kept so snapshots can serve as cursors
+            query = query.select(list(dict.fromkeys([*fields, "date_created"])))
+        query = query.order_by(
+            "date_created",
+            direction=(
+                firestore.Query.ASCENDING
+                if order == ASCENDING
+                else firestore.Query.DESCENDING
+            ),
+        )
+        if cursor is not None:
+            query = query.start_after(cursor)
+        return query.limit(k)
+
+    def _decode(self, item) -> tuple:
+        return (
+            self._model.from_dict(item.to_dict()),
+            item.id,
+        )
 
-        # Apply filters
-        composite_filter = BaseCompositeFilter(
-            operator=StructuredQuery.CompositeFilter.Operator.AND,
-            filters=[
-                FieldFilter(field, "==", value) for field, value in filters.items()
-            ],
+    async def find_page(
+        self,
+        attorney_id: str,
+        applicant_id: str,
+        filters: Optional[dict] = None,
+        k: int = 1,
+        order=DESCENDING,
+        fields: Optional[List[str]] = None,
+        cursor=None,
+    ) -> tuple:
+        """
+        Finds one page of firestore document items
+        Order is either ASCENDING or DESCENDING
+
+        :param attorney_id: the business id of the documents to find
+        :param applicant_id: the user id of the documents to find
+        :param filters: field values the documents have to match
+        :param k: the page size
+        :param order: the order in which to sort the documents
+        :param fields: only decode these fields of the documents
+        :param cursor: cursor returned with the previous page
+        :return: list of (model object, firestore id) and the cursor of the next
+                page, which is None after the last page
+        """
+        _logger.debug(f"Database operation: find {k} documents by order: {order}")
+
+        query = self._query(
+            attorney_id, applicant_id, filters, k, order, fields, cursor
         )
 
-        if ASCENDING:
-            query = (
-                applicant_collection.where(filter=composite_filter)
-                .order_by("date_created", direction=firestore.Query.ASCENDING)
-                .limit(k)
-            )
-        else:
-            query = (
-                applicant_collection.where(filter=composite_filter)
-                .order_by("date_created", direction=firestore.Query.DESCENDING)
-                .limit(k)
-            )
+        async def stream_native():
+            return [item async for item in query.stream()]
+
+        items = await self._run("query", stream_native, lambda: list(query.stream()))
+        next_cursor = items[-1] if len(items) == k else None
+        return [self._decode(item) for item in items], next_cursor
 
-        return [
-            (
-                self._model(**{k: v for k, v in item.to_dict().items() if k != "id"}),
-                item.id,
+    async def find_top_k(
+        self,
+        attorney_id: str,
+        applicant_id: str,
+        filters: Optional[dict] = None,
+        k: int = 1,
+        order=DESCENDING,
+        fields: Optional[List[str]] = None,
+    ) -> List[tuple]:
+        """
+        Finds top K firestore document items given a limit k from the collection
+        and converts them to model objects
+        Order is either ASCENDING or DESCENDING
+
+        :param attorney_id: the business id of the document to find
+        :param applicant_id: the user id of the document to find
+        :param filters: field values the documents have to match
+        :param k: the number of documents to find
+        :param order: the order in which to sort the documents
+        :param fields: only decode these fields of the documents
+        :return: entries found in firestore converted to list of model objects
+        """
+        items, _ = await self.find_page(
+            attorney_id, applicant_id, filters, k, order, fields
+        )
+        return items
+
+    async def stream(
+        self,
+        attorney_id: str,
+        applicant_id: str,
+        filters: Optional[dict] = None,
+        order=DESCENDING,
+        fields: Optional[List[str]] = None,
+        page_size: int = 50,
+    ):
+        """
+        Iterates over all matching documents, fetching them one page at a time
+
+        :param page_size: the number of documents fetched per round trip
+        :return: async iterator of (model object, firestore id)
+        """
+        cursor = None
+        while True:
+            items, cursor = await self.find_page(
+                attorney_id, applicant_id, filters, page_size, order, fields, cursor
             )
-            for item in query.stream()
-        ]
+            for item in items:
+                yield item
+            if cursor is None:
+                return
 
     async def insert(
         self,
         attorney_id: str,
         applicant_id: str,
-        doc: Union[EmbeddedDocument, Document],
-    ) -> ObjectId:
+        doc: Model,
+        doc_id: Optional[str] = None,
+    ) -> str:
         """
-        Inserts a mongo doc object into the firestore
+        Inserts a model object into the firestore
 
         :param attorney_id: the business id of the document to insert
         :param applicant_id: the user id of the document to insert
         :param doc: the object to insert into the database
+        :param doc_id: id of the new document. Inserts with a given id can be
+                repeated safely. Generated by Firestore if not set
 
         :return: the inserted firestore id
         """
@@ -357,16 +655,24 @@ class FirestoreClient(FireStoreDB):
 
         if not isinstance(doc, self._model):
             raise TypeError(
-                f"The mongo doc provided {doc} of type {type(doc)} "
+                f"The document provided {doc} of type {type(doc)} "
                 f"needs to be type {self._model}"
             )
         # ToDo: Change to unix timestamp
         doc.date_created = datetime.datetime.utcnow()
-        # Tried async collection but it has issues with event loop closures.
-        # Switching to regular collection
-        attorney_document = self._collection.document(attorney_id)
-        applicant_collection = attorney_document.collection(applicant_id)
-        _, doc_ref = applicant_collection.add(doc.to_mongo().to_dict())
+        # Async clients are kept per event loop, so closed loops no longer break them
+        applicant_collection = self._applicant_collection(attorney_id, applicant_id)
+        doc.validate()
+        data = doc.to_dict()
+        if doc_id is not None:
+            doc_ref = applicant_collection.document(doc_id)
+            await self._run("set", lambda: doc_ref.set(data), lambda: doc_ref.set(data))
+        else:
+            _, doc_ref = await self._run(
+                "add",
+                lambda: applicant_collection.add(data),
+                lambda: applicant_collection.add(data),
+            )
         _logger.info(f"Document inserted. Firestore id: {doc_ref.id}")
 
         return doc_ref.id
@@ -376,7 +682,7 @@ class FirestoreClient(FireStoreDB):
         attorney_id: str,
         applicant_id: str,
         doc_id: str,
-        doc: Union[EmbeddedDocument, Document],
+        doc: Model,
     ) -> str:
         """
         Replaces an existing document in Firestore with new data.
@@ -392,7 +698,7 @@ class FirestoreClient(FireStoreDB):
 
         if not isinstance(doc, self._model):
             raise TypeError(
-                f"The mongo doc provided {doc} of type {type(doc)} "
+                f"The document provided {doc} of type {type(doc)} "
                 f"needs to be type {self._model}"
             )
 
@@ -400,12 +706,65 @@ class FirestoreClient(FireStoreDB):
         doc.date_created = datetime.datetime.utcnow()
 
         # Target the document within the nested collection
-        attorney_document = self._collection.document(attorney_id)
-        applicant_collection = attorney_document.collection(applicant_id)
+        applicant_collection = self._applicant_collection(attorney_id, applicant_id)
         doc_ref = applicant_collection.document(doc_id)
 
         # Replace the document data
-        doc_ref.set(doc.to_mongo().to_dict(), merge=False)
+        doc.validate()
+        data = doc.to_dict()
+        await self._run(
+            "set",
+            lambda: doc_ref.set(data, merge=False),
+            lambda: doc_ref.set(data, merge=False),
+        )
         _logger.info(f"Document replaced. Firestore id: {doc_ref.id}")
 
         return doc_ref.id
+
+    async def find_by_id(
+        self, attorney_id: str, applicant_id: str, doc_id: str
+    ) -> Optional[tuple]:
+        """
+        Finds a firestore document by its id and converts it to a model object
+
+        :param attorney_id: the business id of the document to find
+        :param applicant_id: the user id of the document to find
+        :param doc_id: the id of the document to find
+        :return: the model object and its firestore id
+        """
+        doc_ref = self._applicant_collection(attorney_id, applicant_id).document(doc_id)
+        snapshot = await self._run("get", doc_ref.get, doc_ref.get)
+        if not snapshot.exists:
+            raise DOCUMENT_NOT_FOUND
+        return self._decode(snapshot)
+
+    async def update_fields(
+        self, attorney_id: str, applicant_id: str, doc_id: str, updates: dict
+    ):
+        """
+        Updates fields of an existing document without rewriting it
+
+        :param attorney_id: the business id of the document to update
+        :param applicant_id: the user id of the document to update
+        :param doc_id: the id of the document to update
+        :param updates: values by field path, nested fields separated by dots
+        """
+        _logger.debug(
+            f"Database operation: updating {len(updates)} fields of document {doc_id}"
+        )
+        doc_ref = self._applicant_collection(attorney_id, applicant_id).document(doc_id)
+        await self._run(
+            "update", lambda: doc_ref.update(updates), lambda: doc_ref.update(updates)
+        )
+
+    async def delete(self, attorney_id: str, applicant_id: str, doc_id: str):
+        """
+        Deletes a document of an applicant collection
+
+        :param attorney_id: the business id of the document to delete
+        :param applicant_id: the user id of the document to delete
+        :param doc_id: the id of the document to delete
+        """
+        _logger.debug(f"Database operation: deleting document with id {doc_id}")
+        doc_ref = self._applicant_collection(attorney_id, applicant_id).document(doc_id)
+        await self._run("delete", doc_ref.delete, doc_ref.delete)
@@ -18,6 +18,8 @@ import logging
 
 from firebase_admin import storage
 
+from tracing import span
+
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
 
@@ -43,7 +45,8 @@ class FirebaseStorage:
     async def upload_file(local_file_path: str, remote_file_path: str):
         try:
             blob = FirebaseStorage._bucket().blob(remote_file_path)
-            blob.upload_from_filename(local_file_path)
+            with span("storage.upload"):
+                blob.upload_from_filename(local_file_path)
             _logger.debug(f"Uploaded file to {remote_file_path}")
         except Exception as e:
             _logger.error(f"Error uploading file: {e}")
@@ -51,11 +54,13 @@ class FirebaseStorage:
     @staticmethod
     async def download_file(remote_file_path: str, local_file_path: str):
         try:
-            blob = FirebaseStorage._bucket().get_blob(remote_file_path)
-            if blob is None:
-                _logger.error(f"Blob {remote_file_path} could not be retrieved")
-                raise Exception("Blob does not exist")
-            blob.download_to_filename(local_file_path)
+            with span("storage.download") as download_span:
+                blob = FirebaseStorage._bucket().get_blob(remote_file_path)
+                if blob is None:
+                    _logger.error(f"Blob {remote_file_path} could not be retrieved")
+                    raise Exception("Blob does not exist")
+                blob.download_to_filename(local_file_path)
+                download_span.set_attribute("storage.bytes", blob.size)
             _logger.debug(f"Downloaded file to {local_file_path}")
         except Exception as e:
             _logger.error(f"Error downloading file: {e}")
@@ -0,0 +1,446 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+# Internal
+
+from or_store.models import Job, JobProgress
+from or_store.firebase import get_firestore_client
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+# firestore: jobs collection the frontend can watch
+# sqlite: local stand-in shared by the gateway and worker processes of one machine
+JOB_STORE = os.getenv("JOB_STORE", "firestore")
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "/tmp/jobs.sqlite")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+_DATETIME_FIELDS = ("available_at", "date_created", "date_updated")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _key_hash(request_type: str, key: str) -> str:
+    return hashlib.sha256(f"{request_type}:{key}".encode()).hexdigest()
+
+
+def new_job(request_type: str, payload: dict) -> Tuple[Job, str]:
+    """
+    Creates a queued job of a gateway request
+    :return: The job and its idempotency key. Requests carrying an
+            idempotencyKey are deduplicated for good per attorney and
+            applicant, others only while an identical request is still queued
+            or running
+    """
+    explicit_key = payload.get("idempotencyKey")
+    if explicit_key:
+        # Client keys are only unique per applicant
+        key = json.dumps(
+            [payload.get("attorneyId"), payload.get("applicantId"), explicit_key],
+            default=str,
+        )
+    else:
+        key = json.dumps(payload, sort_keys=True, default=str)
+    now = _now()
+    job = Job(
+        job_id=uuid.uuid4().hex,
+        request_type=request_type,
+        payload=payload,
+        attorney_id=payload.get("attorneyId"),
+        applicant_id=payload.get("applicantId"),
+        idempotency_key=explicit_key,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        available_at=now,
+        progress=JobProgress(stage=QUEUED),
+        date_created=now,
+        date_updated=now,
+    )
+    return job, _key_hash(request_type, key)
+
+
+class JobTransaction(ABC):
+    """
+    Reads and writes of one atomic job store transaction. All reads happen
+    before the first write.
+    """
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        pass
+
+    @abstractmethod
+    def put(self, job: Job):
+        pass
+
+    @abstractmethod
+    def get_key(self, key_hash: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def put_key(self, key_hash: str, job_id: str):
+        pass
+
+
+class JobStore(ABC):
+    """
+    Queue of gateway jobs. Workers claim jobs with a lease they renew while
+    the job runs. Renewals and results of a worker that lost its lease are
+    rejected, so every attempt has a single owner.
+    """
+
+    @abstractmethod
+    def _transaction(self, run: Callable[[JobTransaction], object]):
+        # Runs run atomically and returns its result
+        pass
+
+    @abstractmethod
+    def _candidates(self, now: datetime, limit: int) -> List[str]:
+        # Ids of active jobs that became available, oldest first
+        pass
+
+    async def enqueue(self, job: Job, key_hash: str) -> Tuple[Job, bool]:
+        """
+        Queues a job unless a job with the same idempotency key exists
+        :return: The queued or existing job and whether it was queued
+        """
+
+        def run(transaction: JobTransaction):
+            job_id = transaction.get_key(key_hash)
+            existing = transaction.get(job_id) if job_id else None
+            if existing is not None and (
+                existing.status in ACTIVE or existing.idempotency_key is not None
+            ):
+                return existing, False
+            transaction.put(job)
+            transaction.put_key(key_hash, job.job_id)
+            return job, True
+
+        return await asyncio.to_thread(self._transaction, run)
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await asyncio.to_thread(
+            self._transaction, lambda transaction: transaction.get(job_id)
+        )
+
+    async def claim(
+        self, worker_id: str, lease: float, limit: int = 10
+    ) -> Optional[Job]:
+        """
+        Claims the oldest available job
+        :param lease: Seconds the job is reserved for the worker
+        :return: The claimed job or None if no job is available
+        """
+
+        def run(job_id: str, transaction: JobTransaction):
+            now = _now()
+            job = transaction.get(job_id)
+            if job is None or job.status not in ACTIVE or job.available_at > now:
+                return None
+            if job.attempts >= job.max_attempts:
+                # The lease of the last attempt expired
+                transaction.put(
+                    replace(
+                        job,
+                        status=FAILED,
+                        error=job.error or "Lease of the last attempt expired",
+                        lease_owner=None,
+                        date_updated=now,
+                    )
+                )
+                return None
+            claimed = replace(
+                job,
+                status=RUNNING,
+                attempts=job.attempts + 1,
+                lease_owner=worker_id,
+                available_at=now + timedelta(seconds=lease),
+                progress=JobProgress(stage=RUNNING),
+                date_updated=now,
+            )
+            transaction.put(claimed)
+            return claimed
+
+        candidates = await asyncio.to_thread(self._candidates, _now(), limit)
+        for job_id in candidates:
+            # Other workers may claim the same candidates, the transaction decides
+            claimed = await asyncio.to_thread(
+                self._transaction, lambda transaction: run(job_id, transaction)
+            )
+            if claimed is not None:
+                return claimed
+        return None
+
+    def _owned(self, transaction: JobTransaction, job: Job) -> Optional[Job]:
+        current = transaction.get(job.job_id)
+        if (
+            current is None
+            or current.status != RUNNING
+            or current.lease_owner != job.lease_owner
+            or current.attempts != job.attempts
+        ):
+            return None
+        return current
+
+    async def renew(
+        self, job: Job, lease: float, progress: Optional[JobProgress] = None
+    ) -> bool:
+        """
+        Extends the lease of a claimed job and records its progress
+        :return: False if the worker lost the lease
+        """
+
+        def run(transaction: JobTransaction):
+            current = self._owned(transaction, job)
+            if current is None:
+                return False
+            now = _now()
+            transaction.put(
+                replace(
+                    current,
+                    available_at=now + timedelta(seconds=lease),
+                    progress=progress or current.progress,
+                    date_updated=now,
+                )
+            )
+            return True
+
+        return await asyncio.to_thread(self._transaction, run)
+
+    async def finish(
+        self,
+        job: Job,
+        result: Optional[str] = None,
+        error: Optional[str] = None,
+        retry_at: Optional[datetime] = None,
+    ) -> bool:
+        """
+        Records the outcome of a claimed job
+        :param error: Set if the attempt failed
+        :param retry_at: Queues the job again for a failed attempt
+        :return: False if the worker lost the lease
+        """
+
+        def run(transaction: JobTransaction):
+            current = self._owned(transaction, job)
+            if current is None:
+                return False
+            now = _now()
+            if error is None:
+                status, stage = SUCCEEDED, SUCCEEDED
+            elif retry_at is not None:
+                status, stage = QUEUED, "retrying"
+            else:
+                status, stage = FAILED, FAILED
+            progress = replace(current.progress or JobProgress(), stage=stage)
+            transaction.put(
+                replace(
+                    current,
+                    status=status,
+                    result=result,
+                    error=error,
+                    lease_owner=None,
+                    available_at=retry_at,
+                    progress=progress,
+                    date_updated=now,
+                )
+            )
+            return True
+
+        return await asyncio.to_thread(self._transaction, run)
+
+
+class _FirestoreTransaction(JobTransaction):
+    def __init__(self, jobs, keys, transaction):
+        self._jobs = jobs
+        self._keys = keys
+        self._transaction = transaction
+
+    def get(self, job_id):
+        snapshot = self._jobs.document(job_id).get(transaction=self._transaction)
+        return Job.from_dict(snapshot.to_dict()) if snapshot.exists else None
+
+    def put(self, job):
+        self._transaction.set(self._jobs.document(job.job_id), job.to_dict())
+
+    def get_key(self, key_hash):
+        snapshot = self._keys.document(key_hash).get(transaction=self._transaction)
+        return snapshot.get("job_id") if snapshot.exists else None
+
+    def put_key(self, key_hash, job_id):
+        self._transaction.set(self._keys.document(key_hash), {"job_id": job_id})
+
+
+class FirestoreJobStore(JobStore):
+    """
+    Jobs are documents of the jobs collection, idempotency keys documents of
+    the job_keys collection pointing at the job they queued.
+    """
+
+    def __init__(self):
+        self.client = get_firestore_client()
+        self._jobs = self.client.collection("jobs")
+        self._keys = self.client.collection("job_keys")
+
+    def _transaction(self, run):
+        @firestore.transactional
+        def in_transaction(transaction):
+            # Retried by Firestore on contention
+            return run(_FirestoreTransaction(self._jobs, self._keys, transaction))
+
+        return in_transaction(self.client.transaction())
+
+    def _candidates(self, now, limit):
+        # Needs the jobs (status, available_at) index of firestore.indexes.json
+        query = (
+            self._jobs.where(filter=FieldFilter("status", "in", list(ACTIVE)))
+            .where(filter=FieldFilter("available_at", "<=", now))
+            .order_by("available_at")
+            .limit(limit)
+        )
+        return [snapshot.id for snapshot in query.select(["available_at"]).stream()]
+
+
+def _dumps(job: Job) -> str:
+    return json.dumps(job.to_dict(), default=lambda o: o.isoformat())
+
+
+def _loads(value: str) -> Job:
+    data = json.loads(value)
+    for name in _DATETIME_FIELDS:
+        if data.get(name) is not None:
+            data[name] = datetime.fromisoformat(data[name])
+    return Job.from_dict(data)
+
+
+class _SqliteTransaction(JobTransaction):
+    def __init__(self, connection):
+        self._connection = connection
+
+    def get(self, job_id):
+        row = self._connection.execute(
+            "SELECT value FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return _loads(row[0]) if row else None
+
+    def put(self, job):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, available_at, value) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                job.job_id,
+                job.status,
+                job.available_at.timestamp() if job.available_at else None,
+                _dumps(job),
+            ),
+        )
+
+    def get_key(self, key_hash):
+        row = self._connection.execute(
+            "SELECT job_id FROM job_keys WHERE key_hash = ?", (key_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_key(self, key_hash, job_id):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO job_keys (key_hash, job_id) VALUES (?, ?)",
+            (key_hash, job_id),
+        )
+
+
+class SqliteJobStore(JobStore):
+    """
+    Local stand-in of the Firestore job store. Transactions take the database
+    write lock, so several processes can share one file.
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, "
+                "status TEXT, available_at REAL, value TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS job_keys (key_hash TEXT PRIMARY KEY, "
+                "job_id TEXT NOT NULL)"
+            )
+
+    def _transaction(self, run):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = run(_SqliteTransaction(self._connection))
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return result
+
+    def _candidates(self, now, limit):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) AND available_at <= ? "
+                "ORDER BY available_at LIMIT ?",
+                (*ACTIVE, now.timestamp(), limit),
+            ).fetchall()
+        return [job_id for job_id, in rows]
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    # Process-wide job store selected by JOB_STORE
+    global _job_store
+
+    if _job_store is None:
+        with _job_store_lock:
+            if _job_store is None:
+                if JOB_STORE == "sqlite":
+                    _job_store = SqliteJobStore()
+                else:
+                    _job_store = FirestoreJobStore()
+                _logger.info(f"Job store: {type(_job_store).__name__}")
+    return _job_store
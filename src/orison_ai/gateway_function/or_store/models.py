@@ -16,20 +16,16 @@
 
 # External
 
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, field, fields
 from datetime import datetime
-from mongoengine import (
-    Document,
-    IntField,
-    StringField,
-    ListField,
-    EmbeddedDocument,
-    EmbeddedDocumentField,
-    FloatField,
-    DateTimeField,
-    BooleanField,
-    DictField,
-)
+from inspect import isclass
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Union
+from typing import get_args, get_origin, get_type_hints
+
+# Internal
+
+from exceptions import INVALID_DOCUMENT
 
 
 @dataclass
@@ -45,69 +41,249 @@ class GoogleScholarResponse:
     status: int
 
 
-class BaseModel(Document):
-    name = StringField()
-    email = StringField()
-    attorney_id = StringField(required=True)
-    applicant_id = StringField(required=True)
-    date_created = DateTimeField(required=True, default=datetime.utcnow())
-    phone = StringField()
-    address = StringField()
-    city = StringField()
-    state = StringField()
-    country = StringField()
-    zip_code = StringField()
-    googlescholar = StringField()
-    linkedin = StringField()
-    github = StringField()
-    twitter = StringField()
-    facebook = StringField()
-    instagram = StringField()
-    website = StringField()
-    meta = {"allow_inheritance": True}
-
-
-class Author(EmbeddedDocument):
-    profile_link = StringField(required=True)
-    scholar_id = StringField()
-    name = StringField(required=True)
-    designation = StringField()
-    affiliation = StringField()
-
-
-class Publication(EmbeddedDocument):
-    """
-    MongoDB document class for a Publication detail of the applicant
-    """
-
-    title = StringField(required=True)
-    authors = ListField(StringField())
-    cited_by = IntField()
-    forum_name = StringField()
-    publisher = StringField()
-    abstract = StringField()
-    year = IntField()
-    impact_factor = FloatField()
-    type_of_paper = StringField()  # Conference Journal Article etc
-    peer_reviews = ListField(StringField())
+def required(**kwargs):
+    # Field that has to be set before the document is written
+    return field(default=None, metadata={"required": True}, **kwargs)
+
+
+def _to_int(value):
+    return value if isinstance(value, int) else int(value)
+
+
+def _to_float(value):
+    return value if isinstance(value, float) else float(value)
+
+
+def _converter(annotation) -> Optional[Callable[[Any], Any]]:
+    """
+    Builds the function converting a stored or user provided value to the
+    annotated type. None means the value is kept as is.
+    """
+    origin = get_origin(annotation)
+    if origin is Union:
+        return _converter(
+            next(arg for arg in get_args(annotation) if arg is not type(None))
+        )
+    if origin in (list, List):
+        item = _converter(get_args(annotation)[0])
+        if item is None:
+            return None
+        # scholarly returns some lists as a single string, stored as is
+        return lambda value: (
+            [None if v is None else item(v) for v in value]
+            if isinstance(value, (list, tuple))
+            else value
+        )
+    if origin in (dict, Dict):
+        item = _converter(get_args(annotation)[1])
+        if item is None:
+            return None
+        return lambda value: {
+            k: None if v is None else item(v) for k, v in value.items()
+        }
+    if isclass(annotation) and issubclass(annotation, Model):
+        return lambda value: (
+            value if isinstance(value, annotation) else annotation.from_dict(value)
+        )
+    if annotation is int:
+        return _to_int
+    if annotation is float:
+        return _to_float
+    return None
+
+
+def _encoder(annotation) -> Optional[Callable[[Any], Any]]:
+    # Builds the function converting a value to its Firestore representation
+    origin = get_origin(annotation)
+    if origin is Union:
+        return _encoder(
+            next(arg for arg in get_args(annotation) if arg is not type(None))
+        )
+    if origin in (list, List):
+        if _encoder(get_args(annotation)[0]) is None:
+            return None
+        return lambda value: (
+            [v.to_dict() if isinstance(v, Model) else v for v in value]
+            if isinstance(value, list)
+            else value
+        )
+    if origin in (dict, Dict):
+        if _encoder(get_args(annotation)[1]) is None:
+            return None
+        return lambda value: {
+            k: v.to_dict() if isinstance(v, Model) else v for k, v in value.items()
+        }
+    if isclass(annotation) and issubclass(annotation, Model):
+        return lambda value: value.to_dict() if isinstance(value, Model) else value
+    return None
 
 
+class _Schema:
+    """
+    Per model class field information, resolved once from the type annotations
+    """
+
+    __slots__ = ("names", "keys", "converters", "encoders", "required")
+
+    def __init__(self, cls):
+        hints = get_type_hints(cls)
+        model_fields = fields(cls)
+        self.names = tuple(f.name for f in model_fields)
+        self.keys = frozenset(self.names)
+        self.converters = [
+            (f.name, converter)
+            for f in model_fields
+            if (converter := _converter(hints[f.name])) is not None
+        ]
+        self.encoders = {
+            f.name: encoder
+            for f in model_fields
+            if (encoder := _encoder(hints[f.name])) is not None
+        }
+        self.required = [f.name for f in model_fields if f.metadata.get("required")]
+
+
+class Model:
+    """
+    Base class of the documents stored in Firestore. Subclasses are slotted,
+    keyword only dataclasses converted directly from and to dictionaries.
+    Values are converted to the annotated types when the object is created.
+    """
+
+    __slots__ = ()
+    _schemas: ClassVar[Dict[type, _Schema]] = {}
+
+    @classmethod
+    def _schema(cls) -> _Schema:
+        schema = Model._schemas.get(cls)
+        if schema is None:
+            schema = Model._schemas[cls] = _Schema(cls)
+        return schema
+
+    def __post_init__(self):
+        for name, converter in self._schema().converters:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            try:
+                setattr(self, name, converter(value))
+            except (TypeError, ValueError) as e:
+                raise INVALID_DOCUMENT(
+                    f"Invalid value {value!r} for {type(self).__name__}.{name}", e
+                )
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Creates the model from a Firestore dictionary. Unknown keys are ignored
+        """
+        keys = cls._schema().keys
+        return cls(**{k: v for k, v in data.items() if k in keys})
+
+    def to_dict(self) -> dict:
+        """
+        Converts the model to a Firestore dictionary. Unset fields are left out
+        """
+        schema = self._schema()
+        encoders = schema.encoders
+        data = {}
+        for name in schema.names:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            encoder = encoders.get(name)
+            data[name] = value if encoder is None else encoder(value)
+        return data
+
+    def validate(self):
+        """
+        Checks that all required fields, including those of embedded models, are set
+        """
+        schema = self._schema()
+        missing = [name for name in schema.required if getattr(self, name) is None]
+        if missing:
+            raise INVALID_DOCUMENT(
+                f"{type(self).__name__} is missing required fields {missing}"
+            )
+        for name in schema.encoders:
+            value = getattr(self, name)
+            if isinstance(value, dict):
+                value = list(value.values())
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, Model):
+                    item.validate()
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), default=str)
+
+
+@dataclass(slots=True, kw_only=True)
+class BaseModel(Model):
+    name: Optional[str] = None
+    email: Optional[str] = None
+    attorney_id: Optional[str] = required()
+    applicant_id: Optional[str] = required()
+    date_created: Optional[datetime] = field(default_factory=datetime.utcnow)
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    country: Optional[str] = None
+    zip_code: Optional[str] = None
+    googlescholar: Optional[str] = None
+    linkedin: Optional[str] = None
+    github: Optional[str] = None
+    twitter: Optional[str] = None
+    facebook: Optional[str] = None
+    instagram: Optional[str] = None
+    website: Optional[str] = None
+
+
+@dataclass(slots=True, kw_only=True)
+class Author(Model):
+    # Co-authors are stored without a profile link
+    profile_link: Optional[str] = None
+    scholar_id: Optional[str] = None
+    name: Optional[str] = required()
+    designation: Optional[str] = None
+    affiliation: Optional[str] = None
+
+
+@dataclass(slots=True, kw_only=True)
+class Publication(Model):
+    """
+    Document class for a Publication detail of the applicant
+    """
+
+    title: Optional[str] = required()
+    authors: Optional[List[str]] = None
+    cited_by: Optional[int] = None
+    forum_name: Optional[str] = None
+    publisher: Optional[str] = None
+    abstract: Optional[str] = None
+    year: Optional[int] = None
+    impact_factor: Optional[float] = None
+    type_of_paper: Optional[str] = None  # Conference Journal Article etc
+    peer_reviews: Optional[List[str]] = None
+
+
+@dataclass(slots=True, kw_only=True)
 class GoogleScholarDB(BaseModel):
     """
-    MongoDB document class for Google scholar details of the applicant
+    Document class for Google scholar details of the applicant
     """
 
-    author = EmbeddedDocumentField(Author)
-    co_authors = ListField(EmbeddedDocumentField(Author))
-    keywords = ListField(StringField())
-    cited_by = IntField()
-    h_index = IntField()
-    cited_by_5y = IntField()
-    h_index_5y = IntField()
-    cited_each_year = DictField()
-    publications = ListField(EmbeddedDocumentField(Publication))
-    homepage = StringField()
-    other_details = DictField()
+    author: Optional[Author] = None
+    co_authors: List[Author] = field(default_factory=list)
+    keywords: List[str] = field(default_factory=list)
+    cited_by: Optional[int] = None
+    h_index: Optional[int] = None
+    cited_by_5y: Optional[int] = None
+    h_index_5y: Optional[int] = None
+    cited_each_year: Dict[str, Any] = field(default_factory=dict)
+    publications: List[Publication] = field(default_factory=list)
+    homepage: Optional[str] = None
+    other_details: Dict[str, Any] = field(default_factory=dict)
 
     def to_json(self):
         return {
@@ -125,92 +301,184 @@ class GoogleScholarDB(BaseModel):
         }
 
 
-class SimplifiedScholarSummary(EmbeddedDocument):
-    name = StringField()
-    scholar_id = StringField()
-    citations = IntField()
-    hindex = IntField()
-    publication_count = IntField()
+@dataclass(slots=True, kw_only=True)
+class SimplifiedScholarSummary(Model):
+    name: Optional[str] = None
+    scholar_id: Optional[str] = None
+    citations: Optional[int] = None
+    hindex: Optional[int] = None
+    publication_count: Optional[int] = None
 
 
+@dataclass(slots=True, kw_only=True)
 class EvidenceBuilder(BaseModel):
     """
-    MongoDB document class for Evidence of the applicant
+    Document class for Evidence of the applicant
     """
 
-    summary = StringField()
+    summary: Optional[str] = None
 
 
+@dataclass(slots=True, kw_only=True)
+class NetworkNode(Model):
+    """
+    Scholar of a co-author network and when it was last fetched
+    """
+
+    scholar_id: Optional[str] = required()
+    name: Optional[str] = None
+    citations: Optional[int] = None
+    hindex: Optional[int] = None
+    publication_count: Optional[int] = None
+    coauthor_ids: List[str] = field(default_factory=list)
+    depth: Optional[int] = None
+    fetched_at: Optional[datetime] = None
+
+
+@dataclass(slots=True, kw_only=True)
 class GoogleScholarNetworkDB(BaseModel):
     """
-    MongoDB document class for Google scholar details of the applicant
+    Document class for Google scholar details of the applicant.
+    Networks are stored as nodes keyed by scholar_id in one document per root
+    scholar, network is only set on documents written before.
     """
 
-    network = ListField(EmbeddedDocumentField(SimplifiedScholarSummary), default=[])
+    root_scholar_id: Optional[str] = None
+    nodes: Dict[str, NetworkNode] = field(default_factory=dict)
+    network: List[SimplifiedScholarSummary] = field(default_factory=list)
+    date_updated: Optional[datetime] = None
 
 
-class QandA(EmbeddedDocument):
+@dataclass(slots=True, kw_only=True)
+class QandA(Model):
     """
-    MongoDB document class for QandA details of the applicant
+    Document class for QandA details of the applicant
     """
 
-    question = StringField(required=True)
-    answer = StringField(required=True)
-    source = StringField()
+    question: Optional[str] = required()
+    answer: Optional[str] = required()
+    source: Optional[str] = None
 
 
+@dataclass(slots=True, kw_only=True)
 class StoryBuilder(BaseModel):
     """
-    MongoDB document class for Story of the applicant
+    Document class for Story of the applicant
     """
 
-    summary = ListField(EmbeddedDocumentField(QandA), default=[])
+    summary: List[QandA] = field(default_factory=list)
 
 
+@dataclass(slots=True, kw_only=True)
 class ScreeningBuilder(BaseModel):
     """
-    MongoDB document class for Screening of the applicant
+    Document class for Screening of the applicant
     """
 
-    summary = ListField(EmbeddedDocumentField(QandA), default=[])
+    summary: List[QandA] = field(default_factory=list)
 
 
-class MemoryEntry(EmbeddedDocument):
-    user_message = StringField(required=True)
-    assistant_response = StringField(required=True)
-    timestamp = DateTimeField(default=datetime.utcnow)
+@dataclass(slots=True, kw_only=True)
+class MemoryEntry(Model):
+    user_message: Optional[str] = required()
+    assistant_response: Optional[str] = required()
+    timestamp: Optional[datetime] = field(default_factory=datetime.utcnow)
 
 
+@dataclass(slots=True, kw_only=True)
 class ChatMemoryDB(BaseModel):
     """
-    MongoDB document class for storing chat buffer memory entries.
+    Document class for storing chat buffer memory entries.
+    """
+
+    history: List[MemoryEntry] = field(default_factory=list)
+    date_updated: Optional[datetime] = field(default_factory=datetime.utcnow)
+
+
+@dataclass(slots=True, kw_only=True)
+class ChatTurn(BaseModel):
+    """
+    Document class for one DocAssist exchange. Turns are appended and never
+    rewritten, date_created orders them.
     """
 
-    history = ListField(EmbeddedDocumentField(MemoryEntry), default=[])
-    date_updated = DateTimeField(default=datetime.utcnow)
+    user_message: Optional[str] = required()
+    assistant_response: Optional[str] = required()
+
+
+@dataclass(slots=True, kw_only=True)
+class JobProgress(Model):
+    stage: Optional[str] = None
+    done: Optional[int] = None
+    total: Optional[int] = None
+
+
+@dataclass(slots=True, kw_only=True)
+class Job(Model):
+    """
+    Document class for a long running gateway request processed by a worker.
+    Queued jobs can be claimed once available_at has passed. Running jobs hold
+    a lease until available_at and are claimed again when it expires.
+    """
+
+    job_id: Optional[str] = required()
+    request_type: Optional[str] = required()
+    payload: Dict[str, Any] = field(default_factory=dict)
+    attorney_id: Optional[str] = None
+    applicant_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    status: Optional[str] = "queued"
+    attempts: Optional[int] = 0
+    max_attempts: Optional[int] = 3
+    available_at: Optional[datetime] = None
+    lease_owner: Optional[str] = None
+    progress: Optional[JobProgress] = None
+    result: Optional[str] = None
+    error: Optional[str] = None
+    date_created: Optional[datetime] = None
+    date_updated: Optional[datetime] = None
+
+
+@dataclass(slots=True, kw_only=True)
+class ModelUsage(Model):
+    calls: Optional[int] = 0
+    prompt_tokens: Optional[int] = 0
+    completion_tokens: Optional[int] = 0
+    cost_usd: Optional[float] = 0.0
+
+
+@dataclass(slots=True, kw_only=True)
+class TokenUsage(Model):
+    """
+    Document class for the tokens a gateway request or job attempt spent,
+    by model. Embedding models only have prompt tokens.
+    """
 
-    meta = {
-        "collection": "chat_memory",
-        "indexes": [
-            {"fields": ["applicant_id", "attorney_id"], "unique": True},
-        ],
-    }
+    usage_id: Optional[str] = required()
+    request_id: Optional[str] = None
+    request_type: Optional[str] = required()
+    attorney_id: Optional[str] = None
+    applicant_id: Optional[str] = None
+    job_id: Optional[str] = None
+    models: Dict[str, ModelUsage] = field(default_factory=dict)
+    date_created: Optional[datetime] = None
 
 
+@dataclass(slots=True, kw_only=True)
 class MetaExtract(BaseModel):
     """
-    MongoDB document class for Meta details of the applicant
+    Document class for Meta details of the applicant
     The details get extracted from accepted or rejected historical profiles
     """
 
-    field_keywords = ListField(StringField())
-    designation = StringField()
-    total_citations = IntField()
-    total_publications = IntField()
-    journal_names = ListField(StringField())
-    conference_names = ListField(StringField())
-    number_patents = IntField()
-    number_awards = IntField()
-    media_names = ListField(StringField())
-    acceptance_status = BooleanField()
-    story = StringField()
+    field_keywords: List[str] = field(default_factory=list)
+    designation: Optional[str] = None
+    total_citations: Optional[int] = None
+    total_publications: Optional[int] = None
+    journal_names: List[str] = field(default_factory=list)
+    conference_names: List[str] = field(default_factory=list)
+    number_patents: Optional[int] = None
+    number_awards: Optional[int] = None
+    media_names: List[str] = field(default_factory=list)
+    acceptance_status: Optional[bool] = None
+    story: Optional[str] = None
@@ -0,0 +1,229 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import time
+import atexit
+import signal
+import asyncio
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable, List, Optional
+
+# Internal
+
+from metrics import PERSISTENCE_QUEUE_DEPTH, PERSISTENCE_QUEUE_LAG_SECONDS
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+PERSISTENCE_MAX_ATTEMPTS = int(os.getenv("PERSISTENCE_MAX_ATTEMPTS", "8"))
+PERSISTENCE_RETRY_DELAY = float(os.getenv("PERSISTENCE_RETRY_DELAY", "0.5"))
+# Writes out of attempts are not dropped, they are retried at this interval
+PERSISTENCE_MAX_RETRY_DELAY = float(os.getenv("PERSISTENCE_MAX_RETRY_DELAY", "60"))
+# Readers waiting for the writes of a key give up after this many seconds
+PERSISTENCE_WAIT_TIMEOUT = float(os.getenv("PERSISTENCE_WAIT_TIMEOUT", "30"))
+PERSISTENCE_SHUTDOWN_TIMEOUT = float(os.getenv("PERSISTENCE_SHUTDOWN_TIMEOUT", "10"))
+
+
+@dataclass
+class _Job:
+    run: Callable[[], Awaitable[Any]]
+    description: str
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class PersistenceQueue:
+    """
+    Runs writes in the background so they stay off the request path.
+    Jobs with the same key run one at a time in submission order, and a failed
+    job is retried with exponential backoff before the next one starts. A job
+    out of attempts keeps being retried every max_retry_delay seconds, so
+    writes are delivered at least once while the process lives. Jobs have to
+    be idempotent, since a write may be repeated after a timeout.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = PERSISTENCE_MAX_ATTEMPTS,
+        retry_delay: float = PERSISTENCE_RETRY_DELAY,
+        max_retry_delay: float = PERSISTENCE_MAX_RETRY_DELAY,
+    ):
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._pending = {}  # key -> deque of _Job, the head is running
+        self._workers = {}  # key -> asyncio.Task draining the key
+        self._loop = None
+        self.completed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def submit(
+        self, key: Hashable, run: Callable[[], Awaitable[Any]], description: str = ""
+    ):
+        """
+        Queue a write. Must be called from the event loop running the queue.
+        :param key: Jobs with the same key are run in order
+        :param run: Coroutine function performing the write
+        :param description: Logged when the write fails
+        """
+        self._loop = asyncio.get_running_loop()
+        self._pending.setdefault(key, deque()).append(_Job(run, description))
+        if key not in self._workers:
+            self._workers[key] = asyncio.ensure_future(self._drain(key))
+
+    async def _drain(self, key: Hashable):
+        jobs = self._pending[key]
+        try:
+            while jobs:
+                await self._run(jobs[0])
+                jobs.popleft()
+        finally:
+            self._workers.pop(key, None)
+            if not jobs:
+                self._pending.pop(key, None)
+
+    async def _run(self, job: _Job):
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await job.run()
+                self.completed += 1
+                return
+            except Exception as e:
+                self.retried += 1
+                if attempt == self._max_attempts:
+                    # Later jobs of the key stay queued behind it, keeping their order
+                    self.failed += 1
+                    _logger.error(
+                        f"Failed {job.description} {attempt} times, retrying every "
+                        f"{self._max_retry_delay:.0f}s. Error: {e}"
+                    )
+                elif attempt < self._max_attempts:
+                    _logger.warning(f"Failed {job.description}, retrying. Error: {e}")
+                delay = min(
+                    self._retry_delay * 2 ** (attempt - 1), self._max_retry_delay
+                )
+                await asyncio.sleep(delay)
+
+    async def wait(self, key: Hashable, timeout: float = PERSISTENCE_WAIT_TIMEOUT):
+        # Wait until every job queued for the key is written, or the timeout passed
+        worker = self._workers.get(key)
+        if worker is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(worker), timeout)
+        except asyncio.TimeoutError:
+            _logger.warning(f"Writes of {key} still pending after {timeout:.0f}s")
+
+    async def flush(self):
+        # Wait until every queued job is written
+        while self._workers:
+            await asyncio.gather(
+                *[asyncio.shield(w) for w in list(self._workers.values())]
+            )
+
+    def stats(self) -> dict:
+        """
+        :return: Queue depth, age of the oldest queued write in seconds and counters
+        """
+        return {
+            "depth": self.depth(),
+            "lag_seconds": self.lag_seconds(),
+            "completed": self.completed,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    def depth(self) -> int:
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def lag_seconds(self) -> float:
+        oldest = min(
+            (jobs[0].enqueued for jobs in self._pending.values()), default=None
+        )
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+
+_persistence_queue = None
+# Called before the queue is flushed on shutdown, to submit the writes still held back
+_shutdown_hooks: List[Callable[[], None]] = []
+
+
+def add_shutdown_hook(hook: Callable[[], None]):
+    _shutdown_hooks.append(hook)
+
+
+def _flush_on_shutdown():
+    for hook in _shutdown_hooks:
+        try:
+            hook()
+        except Exception as e:
+            _logger.error(f"Shutdown hook failed. Error: {e}")
+    queue = _persistence_queue
+    if queue is None or not queue.depth():
+        return
+    _logger.info(f"Flushing persistence queue: {queue.stats()}")
+    loop = queue._loop
+    if loop.is_closed() or not loop.is_running():
+        _logger.error("Persistence queue not flushed on shutdown. Its loop is stopped")
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(queue.flush(), loop).result(
+            PERSISTENCE_SHUTDOWN_TIMEOUT
+        )
+    except Exception as e:
+        _logger.error(f"Persistence queue not flushed on shutdown. Error: {e}")
+
+
+def flush_on_sigterm():
+    """
+    Flushes the queue when the process receives SIGTERM, which does not run
+    atexit handlers. The previous handler runs afterwards. Must be called from
+    the main thread.
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handler(signum, frame):
+        _flush_on_shutdown()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    if threading.current_thread() is not threading.main_thread():
+        _logger.warning("SIGTERM handler not installed outside of the main thread")
+        return
+    signal.signal(signal.SIGTERM, handler)
+
+
+def get_persistence_queue() -> PersistenceQueue:
+    # Process-wide queue, flushed when the process exits
+    global _persistence_queue
+
+    if _persistence_queue is None:
+        _persistence_queue = PersistenceQueue()
+        PERSISTENCE_QUEUE_DEPTH.set_function(_persistence_queue.depth)
+        PERSISTENCE_QUEUE_LAG_SECONDS.set_function(_persistence_queue.lag_seconds)
+        atexit.register(_flush_on_shutdown)
+    return _persistence_queue
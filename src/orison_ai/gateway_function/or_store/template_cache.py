@@ -0,0 +1,177 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+# Internal
+
+from or_store.firebase import FireStoreDB
+from tracing import span
+from metrics import cache_lookup
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+TEMPLATE_CACHE_TTL = float(os.getenv("TEMPLATE_CACHE_TTL", "3600"))
+# Names come from requests, least recently used templates and their listeners are dropped
+TEMPLATE_CACHE_MAX_ENTRIES = int(os.getenv("TEMPLATE_CACHE_MAX_ENTRIES", "32"))
+
+
+class TemplateCache:
+    """
+    Caches documents of the templates collection in their compiled form.
+    Entries expire after a TTL and are refreshed in place by a Firestore
+    snapshot listener whenever the template document changes. Missing
+    templates are neither cached nor listened to.
+    """
+
+    def __init__(
+        self,
+        compile: Callable[[dict], Any],
+        ttl_seconds: float = TEMPLATE_CACHE_TTL,
+        collection_name: str = "templates",
+        listen: bool = True,
+        max_entries: int = TEMPLATE_CACHE_MAX_ENTRIES,
+    ):
+        """
+        :param compile: Converts the template document dictionary into its cached form
+        :param ttl_seconds: Seconds after which an entry is fetched again
+        :param collection_name: Firestore collection holding the templates
+        :param listen: Attach a snapshot listener to every loaded template
+        :param max_entries: Templates kept at most, with their listeners
+        """
+        self._compile = compile
+        self._ttl_seconds = ttl_seconds
+        self._collection_name = collection_name
+        self._listen = listen
+        self._max_entries = max_entries
+        self._entries = OrderedDict()  # name -> (expiry time, compiled template)
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unsubscribe(watches: list):
+        for watch in watches:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                _logger.warning(f"Could not stop template listener. Error: {e}")
+
+    def _store(self, name: str, js: dict):
+        compiled = self._compile(js)
+        evicted = []
+        with self._lock:
+            self._entries[name] = (time.monotonic() + self._ttl_seconds, compiled)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self._max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                evicted.append(self._watches.pop(oldest, None))
+        self._unsubscribe([watch for watch in evicted if watch is not None])
+        return compiled
+
+    def _drop(self, name: str):
+        with self._lock:
+            self._entries.pop(name, None)
+            watch = self._watches.pop(name, None)
+        if watch is not None:
+            self._unsubscribe([watch])
+
+    def _on_snapshot(self, name: str):
+        def callback(doc_snapshots, changes, read_time):
+            for doc in doc_snapshots:
+                if doc.exists:
+                    _logger.info(f"Template {name} changed. Refreshing cache")
+                    self._store(name, doc.to_dict())
+                else:
+                    _logger.info(f"Template {name} deleted. Dropping it from cache")
+                    self._drop(name)
+
+        return callback
+
+    def _watch(self, doc_ref, name: str):
+        with self._lock:
+            if not self._listen or name in self._watches or name not in self._entries:
+                return
+        try:
+            watch = doc_ref.on_snapshot(self._on_snapshot(name))
+        except Exception as e:
+            _logger.warning(
+                f"Could not listen to template {name}. Relying on TTL. Error: {e}"
+            )
+            return
+        with self._lock:
+            # Evicted, or another request started listening meanwhile
+            keep = name not in self._watches and name in self._entries
+            if keep:
+                self._watches[name] = watch
+        if not keep:
+            self._unsubscribe([watch])
+
+    def get(self, name: str) -> Any:
+        """
+        Get a compiled template, fetching it from Firestore if missing or expired
+        :param name: Document name of the template
+        :return: Compiled template or None if the template does not exist
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+        if entry is not None and entry[0] > time.monotonic():
+            cache_lookup("template", True)
+            return entry[1]
+        cache_lookup("template", False)
+        _logger.info(f"Loading template {name} from Firestore")
+        doc_ref = FireStoreDB().client.collection(self._collection_name).document(name)
+        with span("firestore.get", {"firestore.collection": self._collection_name}):
+            doc = doc_ref.get()
+        if not doc.exists:
+            self._drop(name)
+            return None
+        compiled = self._store(name, doc.to_dict())
+        self._watch(doc_ref, name)
+        return compiled
+
+    async def aget(self, name: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+        if entry is not None and entry[0] > time.monotonic():
+            cache_lookup("template", True)
+            return entry[1]
+        return await asyncio.to_thread(self.get, name)
+
+    def warm(self, names: Iterable[str]):
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                _logger.error(f"Failed to warm template {name}. Error: {e}")
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            names = list(self._entries) if name is None else [name]
+        for dropped in names:
+            self._drop(dropped)
@@ -0,0 +1,235 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import asyncio
+import logging
+import hashlib
+import datetime
+import functools
+from typing import List, Optional
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+# Internal
+
+from or_store.models import TokenUsage
+from or_store import firebase
+from or_store.write_buffer import MAX_BATCH_WRITES
+from or_store.persistence_queue import (
+    PersistenceQueue,
+    add_shutdown_hook,
+    get_persistence_queue,
+)
+from tracing import span
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+# Records are written together once this many are pending or after the interval
+USAGE_BATCH_SIZE = int(os.getenv("USAGE_BATCH_SIZE", "50"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "10"))
+USAGE_SHUTDOWN_TIMEOUT = float(os.getenv("USAGE_SHUTDOWN_TIMEOUT", "5"))
+
+# usage/{attorney id}/{applicant id}/{usage id} holds one record per request
+USAGE_COLLECTION = "usage"
+# usage_totals/{attorney id}_{applicant id} sums the records by request type and model
+USAGE_TOTALS_COLLECTION = "usage_totals"
+# usage_batches/{batch id} is created by the batch it marks, so a replayed commit fails whole
+USAGE_BATCHES_COLLECTION = "usage_batches"
+_UNKNOWN = "unknown"
+
+
+def _totals(records: List[TokenUsage]) -> dict:
+    # Increments of the totals documents, one document per applicant
+    totals = {}
+    for record in records:
+        attorney_id = record.attorney_id or _UNKNOWN
+        applicant_id = record.applicant_id or _UNKNOWN
+        document = totals.setdefault(
+            f"{attorney_id}_{applicant_id}",
+            {"attorney_id": attorney_id, "applicant_id": applicant_id, "types": {}},
+        )
+        request_type = document["types"].setdefault(
+            record.request_type, {"requests": 0, "models": {}}
+        )
+        request_type["requests"] += 1
+        for model, usage in record.models.items():
+            model_totals = request_type["models"].setdefault(
+                model,
+                {
+                    "calls": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "cost_usd": 0.0,
+                },
+            )
+            for name in model_totals:
+                model_totals[name] += getattr(usage, name)
+    return totals
+
+
+def _batch_id(records: List[TokenUsage], start: int) -> str:
+    # Same id for every retry of the write, records have fixed ids
+    usage_ids = "\x00".join(record.usage_id for record in records)
+    return hashlib.sha256(f"{usage_ids}:{start}".encode()).hexdigest()
+
+
+def _increments(document: dict) -> dict:
+    # Nested totals as a merge of Firestore increments
+    return {
+        "attorney_id": document["attorney_id"],
+        "applicant_id": document["applicant_id"],
+        "date_updated": datetime.datetime.utcnow(),
+        "request_types": {
+            request_type: {
+                "requests": firestore.Increment(values["requests"]),
+                "models": {
+                    model: {
+                        name: firestore.Increment(value)
+                        for name, value in model_totals.items()
+                    }
+                    for model, model_totals in values["models"].items()
+                },
+            }
+            for request_type, values in document["types"].items()
+        },
+    }
+
+
+class UsageRecorder:
+    """
+    Collects the token usage of finished requests and writes it in batches
+    through the persistence queue. Each batch stores the records of the
+    requests and adds them to the totals of their applicants.
+    """
+
+    def __init__(
+        self,
+        queue: Optional[PersistenceQueue] = None,
+        batch_size: int = USAGE_BATCH_SIZE,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+    ):
+        self._queue = queue or get_persistence_queue()
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._pending: List[TokenUsage] = []
+        self._timer = None
+        self._loop = None
+        self.recorded = 0
+
+    def record(self, usage: TokenUsage):
+        # Must be called from the event loop running the persistence queue
+        self._loop = asyncio.get_running_loop()
+        usage.date_created = usage.date_created or datetime.datetime.utcnow()
+        self._pending.append(usage)
+        self.recorded += 1
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self._loop.call_later(self._flush_interval, self.flush)
+
+    def flush(self):
+        # Hands the pending records to the persistence queue as one write
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        records, self._pending = self._pending, []
+        if records:
+            self._queue.submit(
+                USAGE_COLLECTION,
+                functools.partial(self._write, records),
+                f"writing {len(records)} usage records",
+            )
+
+    @staticmethod
+    async def _write(records: List[TokenUsage]):
+        # Retried as a whole, records have fixed ids. Each batch creates its
+        # marker, so a batch applied before a failed attempt is not committed
+        # again and its totals are not counted twice.
+        # Runs on the background loop, commits must not block the requests on it
+        async_mode = firebase.FIRESTORE_ASYNC_MODE
+        client = (
+            firebase.get_async_firestore_client()
+            if async_mode == "native"
+            else firebase.get_firestore_client()
+        )
+        writes = []
+        for record in records:
+            record.validate()
+            document = (
+                client.collection(USAGE_COLLECTION)
+                .document(record.attorney_id or _UNKNOWN)
+                .collection(record.applicant_id or _UNKNOWN)
+                .document(record.usage_id)
+            )
+            writes.append((document, record.to_dict()))
+        for document_id, totals in _totals(records).items():
+            document = client.collection(USAGE_TOTALS_COLLECTION).document(document_id)
+            writes.append((document, _increments(totals)))
+        batch_writes = MAX_BATCH_WRITES - 1  # One write of each batch is its marker
+        for start in range(0, len(writes), batch_writes):
+            batch = client.batch()
+            marker = client.collection(USAGE_BATCHES_COLLECTION).document(
+                _batch_id(records, start)
+            )
+            batch.create(
+                marker,
+                {"records": len(records), "date_created": datetime.datetime.utcnow()},
+            )
+            for document, data in writes[start : start + batch_writes]:
+                batch.set(document, data, merge=True)
+            try:
+                with span("firestore.batch_commit", {"firestore.collection": "usage"}):
+                    if async_mode == "native":
+                        await batch.commit()
+                    elif async_mode == "executor":
+                        await asyncio.to_thread(batch.commit)
+                    else:
+                        batch.commit()
+            except AlreadyExists:
+                _logger.info(f"Usage batch {marker.id} was already written, skipping")
+        _logger.debug(f"Wrote {len(records)} usage records")
+
+
+_usage_recorder = None
+
+
+def _flush_on_shutdown():
+    # Runs before the persistence queue is flushed on exit or SIGTERM
+    recorder = _usage_recorder
+    loop = recorder._loop if recorder else None
+    if loop is None or loop.is_closed() or not loop.is_running():
+        return
+
+    async def flush():
+        recorder.flush()
+
+    try:
+        asyncio.run_coroutine_threadsafe(flush(), loop).result(USAGE_SHUTDOWN_TIMEOUT)
+    except Exception as e:
+        _logger.error(f"Usage records not flushed on shutdown. Error: {e}")
+
+
+def get_usage_recorder() -> UsageRecorder:
+    global _usage_recorder
+
+    if _usage_recorder is None:
+        _usage_recorder = UsageRecorder(get_persistence_queue())
+        add_shutdown_hook(_flush_on_shutdown)
+    return _usage_recorder
@@ -0,0 +1,158 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import time
+import asyncio
+import logging
+from typing import Any, Optional
+from firebase_admin import firestore
+
+# Internal
+
+from tracing import span
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+# Firestore limit of writes in a single batch commit
+MAX_BATCH_WRITES = 500
+
+_NOT_COALESCED = object()
+
+
+def _coalesce(previous: Any, current: Any) -> Any:
+    """
+    Combine two consecutive updates of the same field into one
+    :return: The combined update or _NOT_COALESCED if they cannot be combined
+    """
+    if not isinstance(
+        current, (firestore.ArrayUnion, firestore.ArrayRemove, firestore.Increment)
+    ):
+        # A plain value overwrites whatever was written before
+        return current
+    if isinstance(previous, firestore.ArrayUnion):
+        if isinstance(current, firestore.ArrayUnion):
+            return firestore.ArrayUnion(
+                previous.values
+                + [v for v in current.values if v not in previous.values]
+            )
+        if isinstance(current, firestore.ArrayRemove) and all(
+            v in current.values for v in previous.values
+        ):
+            # Adding values and removing them again leaves only the removal
+            return current
+    elif isinstance(previous, firestore.ArrayRemove):
+        if isinstance(current, firestore.ArrayRemove):
+            return firestore.ArrayRemove(
+                previous.values
+                + [v for v in current.values if v not in previous.values]
+            )
+    elif isinstance(previous, firestore.Increment):
+        if isinstance(current, firestore.Increment):
+            return firestore.Increment(previous.value + current.value)
+    return _NOT_COALESCED
+
+
+class WriteBuffer:
+    """
+    Buffers field updates and commits them with WriteBatches.
+    Consecutive updates of a document are merged into a single write whenever
+    the result is identical to applying them one by one. Writes to the same
+    document are always committed in the order they were issued.
+    """
+
+    def __init__(
+        self,
+        client,
+        flush_interval: Optional[float] = None,
+        async_mode: str = "blocking",
+        async_client=None,
+    ):
+        """
+        :param client: Firestore client used to create batches
+        :param flush_interval: Seconds after which buffered writes are flushed by maybe_flush
+        :param async_mode: FIRESTORE_ASYNC_MODE used to commit the batches
+        :param async_client: Firestore AsyncClient committing the batches in native mode
+        """
+        self._client = client
+        self._flush_interval = flush_interval
+        self._async_mode = async_mode
+        self._async_client = async_client
+        self._writes = []  # [document reference, field updates]
+        self._last_write = {}  # document path -> index in self._writes
+        self._last_flush = time.monotonic()
+        self.issued = 0
+        self.committed = 0
+
+    def __len__(self):
+        return len(self._writes)
+
+    def update(self, document, updates: dict):
+        self.issued += 1
+        index = self._last_write.get(document.path)
+        if index is not None:
+            pending = self._writes[index][1]
+            merged = dict(pending)
+            for field, value in updates.items():
+                merged[field] = (
+                    _coalesce(pending[field], value) if field in pending else value
+                )
+                if merged[field] is _NOT_COALESCED:
+                    break
+            else:
+                self._writes[index][1] = merged
+                return
+        self._last_write[document.path] = len(self._writes)
+        self._writes.append([document, dict(updates)])
+
+    async def maybe_flush(self):
+        if (
+            self._flush_interval is not None
+            and time.monotonic() - self._last_flush >= self._flush_interval
+        ):
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Commit all buffered writes
+        :return: Number of writes committed
+        """
+        writes, self._writes, self._last_write = self._writes, [], {}
+        self._last_flush = time.monotonic()
+        native = self._async_mode == "native"
+        client = self._async_client if native else self._client
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = client.batch()
+            for document, updates in writes[start : start + MAX_BATCH_WRITES]:
+                if native:
+                    document = client.document(document.path)
+                batch.update(document, updates)
+            # Commits of up to MAX_BATCH_WRITES must not block the shared loop
+            with span("firestore.batch_commit"):
+                if native:
+                    await batch.commit()
+                elif self._async_mode == "executor":
+                    await asyncio.to_thread(batch.commit)
+                else:
+                    batch.commit()
+        if writes:
+            _logger.debug(
+                f"Committed {len(writes)} coalesced writes for {self.issued} updates"
+            )
+        self.committed += len(writes)
+        return len(writes)
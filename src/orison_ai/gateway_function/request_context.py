@@ -0,0 +1,179 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import uuid
+import asyncio
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Internal
+
+from exceptions import OrisonMessenger_INITIALIZATION_FAILED
+from or_store.firebase import (
+    OrisonSecrets,
+    get_firestore_client,
+    get_async_firestore_client,
+)
+from or_llm.orison_messenger import OrisonMessenger
+from tracing import span
+from metrics import cache_lookup
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+# Messengers kept per event loop, their async clients are bound to it
+MESSENGER_POOL_SIZE = int(os.getenv("MESSENGER_POOL_SIZE", "32"))
+
+_messenger_pools = weakref.WeakKeyDictionary()
+_messenger_pool_lock = threading.Lock()
+
+
+def pooled_messenger(secrets: OrisonSecrets) -> OrisonMessenger:
+    """
+    Process-wide messenger of an applicant collection, least recently used
+    messengers are dropped beyond MESSENGER_POOL_SIZE. Pooled messengers keep
+    no chat memory and refuse requests using it, chats build their own.
+    """
+    loop = asyncio.get_running_loop()
+    with _messenger_pool_lock:
+        pool = _messenger_pools.setdefault(loop, OrderedDict())
+        messenger = pool.get(secrets.collection_name)
+        cache_lookup("messenger", messenger is not None)
+        if messenger is not None:
+            pool.move_to_end(secrets.collection_name)
+            return messenger
+    try:
+        with span("messenger.init"):
+            messenger = OrisonMessenger(secrets=secrets, shared=True)
+    except Exception as e:
+        raise OrisonMessenger_INITIALIZATION_FAILED(exception=e)
+    with _messenger_pool_lock:
+        pool[secrets.collection_name] = messenger
+        while len(pool) > MESSENGER_POOL_SIZE:
+            pool.popitem(last=False)
+    return messenger
+
+
+class _SharedResources:
+    # Secrets and messengers resolved by a request and the sub-requests of its batch
+
+    def __init__(self):
+        self.secrets: Dict[Tuple[str, str], OrisonSecrets] = {}
+        self.messengers: Dict[str, OrisonMessenger] = {}
+
+
+class _RequestLogger(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[{self.extra['request_id']}] {msg}", kwargs
+
+
+class RequestContext:
+    """
+    State of one gateway request handed to its handler. Secrets, messenger
+    and clients are built on first use, at most once per request, and are
+    shared with the other sub-requests of a batch.
+    """
+
+    def __init__(
+        self,
+        payload: Optional[dict] = None,
+        claims: Optional[dict] = None,
+        request_id: Optional[str] = None,
+        job_id: Optional[str] = None,
+        _resources: Optional[_SharedResources] = None,
+    ):
+        """
+        :param payload: The request payload
+        :param claims: Claims of the verified Firebase ID token
+        :param request_id: Prefixes the log lines of the request. Generated if not set
+        :param job_id: Set if the request runs as a background job
+        """
+        self.payload = payload or {}
+        self.claims = claims or {}
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.job_id = job_id
+        self._resources = _resources or _SharedResources()
+        self.logger = _RequestLogger(_logger, {"request_id": self.request_id})
+
+    def child(self, payload: dict, index: int) -> "RequestContext":
+        # Context of a sub-request of a batch
+        return RequestContext(
+            payload=payload,
+            claims=self.claims,
+            request_id=f"{self.request_id}.{index}",
+            _resources=self._resources,
+        ).bind(self.logger.logger)
+
+    def bind(self, logger: logging.Logger) -> "RequestContext":
+        # Logs through the handler's logger
+        self.logger = _RequestLogger(logger, {"request_id": self.request_id})
+        return self
+
+    @property
+    def uid(self) -> Optional[str]:
+        return self.claims.get("uid")
+
+    @property
+    def attorney_id(self) -> str:
+        return self.payload["attorneyId"]
+
+    @property
+    def applicant_id(self) -> str:
+        return self.payload["applicantId"]
+
+    @property
+    def secrets(self) -> OrisonSecrets:
+        key = (self.attorney_id, self.applicant_id)
+        secrets = self._resources.secrets.get(key)
+        if secrets is None:
+            with span("secrets.resolve"):
+                secrets = self._resources.secrets[key] = (
+                    OrisonSecrets.from_attorney_applicant(*key)
+                )
+        return secrets
+
+    @property
+    def messenger(self) -> OrisonMessenger:
+        """
+        Messenger of the applicant collection. Chats build their own
+        messenger, it keeps the chat memory of the conversation.
+        """
+        secrets = self.secrets
+        messenger = self._resources.messengers.get(secrets.collection_name)
+        if messenger is None:
+            messenger = self._resources.messengers[secrets.collection_name] = (
+                pooled_messenger(secrets)
+            )
+        return messenger
+
+    @property
+    def qdrant(self):
+        # Async Qdrant client of the applicant collection
+        return self.messenger.async_qdrant_client
+
+    @property
+    def firestore(self):
+        return get_firestore_client()
+
+    @property
+    def async_firestore(self):
+        return get_async_firestore_client()
@@ -15,6 +15,10 @@
 # ==========================================================================
 
 import logging
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from request_context import RequestContext
 
 logging.basicConfig(level=logging.INFO)
 
@@ -27,9 +31,17 @@ def ErrorResponse(message, status_code=400):
     return {"message": f"{message}", "status": status_code}
 
 
+def BatchResponse(message, results, status_code=200):
+    return {"message": f"{message}", "status": status_code, "results": results}
+
+
+def AcceptedResponse(message, job_id, status_code=202):
+    return {"message": f"{message}", "status": status_code, "jobId": job_id}
+
+
 class RequestHandler:
     def __init__(self, request_type):
         self.logger = logging.getLogger(request_type)
 
-    async def handle_request(self, request: dict):
+    async def handle_request(self, request: dict, context: "RequestContext"):
         return ErrorResponse("Not implemented")
@@ -16,7 +16,10 @@
 
 # External
 
+import os
+import time
 import asyncio
+from dataclasses import replace
 from typing import List
 
 # Internal
@@ -24,122 +27,162 @@ from typing import List
 from request_handler import RequestHandler, OKResponse, ErrorResponse
 from or_store.models import ScreeningBuilder
 from or_store.db_interfaces import ScreeningClient
-from or_store.firebase import OrisonSecrets
-from or_store.firebase import FireStoreDB
-from exceptions import OrisonMessenger_INITIALIZATION_FAILED
+from or_store.template_cache import TemplateCache
+from utils import percentile
+from jobs import report_progress
+from request_context import RequestContext
+from or_llm.scheduler import get_llm_scheduler, Priority
 from or_llm.orison_messenger import (
     OrisonMessenger,
     Prompt,
+    INVALID_RESPONSE,
+    ESTIMATED_REQUEST_TOKENS,
 )
 
+# "structured" returns the answer and its validity from a single LLM call.
+# "two_pass" asks the LLM a second time to validate every answer.
+VALIDATION_MODE = os.getenv("SUMMARIZE_VALIDATION_MODE", "structured")
+DEFAULT_QUESTIONNAIRE = "eb1_a_questionnaire"
+
 
 class Summarize(RequestHandler):
+    # Compiled questionnaires shared by all screenings of this process
+    templates = TemplateCache(compile=lambda js: Summarize.compile_questionnaire(js))
+
     def __init__(self):
         super().__init__(str(self.__class__.__qualname__))
 
-    def initialize(self, secrets):
-        try:
-            self._orison_messenger = OrisonMessenger(secrets=secrets)
-        except Exception as e:
-            raise OrisonMessenger_INITIALIZATION_FAILED(exception=e)
-        self._screening_client = ScreeningClient()
+    @staticmethod
+    def compile_questionnaire(js: dict) -> List[Prompt]:
+        """
+        Convert a questionnaire template document into prompts.
+        :param js: Template document
+        """
+        # Loop through the task array in the document to extract question, detail_level, and tag
+        return [
+            Prompt(
+                question=task.get("question"),
+                detail_level=task.get("detail_level"),
+                tag=task.get("tag"),
+            )
+            for task in js.get("task", [])
+        ]
 
     @staticmethod
-    async def prompts(logger) -> List[Prompt]:
+    async def prompts(
+        logger, questionnaire: str = DEFAULT_QUESTIONNAIRE
+    ) -> List[Prompt]:
         """
-        Load prompts from Firestore using attorney ID.
+        Load prompts of a questionnaire from the template cache.
         :param logger: Logger object
+        :param questionnaire: Name of the questionnaire template
         """
 
-        prompts = []
-
         try:
-            # Initialize Firestore client
-            client = FireStoreDB().client
-
-            # Reference the document in Firestore
-            doc_ref = client.collection("templates").document("eb1_a_questionnaire")
-            doc = doc_ref.get()
-
-            if doc.exists:
-                # Extract data from Firestore document
-                js = doc.to_dict()
-
-                # Loop through the task array in the document to extract question, detail_level, and tag
-                for task in js.get("task", []):
-                    question = task.get("question")
-                    detail_level = task.get("detail_level")
-                    tag = task.get("tag")
-
-                    # Create a Prompt object and append to the prompts list
-                    prompts.append(
-                        Prompt(question=question, detail_level=detail_level, tag=tag)
-                    )
-            else:
-                logger.error(f"No questionnaire found for applicant.")
-
+            compiled = await Summarize.templates.aget(questionnaire)
+            if compiled is None:
+                logger.error(f"No questionnaire {questionnaire} found for applicant.")
+                return []
+            # Screenings get their own copies of the cached prompts
+            return [replace(prompt) for prompt in compiled]
         except Exception as e:
             logger.error(f"Error fetching questionnaire for applicant. {e}")
+            return []
 
-        return prompts
-
-    async def validate_response(self, prompt):
+    @staticmethod
+    async def validate_response(messenger: OrisonMessenger, prompt):
         response_verification_prompt = f"Here is a question: {prompt.question}.\nHere is the answer: {prompt.answer}.\nIs this answer even a little bit appropriate response to the question? Respond in true or false. no additional text."
-        chat_response = await self._orison_messenger._system_chain.ainvoke(
-            response_verification_prompt
-        )
-        response = chat_response.get("text")
+        response = await messenger.ainvoke(response_verification_prompt, use_cache=True)
         if "false" in response:
-            prompt.answer = "Invalid response from AI. Either data is missing or question is not applicable to you."
+            prompt.answer = INVALID_RESPONSE
             prompt.source = "N/A"
         return prompt
 
-    async def summarize(self, prompts: List[Prompt]):
-        self.logger.info("Generating screening")
+    async def summarize(
+        self,
+        context: RequestContext,
+        prompts: List[Prompt],
+        validation_mode: str = VALIDATION_MODE,
+    ):
+        logger = context.logger
+        messenger = context.messenger
+        logger.info(f"Generating screening with {validation_mode} validation")
+        scheduler = get_llm_scheduler()
+        latencies = []
+        start_time = time.monotonic()
+
+        async def answer_prompt(prompt):
+            if validation_mode == "two_pass":
+                # First, send the request
+                response = await messenger.request(prompt, use_cache=True)
+                # Then, validate the response
+                return await self.validate_response(messenger, response)
+            return await messenger.request(prompt, use_cache=True, validate=True)
 
         async def process_prompt(prompt):
-            # First, send the request
-            response = await self._orison_messenger.request(prompt)
-            # Then, validate the response
-            validated_response = await self.validate_response(response)
-            return validated_response
+            prompt_start = time.monotonic()
+            result = await scheduler.submit(
+                lambda: answer_prompt(prompt),
+                priority=Priority.BATCH,
+                tokens=OrisonMessenger.number_tokens(prompt.question)
+                + ESTIMATED_REQUEST_TOKENS,
+            )
+            latencies.append(time.monotonic() - prompt_start)
+            report_progress("questions", len(latencies), len(prompts))
+            return result
 
-        # Chain request and validation for each prompt
+        # Prompts are admitted by the shared scheduler under its concurrency and token limits
         tasks = [process_prompt(prompt) for prompt in prompts]
         results = await asyncio.gather(*tasks)
+        logger.info(
+            f"Screening of {len(prompts)} prompts took {time.monotonic() - start_time:.2f}s. "
+            f"Per-prompt latency p50: {percentile(latencies, 50):.2f}s, p95: {percentile(latencies, 95):.2f}s"
+        )
 
         screening = ScreeningBuilder()
         for result in results:
             screening.summary.append(result)
 
-        self.logger.info("Generating screening...DONE")
+        if messenger._llm_cache:
+            logger.info(f"LLM cache stats: {messenger._llm_cache.stats()}")
+        logger.info("Generating screening...DONE")
         return screening
 
-    async def handle_request(self, request_json):
+    async def handle_request(self, request_json, context: RequestContext):
+        logger = context.logger
         try:
-            self.logger.info(f"Handling summarize request: {request_json}")
-            attorney_id = request_json["attorneyId"]
-            applicant_id = request_json["applicantId"]
-            secrets = OrisonSecrets.from_attorney_applicant(attorney_id, applicant_id)
-            self.logger.info("Initializing summarizer with secrets")
-            self.initialize(secrets)
-            prompts = await self.prompts(logger=self.logger)
-            self.logger.info("Initializing summarizer with secrets...done")
+            logger.info(f"Handling summarize request: {request_json}")
+            attorney_id = context.attorney_id
+            applicant_id = context.applicant_id
+            logger.info("Initializing summarizer with secrets")
+            prompts = await self.prompts(
+                logger=logger,
+                questionnaire=request_json.get("questionnaire", DEFAULT_QUESTIONNAIRE),
+            )
+            logger.info("Initializing summarizer with secrets...done")
             if not prompts:
                 message = f"No prompts found for attorney ID: {attorney_id}"
-                self.logger.error(message)
+                logger.error(message)
                 return ErrorResponse(message)
-            screening = await self.summarize(prompts)
+            screening = await self.summarize(
+                context,
+                prompts,
+                validation_mode=request_json.get("validationMode", VALIDATION_MODE),
+            )
             screening.attorney_id = attorney_id
             screening.applicant_id = applicant_id
-            self.logger.info("Storing screening in Firestore")
-            id = await self._screening_client.insert(
-                attorney_id=attorney_id, applicant_id=applicant_id, doc=screening
+            logger.info("Storing screening in Firestore")
+            # Retried jobs replace the screening of the failed attempt
+            id = await ScreeningClient().insert(
+                attorney_id=attorney_id,
+                applicant_id=applicant_id,
+                doc=screening,
+                doc_id=context.job_id,
             )
-            self.logger.info(f"Screening stored in Firestore with ID: {id}")
+            logger.info(f"Screening stored in Firestore with ID: {id}")
         except Exception as e:
             message = f"Error generating summary. Error code: {type(e).__name__}. Error message: {e}"
-            self.logger.error(message, exc_info=True)
+            logger.error(message, exc_info=True)
             return ErrorResponse(message)
         return OKResponse("Success!")
 
@@ -150,4 +193,8 @@ if __name__ == "__main__":
         "applicantId": "3zJYpyzSOYHjrg2wKTf1",
     }
     summarize = Summarize()
-    asyncio.run(summarize.handle_request(request_json))
+    asyncio.run(
+        summarize.handle_request(
+            request_json, RequestContext(request_json).bind(summarize.logger)
+        )
+    )
@@ -0,0 +1,279 @@
+#! /usr/bin/env python3.11
+
+# ==========================================================================
+#  Copyright (c) Orison AI, 2024.
+#
+#  All rights reserved. All hardware and software names used are registered
+#  trade names and/or registered trademarks of the respective manufacturers.
+#
+#  The user of this computer program acknowledges that the above copyright
+#  notice, which constitutes the Universal Copyright Convention, will be
+#  attached at the position in the function of the computer program which the
+#  author has deemed to sufficiently express the reservation of copyright.
+#  It is prohibited for customers, users and/or third parties to remove,
+#  modify or move this copyright notice.
+# ==========================================================================
+
+# External
+
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Internal
+
+from metrics import SPAN_SECONDS
+
+logging.basicConfig(level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+# none: spans only feed the request summaries
+# console: every finished span is written to stdout as a JSON line
+# otel: spans are mirrored to the OpenTelemetry tracer provider, needs opentelemetry-api
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+# Log one structured summary line per request
+TRACE_SUMMARY = os.getenv("TRACE_SUMMARY", "true").lower() == "true"
+
+# Attributes spans take over from their parent unless they set them
+INHERITED_ATTRIBUTES = ("request.type", "applicant.id")
+
+STATUS_UNSET = "UNSET"
+STATUS_OK = "OK"
+STATUS_ERROR = "ERROR"
+
+
+class Span:
+    """
+    Timed operation of a request. Mirrors the fields of an OpenTelemetry
+    span, ids are hex strings and times nanoseconds since the epoch.
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = {
+            key: parent.attributes[key]
+            for key in INHERITED_ATTRIBUTES
+            if parent and key in parent.attributes
+        }
+        self.attributes.update(
+            {key: value for key, value in attributes.items() if value is not None}
+        )
+        self.status = STATUS_UNSET
+        self.start_time = time.time_ns()
+        self.end_time = None
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self._native = None
+
+    def set_attribute(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+            if self._native is not None:
+                self._native.set_attribute(key, value)
+
+    def end(self, error: Optional[BaseException] = None):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000.0
+        self.end_time = time.time_ns()
+        if error is not None:
+            self.status = STATUS_ERROR
+            self.attributes["error.type"] = type(error).__name__
+        elif self.status == STATUS_UNSET:
+            self.status = STATUS_OK
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "context": {"trace_id": self.trace_id, "span_id": self.span_id},
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    # Receives every span when it starts and when it ends. Exports nothing.
+
+    def start(self, span: Span, parent: Optional[Span]):
+        pass
+
+    def end(self, span: Span):
+        pass
+
+
+class ConsoleSpanExporter(SpanExporter):
+    def end(self, span: Span):
+        sys.stdout.write(json.dumps(span.to_dict(), default=str) + "\n")
+        sys.stdout.flush()
+
+
+class OpenTelemetrySpanExporter(SpanExporter):
+    """
+    Mirrors the spans to the tracer of the configured OpenTelemetry tracer
+    provider, which exports them with the processors set up at startup.
+    """
+
+    def __init__(self):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self._tracer = trace.get_tracer("orison_ai.gateway")
+
+    def start(self, span: Span, parent: Optional[Span]):
+        context = None
+        if parent is not None and parent._native is not None:
+            context = self._trace.set_span_in_context(parent._native)
+        span._native = self._tracer.start_span(
+            span.name,
+            context=context,
+            attributes=span.attributes,
+            start_time=span.start_time,
+        )
+        # Log lines and summaries carry the ids the backend shows
+        native_context = span._native.get_span_context()
+        span.trace_id = format(native_context.trace_id, "032x")
+        span.span_id = format(native_context.span_id, "016x")
+
+    def end(self, span: Span):
+        native = span._native
+        native.set_attributes(span.attributes)
+        if span.status == STATUS_ERROR:
+            native.set_status(self._trace.Status(self._trace.StatusCode.ERROR))
+        native.end(end_time=span.end_time)
+
+
+class _Trace:
+    # Durations of the finished spans of one request by span name
+
+    def __init__(self):
+        self.stages: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            stage = self.stages.setdefault(span.name, [0, 0.0, 0.0])
+            stage[0] += 1
+            stage[1] += span.duration_ms
+            stage[2] = max(stage[2], span.duration_ms)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "total_ms": round(total, 2),
+                    "max_ms": round(longest, 2),
+                }
+                for name, (count, total, longest) in sorted(
+                    self.stages.items(), key=lambda item: -item[1][1]
+                )
+            }
+
+
+_exporter: Optional[SpanExporter] = None
+_exporter_lock = threading.Lock()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar("current_trace", default=None)
+
+
+def get_span_exporter() -> SpanExporter:
+    global _exporter
+
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                match TRACE_EXPORTER:
+                    case "console":
+                        _exporter = ConsoleSpanExporter()
+                    case "otel":
+                        _exporter = OpenTelemetrySpanExporter()
+                    case _:
+                        _exporter = SpanExporter()
+    return _exporter
+
+
+def set_span_exporter(exporter: Optional[SpanExporter]):
+    # Replaces the exporter chosen with TRACE_EXPORTER. None restores it.
+    global _exporter
+
+    _exporter = exporter
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, attributes: Optional[dict] = None):
+    """
+    Times the enclosed block as a child of the current span. Works in sync
+    and async code, tasks and threads started with asyncio.to_thread inherit
+    the current span.
+    :param name: Operation name, spans of the same name are summed up in the request summary
+    :param attributes: Span attributes, None values are dropped
+    """
+    parent = _current_span.get()
+    current = Span(name, parent, attributes or {})
+    exporter = get_span_exporter()
+    exporter.start(current, parent)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end(error)
+        exporter.end(current)
+        SPAN_SECONDS.observe(current.duration_ms / 1000.0, name)
+        trace = _current_trace.get()
+        if trace is not None and parent is not None:
+            trace.add(current)
+
+
+@contextmanager
+def trace_request(name: str, attributes: Optional[dict] = None):
+    """
+    Root span of a gateway request or job. When it ends the time spent in
+    each operation of the request is logged as one JSON line.
+    """
+    trace = _Trace()
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    root = None
+    try:
+        with span(name, attributes) as root:
+            yield root
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if TRACE_SUMMARY and root is not None:
+            _logger.info(
+                json.dumps(
+                    {
+                        "event": "request_summary",
+                        "name": root.name,
+                        "trace_id": root.trace_id,
+                        "status": root.status,
+                        "duration_ms": round(root.duration_ms, 2),
+                        "attributes": root.attributes,
+                        "stages": trace.summary(),
+                    },
+                    default=str,
+                )
+            )
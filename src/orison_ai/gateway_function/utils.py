@@ -17,8 +17,11 @@
 import time
 import os
 import asyncio
+import threading
 from asyncio.locks import Event
-from typing import Callable, Any
+from typing import Callable, Any, Coroutine
+
+from metrics import RATE_LIMITER_WAIT_SECONDS
 
 OPENAI_SLEEP = 0.15  # Time to sleep between OpenAI requests
 
@@ -28,6 +31,42 @@ def file_extension(file_path: str) -> str:
     return os.path.splitext(file_path)[1].lower()
 
 
+def percentile(values: list, q: float) -> float:
+    # Nearest-rank percentile. q is in [0, 100].
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(q / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+_background_loop = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop running forever in a daemon thread. Clients bound to a loop,
+    like the async Firestore client, stay usable across requests.
+    """
+    global _background_loop
+
+    if _background_loop is None or _background_loop.is_closed():
+        with _background_loop_lock:
+            if _background_loop is None or _background_loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="gateway-event-loop", daemon=True
+                ).start()
+                _background_loop = loop
+    return _background_loop
+
+
+def run_in_background_loop(coroutine: Coroutine) -> Any:
+    # Blocking equivalent of asyncio.run on the long-lived background loop
+    return asyncio.run_coroutine_threadsafe(coroutine, get_background_loop()).result()
+
+
 def raise_and_log_error(message: str, logger, exception=Exception):
     logger.error(message)
     raise exception(message)
@@ -79,6 +118,7 @@ class ThrottleRequest:
             time_elapsed = start_time - ThrottleRequest.register_last
             if time_elapsed <= OPENAI_SLEEP:
                 time.sleep(OPENAI_SLEEP - time_elapsed)
+            RATE_LIMITER_WAIT_SECONDS.observe(time.time() - start_time, "throttle")
         ThrottleRequest.clear_and_log(fn.__name__)
         try:
             result = fn(*args, **kwargs)
@@ -98,6 +138,7 @@ class ThrottleRequest:
             future = asyncio.coroutine(future)
 
         if ThrottleRequest.register_last is not None:
+            start_time = time.time()
             # Wait for event to clear
             await ThrottleRequest.throttle_lock.wait()
             # Calculate the time since the last call
@@ -105,6 +146,7 @@ class ThrottleRequest:
             # If the time since the last call is less than the limit, wait for the remaining time
             if time_elapsed <= OPENAI_SLEEP:
                 await asyncio.sleep(OPENAI_SLEEP - time_elapsed)
+            RATE_LIMITER_WAIT_SECONDS.observe(time.time() - start_time, "throttle")
 
         ThrottleRequest.clear_and_log(future.__name__)
         try:
@@ -19,6 +19,7 @@
 import os
 import logging
 import asyncio
+import tempfile
 from langchain_community.document_loaders import (
     PyPDFLoader,
     CSVLoader,
@@ -48,17 +49,16 @@ from request_handler import RequestHandler, OKResponse, ErrorResponse
 from or_store.firebase_storage import FirebaseStorage
 from or_store.firebase import FireStoreDB
 from utils import raise_and_log_error, file_extension
-from or_store.firebase import OrisonSecrets
 from or_llm.orison_messenger import OrisonMessenger
+from jobs import report_progress
+from request_context import RequestContext
+from tracing import span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 class VectorizeFiles(RequestHandler):
-    orison_messenger = None
-    embedding_client = None
-    async_db_client = None
     MIN_TOKEN_SIZE = 144
     CHUNK_SIZE = 512
     CHUNK_OVERLAP = 50
@@ -66,14 +66,6 @@ class VectorizeFiles(RequestHandler):
     def __init__(self):
         super().__init__(str(self.__class__.__qualname__))
 
-    @staticmethod
-    def _orison_messenger(secrets):
-        VectorizeFiles.orison_messenger = OrisonMessenger(secrets=secrets)
-        VectorizeFiles.embedding_client = VectorizeFiles.orison_messenger._embeddings
-        VectorizeFiles.async_db_client = (
-            VectorizeFiles.orison_messenger.async_qdrant_client
-        )
-
     @staticmethod
     def _file_path_builder(
         attorney_id: str, applicant_id: str, bucket_name: str, file_path: str
@@ -158,12 +150,16 @@ class VectorizeFiles(RequestHandler):
         return documents
 
     @staticmethod
-    async def _vectorize(documents, tag, collection_name, filename, logger):
-        async_db_client = VectorizeFiles.async_db_client
-        embedding_client = VectorizeFiles.embedding_client
+    async def _vectorize(
+        documents, tag, collection_name, filename, logger, messenger: OrisonMessenger
+    ):
+        async_db_client = messenger.async_qdrant_client
+        embedding_client = messenger._embeddings
 
         # Ensure the vector DB collection exists
-        sample_embedding = embedding_client.embed_query("Sample for vector size")
+        sample_embedding = await asyncio.to_thread(
+            embedding_client.embed_query, "Sample for vector size"
+        )
         collection_exists = await async_db_client.collection_exists(
             collection_name=collection_name
         )
@@ -251,22 +247,25 @@ class VectorizeFiles(RequestHandler):
 
         if merged_chunks:
             logger.info(f"Storing {len(merged_chunks)} filtered chunks in vector DB.")
-            embeddings = await VectorizeFiles.embedding_client.aembed_documents(
+            embeddings = await embedding_client.aembed_documents(
                 texts=texts,
                 chunk_size=len(sample_embedding),
             )
             # Upload vectors to vector database
             logger.info("Uploading vectors")
-            async_db_client.upload_collection(
-                collection_name=collection_name,
-                vectors=np.array(embeddings),
-                payload=payloads,
-                parallel=1,
-                ids=None,  # Generate IDs automatically
-            )
+            with span("qdrant.upsert", {"qdrant.points": len(payloads)}):
+                # upload_collection blocks even on the async client
+                await asyncio.to_thread(
+                    async_db_client.upload_collection,
+                    collection_name=collection_name,
+                    vectors=np.array(embeddings),
+                    payload=payloads,
+                    parallel=1,
+                    ids=None,  # Generate IDs automatically
+                )
             logger.info("Uploading vectors....DONE")
 
-    async def handle_request(self, request_json):
+    async def handle_request(self, request_json, context: RequestContext):
         """
         Handle the request to vectorize the files.
         1. Download the file from Firebase Storage
@@ -276,67 +275,86 @@ class VectorizeFiles(RequestHandler):
         5. Update the applicant document in Firestore
 
         :param request_json: The request JSON
+        :param context: The request context
         :return: OKResponse if successful, ErrorResponse if not
         """
+        logger = context.logger
         try:
             client = FireStoreDB()
             attorney_id = request_json["attorneyId"]
             applicant_id = request_json["applicantId"]
             file_id = request_json["fileId"]
             tag = request_json["tag"]
-            await client.update_collection_document(
-                collection_name="applicants",
-                document_name=applicant_id,
-                field="vectorize_in_progress",
-                value=file_id,
-            )
-            secrets = OrisonSecrets.from_attorney_applicant(attorney_id, applicant_id)
-            VectorizeFiles._orison_messenger(secrets)
-            self.logger.info(
-                f"Processing file for attorney {attorney_id} and applicant {applicant_id}"
-            )
-            # ToDo: Currently supporting only one file.
-            # We should make multiple calls from the frontend instead for scalability
-            # Download the file
-            bucket_file_path = VectorizeFiles._file_path_builder(
-                attorney_id, applicant_id, tag, file_id
-            )
-            local_file_path = (
-                f"/tmp/to_be_processed" + file_extension(bucket_file_path).lower()
-            )
-            self.logger.info(f"Remote File path: {bucket_file_path}")
-            self.logger.info(f"Local File path: {local_file_path}")
-            await VectorizeFiles._download_file(
-                bucket_file_path, local_file_path, logger=self.logger
-            )
-
-            # Load the file
-            documents = VectorizeFiles._load_file(
-                local_file_path, logger=self.logger, filename=file_id
-            )
-            await VectorizeFiles._vectorize(
-                documents=documents,
-                collection_name=secrets.collection_name,
-                logger=self.logger,
-                tag=tag,
-                filename=file_id,
-            )
-            await client.update_collection_document(
-                collection_name="applicants",
-                document_name=applicant_id,
-                field="vectorized_files",
-                value=file_id,
-            )
         except Exception as e:
-            self.logger.error(f"Error processing files: {e}")
+            logger.error(f"Error processing files: {e}")
             return ErrorResponse(str(e))
-        finally:
-            await client.remove_value_from_field(
-                collection_name="applicants",
-                document_name=applicant_id,
-                field="vectorize_in_progress",
-                value=file_id,
-            )
+
+        # Status updates of the applicant document are coalesced into as few writes as possible
+        async with client.coalesce_writes() as status_writes:
+            try:
+                await client.update_collection_document(
+                    collection_name="applicants",
+                    document_name=applicant_id,
+                    field="vectorize_in_progress",
+                    value=file_id,
+                )
+                # The frontend shows the in-progress marker while the file is processed
+                await status_writes.flush()
+                secrets = context.secrets
+                logger.info(
+                    f"Processing file for attorney {attorney_id} and applicant {applicant_id}"
+                )
+                # ToDo: Currently supporting only one file.
+                # We should make multiple calls from the frontend instead for scalability
+                # Download the file
+                bucket_file_path = VectorizeFiles._file_path_builder(
+                    attorney_id, applicant_id, tag, file_id
+                )
+                logger.info(f"Remote File path: {bucket_file_path}")
+                # Every request downloads to its own file, requests run concurrently
+                with tempfile.NamedTemporaryFile(
+                    suffix=file_extension(bucket_file_path).lower()
+                ) as local_file:
+                    logger.info(f"Local File path: {local_file.name}")
+                    report_progress("downloading")
+                    await VectorizeFiles._download_file(
+                        bucket_file_path, local_file.name, logger=logger
+                    )
+
+                    # Load the file
+                    report_progress("loading")
+                    # Parsing blocks for seconds, keep it off the shared loop
+                    documents = await asyncio.to_thread(
+                        VectorizeFiles._load_file,
+                        local_file.name,
+                        logger=logger,
+                        filename=file_id,
+                    )
+                report_progress("vectorizing")
+                await VectorizeFiles._vectorize(
+                    documents=documents,
+                    collection_name=secrets.collection_name,
+                    logger=logger,
+                    tag=tag,
+                    filename=file_id,
+                    messenger=context.messenger,
+                )
+                await client.update_collection_document(
+                    collection_name="applicants",
+                    document_name=applicant_id,
+                    field="vectorized_files",
+                    value=file_id,
+                )
+            except Exception as e:
+                logger.error(f"Error processing files: {e}")
+                return ErrorResponse(str(e))
+            finally:
+                await client.remove_value_from_field(
+                    collection_name="applicants",
+                    document_name=applicant_id,
+                    field="vectorize_in_progress",
+                    value=file_id,
+                )
         return OKResponse("Success!")
 
 
@@ -371,28 +389,29 @@ class DeleteFileVectors(RequestHandler):
         logger.info(
             f"Deleting vectors for file {file_name} in collection {collection_name}"
         )
-        await async_db_client.delete(
-            collection_name=collection_name, points_selector=points_selector
-        )
+        with span("qdrant.delete"):
+            await async_db_client.delete(
+                collection_name=collection_name, points_selector=points_selector
+            )
 
-    async def handle_request(self, request_json):
+    async def handle_request(self, request_json, context: RequestContext):
+        logger = context.logger
         try:
             client = FireStoreDB()
             attorney_id = request_json["attorneyId"]
             applicant_id = request_json["applicantId"]
             file_id = request_json["fileId"]
             tag = request_json["tag"]
-            secrets = OrisonSecrets.from_attorney_applicant(attorney_id, applicant_id)
-            self.logger.info(
+            secrets = context.secrets
+            logger.info(
                 f"Processing delete file vectors for attorney {attorney_id}, applicant {applicant_id}, and file: {file_id}"
             )
-            VectorizeFiles._orison_messenger(secrets)
             await DeleteFileVectors._delete_vectors(
-                async_db_client=VectorizeFiles.async_db_client,
+                async_db_client=context.qdrant,
                 collection_name=secrets.collection_name,
                 file_name=file_id,
                 tag=tag,
-                logger=self.logger,
+                logger=logger,
             )
             await client.remove_value_from_field(
                 collection_name="applicants",
@@ -401,7 +420,7 @@ class DeleteFileVectors(RequestHandler):
                 value=file_id,
             )
         except Exception as e:
-            self.logger.error(f"Error deleting file vectors: {e}")
+            logger.error(f"Error deleting file vectors: {e}")
             return ErrorResponse(str(e))
 
         return OKResponse("Success!")
@@ -412,8 +431,10 @@ if __name__ == "__main__":
 
     start_time = time.time()
     vectorizer = VectorizeFiles()
-    secrets = OrisonSecrets.from_attorney_applicant("test_attorney", "test_applicant")
-    VectorizeFiles._orison_messenger(secrets)
+    context = RequestContext(
+        {"attorneyId": "test_attorney", "applicantId": "test_applicant"}
+    )
+    secrets = context.secrets
     current_dir = os.path.dirname(__file__)
     template_file_path = os.path.join(current_dir, "templates", "test_vectorize.txt")
     documents = VectorizeFiles._load_file(
@@ -421,23 +442,26 @@ if __name__ == "__main__":
     )
 
     async def test_vectorization():
+        # The pooled messenger is bound to the running loop
+        messenger = context.messenger
         await VectorizeFiles._vectorize(
             documents=documents,
             collection_name=secrets.collection_name,
             logger=logger,
             tag="test",
             filename="test_vectorize.txt",
+            messenger=messenger,
         )
 
         await DeleteFileVectors._delete_vectors(
-            async_db_client=VectorizeFiles.async_db_client,
+            async_db_client=messenger.async_qdrant_client,
             collection_name=secrets.collection_name,
             file_name="test_vectorize.txt",
             tag="test",
             logger=logger,
         )
 
-        await VectorizeFiles.async_db_client.delete_collection(
+        await messenger.async_qdrant_client.delete_collection(
             collection_name=secrets.collection_name
         )
 